@@ -0,0 +1,1001 @@
+# benchmarks.py
+#quick timing scripts for the engine hot paths, run with: python benchmarks.py [name]
+#correctness checks live in tests/, run with: python -m pytest tests
+
+import os
+import sys
+import time
+
+
+def _rate(fn, count, repeats=3):
+    #best of a few runs, in calls per second
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return count / best
+
+
+def _original_chunk(generator, chunk_key):
+    #the per-sample loop UnderwaterTerrain.generate_chunk started out as, fringe circles from the global random
+    #module and a list of dicts per chunk. it's the baseline the speedups are reported against
+    import math
+    import random
+    from noise import snoise2
+
+    features = []
+    chunk_x, chunk_y = chunk_key
+    noise_offset = 10_000_000
+    for x in range(chunk_x, chunk_x + generator.chunk_size, 20):
+        for y in range(chunk_y, chunk_y + generator.chunk_size, 20):
+            if y < 250:
+                continue
+            nx = (x + noise_offset) / generator.scale
+            ny = (y + noise_offset) / generator.scale
+            noise_value = snoise2(nx, ny, octaves=4, base=generator.seed)
+            if noise_value > generator.threshold:
+                main_radius = generator.amplitude // 10
+                fringe_circles = []
+                for angle in range(0, 360, 30):
+                    distance = random.uniform(main_radius * 0.7, main_radius * 1.2)
+                    fringe_radius = random.randint(main_radius // 2, main_radius * 3 // 4)
+                    offset_x = int(distance * math.cos(math.radians(angle)))
+                    offset_y = int(distance * math.sin(math.radians(angle)))
+                    fringe_circles.append((x + offset_x, y + offset_y, fringe_radius))
+                features.append({"main": (x, y, main_radius), "fringe": fringe_circles})
+    return features
+
+
+def bench_chunk_generation():
+    from underwater_terrain import ChunkGenerator
+
+    terrain = ChunkGenerator(scale=1000, threshold=0.4, amplitude=150, chunk_size=800, seed=42)
+
+    #a band of chunks below the surface, where the terrain actually is
+    keys = [(x * 800, y * 800) for x in range(-10, 10) for y in range(0, 10)]
+
+    def original():
+        for key in keys:
+            _original_chunk(terrain, key)
+
+    def scalar():
+        for key in keys:
+            terrain.generate_chunk_scalar(key)
+
+    def batched_single():
+        for key in keys:
+            terrain.generate_chunk_batched(key)
+
+    def batched(size):
+        def run():
+            for i in range(0, len(keys), size):
+                terrain.generate_chunks_batched(keys[i:i + size])
+        return run
+
+    def arrays_only():
+        for i in range(0, len(keys), 8):
+            terrain.generate_feature_arrays(keys[i:i + 8])
+
+    original_rate = _rate(original, len(keys))
+    print(f"chunk generation, {len(keys)} chunks, speedup vs the original random loop")
+    print(f"  original (random)      {original_rate:8.1f} chunks/s")
+    for name, fn in (
+        ("scalar, hashed", scalar),
+        ("batched, 1 per call", batched_single),
+        ("batched, 8 per call", batched(8)),
+        ("feature arrays, 8/call", arrays_only),
+    ):
+        rate = _rate(fn, len(keys))
+        print(f"  {name:<22} {rate:8.1f} chunks/s  ({rate / original_rate:.1f}x)")
+
+
+def bench_chunk_backends():
+    #how long each backend takes to fill a batch of chunks, and how much a busy "frame" on the
+    #main thread slows down while it runs
+    from underwater_terrain import ChunkGenerator
+    from chunk_workers import create_backend
+
+    keys = [(x * 800, y * 800) for x in range(-8, 8) for y in range(0, 8)]
+    wanted = {key: i for i, key in enumerate(keys)}
+
+    def frame_work():
+        total = 0
+        for i in range(20000):
+            total += i * i
+        return total
+
+    start = time.perf_counter()
+    for _ in range(20):
+        frame_work()
+    idle_frame = (time.perf_counter() - start) / 20
+
+    print(f"chunk backends, {len(keys)} chunks, idle frame {idle_frame * 1000:.2f} ms")
+    for batched in (False, True):
+        generator = ChunkGenerator(scale=1000, threshold=0.4, amplitude=150, chunk_size=800, seed=42, batched=batched)
+        for name in ("thread", "process"):
+            backend = create_backend(name, generator.generate_chunks)
+            #let the pool spin up before timing
+            backend.schedule({keys[0]: 0})
+            while not backend.poll():
+                time.sleep(0.001)
+
+            done = 0
+            frames = 0
+            frame_time = 0.0
+            start = time.perf_counter()
+            backend.schedule(wanted)
+            while done < len(keys) - 1:
+                frame_start = time.perf_counter()
+                frame_work()
+                frame_time += time.perf_counter() - frame_start
+                frames += 1
+                done += len(backend.poll())
+            elapsed = time.perf_counter() - start
+            backend.shutdown()
+
+            label = f"{'batched' if batched else 'scalar'}, {name}"
+            print(f"  {label:<17} {len(keys) / elapsed:8.1f} chunks/s  frame {frame_time / frames * 1000:.2f} ms")
+
+
+def bench_chunk_store():
+    #reading chunks back from the on-disk store vs generating them
+    import tempfile
+    from underwater_terrain import ChunkGenerator
+    from chunk_store import ChunkStore
+
+    generator = ChunkGenerator(scale=1000, threshold=0.4, amplitude=150, chunk_size=800, seed=42)
+    keys = [(x * 800, y * 800) for x in range(-10, 10) for y in range(0, 10)]
+
+    with tempfile.TemporaryDirectory() as root:
+        store = ChunkStore(root, generator.params())
+        for key, features in zip(keys, generator.generate_chunks(keys)):
+            store.save(key, features)
+        #time the mmap reads, not the chunks still waiting on the writer thread
+        store.flush()
+
+        def generate():
+            for i in range(0, len(keys), 8):
+                generator.generate_chunks(keys[i:i + 8])
+
+        def load():
+            for key in keys:
+                store.load(key)
+
+        generate_rate = _rate(generate, len(keys))
+        load_rate = _rate(load, len(keys))
+        size = os.path.getsize(store.data_path)
+        store.close()
+
+    print(f"chunk store, {len(keys)} chunks, {size // 1024} KB on disk")
+    print(f"  generate (batched)     {generate_rate:8.1f} chunks/s")
+    print(f"  load (mmap)            {load_rate:8.1f} chunks/s  ({load_rate / generate_rate:.1f}x)")
+
+
+def bench_chunk_memory():
+    #footprint of a big loaded area as feature arrays vs the old dicts of tuples,
+    #plus how fast the collision query runs over it
+    import pygame
+    from underwater_terrain import ChunkGenerator, UnderwaterTerrain
+    from terrain_features import memory_report
+
+    generator = ChunkGenerator(scale=1000, threshold=0.4, amplitude=150, chunk_size=800, seed=42)
+    keys = [(x * 800, y * 800) for x in range(-15, 15) for y in range(0, 15)]
+
+    features = 0
+    array_bytes = 0
+    dict_bytes = 0
+    for i in range(0, len(keys), 8):
+        for chunk in generator.generate_chunks(keys[i:i + 8]):
+            report = memory_report(chunk)
+            features += report["features"]
+            array_bytes += report["array_bytes"]
+            dict_bytes += report["dict_bytes"]
+
+    print(f"chunk memory, {len(keys)} chunks, {features} features")
+    print(f"  arrays                 {array_bytes / 1024:8.1f} KB  ({array_bytes / len(keys):.0f} B/chunk)")
+    print(f"  dicts of tuples        {dict_bytes / 1024:8.1f} KB  ({dict_bytes / array_bytes:.1f}x)")
+
+    terrain = UnderwaterTerrain(scale=1000, threshold=0.4, amplitude=150, chunk_size=800, grid_size=5, seed=42)
+    while True:
+        terrain.update_chunks((0, 1600))
+        if not terrain.missing_chunks:
+            break
+        time.sleep(0.01)
+    rects = [pygame.Rect(x, y, 40, 20) for x in range(-1600, 1600, 97) for y in range(0, 3200, 89)]
+
+    def collide():
+        for rect in rects:
+            terrain.collide_rect(rect)
+
+    rate = _rate(collide, len(rects))
+    terrain.shutdown()
+    print(f"  collide_rect           {rate:8.1f} queries/s")
+
+
+def bench_chunk_prefetch(frames=300, speed=300):
+    #flies the camera diagonally at a debug speed, paced at 60 fps, and counts frames
+    #where a chunk on screen was still missing, with and without the velocity prefetch
+    import pygame
+    from settings import WIDTH, HEIGHT, FPS
+    from underwater_terrain import UnderwaterTerrain
+
+    screen = pygame.Surface((WIDTH, HEIGHT))
+    print(f"chunk prefetch, {frames} frames at {speed} px/frame")
+    for batched in (False, True):
+        for lookahead in (0, 15, 45):
+            terrain = UnderwaterTerrain(scale=1000, threshold=0.4, amplitude=150, chunk_size=800, grid_size=5,
+                                        seed=42, batched=batched, lookahead=lookahead)
+            while terrain.missing_chunks:
+                terrain.update_chunks((0, 0))
+                time.sleep(0.01)
+
+            x, y = 0, 0
+            #slowest update_chunks call, where delivered chunks get baked
+            worst = 0.0
+            for _ in range(frames):
+                frame_start = time.perf_counter()
+                x += speed
+                y += speed // 2
+                terrain.update_chunks((x, y), (speed, speed // 2))
+                worst = max(worst, time.perf_counter() - frame_start)
+                terrain.draw(screen, (x - WIDTH // 2, y - HEIGHT // 2))
+                time.sleep(max(0.0, 1 / FPS - (time.perf_counter() - frame_start)))
+            terrain.shutdown()
+
+            label = f"{'batched' if batched else 'scalar'}, ahead {lookahead}"
+            print(f"  {label:<20} pop-in {terrain.pop_in_frames:4d}/{terrain.frames_drawn} frames"
+                  f"  prefetched {terrain.prefetched}  worst update {worst * 1000:.1f} ms")
+
+    #swimming back and forth over a chunk border, chunks coming back into the grid should reuse their bake
+    terrain = UnderwaterTerrain(scale=1000, threshold=0.4, amplitude=150, chunk_size=800, grid_size=5, seed=42)
+    while terrain.missing_chunks or terrain.unbaked or terrain.baking:
+        terrain.update_chunks((0, 0))
+        time.sleep(0.01)
+    worst = 0.0
+    for crossing in range(10):
+        x = 900 if crossing % 2 == 0 else 100
+        frame_start = time.perf_counter()
+        terrain.update_chunks((x, 400))
+        worst = max(worst, time.perf_counter() - frame_start)
+        while terrain.missing_chunks or terrain.unbaked or terrain.baking:
+            terrain.update_chunks((x, 400))
+            time.sleep(0.01)
+    terrain.shutdown()
+    print(f"  back and forth        worst crossing {worst * 1000:.1f} ms  baked cache {terrain.baked_cache.summary()}")
+
+
+def bench_contour_mode():
+    #circle blobs vs marching squares polygons over the same chunks:
+    #generation rate, primitives per chunk, bake time and overdraw (circle area drawn / pixels covered)
+    import os
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import numpy as np
+    import pygame
+    from underwater_terrain import ChunkGenerator, UnderwaterTerrain
+    from terrain_features import chunk_circles, chunk_loops
+    from geometry import polygon_area
+
+    keys = [(x * 800, y * 800) for x in range(-10, 10) for y in range(0, 10)]
+    print(f"contour mode, {len(keys)} chunks")
+    for mode in ("circles", "contour"):
+        generator = ChunkGenerator(scale=1000, threshold=0.4, amplitude=150, chunk_size=800, seed=42, mode=mode)
+        chunks = []
+
+        def generate():
+            chunks.clear()
+            for i in range(0, len(keys), 8):
+                chunks.extend(generator.generate_chunks(keys[i:i + 8]))
+
+        generate_rate = _rate(generate, len(keys))
+
+        terrain = UnderwaterTerrain.__new__(UnderwaterTerrain)
+        terrain.mode = mode
+        baked = []
+
+        def bake():
+            baked.clear()
+            baked.extend(terrain.bake_chunk(chunk) for chunk in chunks)
+
+        bake_rate = _rate(bake, len(keys))
+
+        covered = 0
+        for entry in baked:
+            if entry is not None:
+                mask = pygame.mask.from_surface(entry[1])
+                covered += mask.count()
+        if mode == "circles":
+            primitives = sum(len(chunk) * 13 for chunk in chunks)
+            drawn = sum(float((np.pi * chunk_circles(chunk)[:, 2].astype(np.float64) ** 2).sum()) for chunk in chunks)
+            detail = f"{primitives / len(keys):6.1f} circles/chunk, overdraw {drawn / covered:.1f}x"
+        else:
+            vertices = sum(len(chunk) for chunk in chunks)
+            loops = sum(len(np.unique(chunk["loop"])) for chunk in chunks)
+            drawn = sum(abs(polygon_area(points)) for chunk in chunks for points in chunk_loops(chunk))
+            detail = f"{loops / len(keys):6.1f} polygons/chunk ({vertices / len(keys):.0f} verts), overdraw {drawn / covered:.1f}x"
+        print(f"  {mode:<8} gen {generate_rate:7.1f} chunks/s  bake {bake_rate:7.1f} chunks/s  {detail}")
+
+
+def bench_seabed_heights(frames=600, speed=5):
+    #seabed heights for a camera scrolling right at sub speed: a pnoise1 call per screen column
+    #every frame (the old draw loop) vs the cached heightfield
+    from settings import WIDTH
+    from seabed_generator import SeabedGenerator
+
+    seabed = SeabedGenerator(scale=600, amplitude=1000, base_level=3000)
+
+    def per_column():
+        for frame in range(frames):
+            start_x = frame * speed
+            [seabed.get_height(x) for x in range(start_x, start_x + WIDTH)]
+
+    def heightfield():
+        seabed.heightfield.invalidate()
+        for frame in range(frames):
+            start_x = frame * speed
+            seabed.heightfield.span(start_x, start_x + WIDTH)
+
+    old_rate = _rate(per_column, frames, repeats=1)
+    computed = seabed.heightfield.computed
+    new_rate = _rate(heightfield, frames)
+    computed = (seabed.heightfield.computed - computed) // 3
+
+    print(f"seabed heights, {frames} frames at {speed} px/frame")
+    print(f"  per column pnoise1     {old_rate:8.1f} frames/s  {WIDTH} noise calls/frame")
+    print(f"  heightfield            {new_rate:8.1f} frames/s  {computed / frames:.1f} columns/frame ({new_rate / old_rate:.0f}x)")
+
+
+def bench_low_points(frames=600, speed=5):
+    #low point markers per frame: the old full rescan (21 get_height calls per candidate) vs the index
+    from settings import WIDTH
+    from seabed_generator import SeabedGenerator
+
+    seabed = SeabedGenerator(scale=600, amplitude=1000, base_level=3000)
+    check_range = 10
+
+    def rescan():
+        for frame in range(frames):
+            start_x = frame * speed
+            low_points = []
+            for x in range(start_x + check_range, start_x + WIDTH - check_range, check_range):
+                current = seabed.get_height(x)
+                neighbours = [seabed.get_height(x + o) for o in range(-check_range, check_range + 1) if o != 0]
+                if sum(neighbours) / len(neighbours) - current > 50:
+                    low_points.append((x, current))
+
+    def index():
+        for frame in range(frames):
+            start_x = frame * speed
+            seabed.heightfield.span(start_x, start_x + WIDTH)
+            seabed.find_low_points(start_x, start_x + WIDTH)
+
+    old_rate = _rate(rescan, frames, repeats=1)
+    new_rate = _rate(index, frames)
+    print(f"low points, {frames} frames at {speed} px/frame")
+    print(f"  rescan every frame     {old_rate:8.1f} frames/s")
+    print(f"  low point index        {new_rate:8.1f} frames/s  ({new_rate / old_rate:.0f}x)")
+
+
+def bench_floor_queries(count=20000):
+    #floor height under the sub: max over a rebuilt screen-wide points list vs a segment tree query
+    from settings import WIDTH
+    from seabed_generator import SeabedGenerator
+
+    seabed = SeabedGenerator(scale=600, amplitude=1000, base_level=3000)
+    #the old (x, height) list the sub used to scan, built once from the heightfield
+    points = list(zip(range(WIDTH), seabed.heightfield.span(0, WIDTH).tolist()))
+
+    def points_max():
+        for i in range(count):
+            max([height for _, height in points])
+
+    def floor_under():
+        for i in range(count):
+            x = i % (WIDTH - 50)
+            seabed.floor_under(x, x + 50)
+
+    old_rate = _rate(points_max, count)
+    new_rate = _rate(floor_under, count)
+    print(f"floor queries, {count} queries")
+    print(f"  max over points        {old_rate:10.1f} queries/s")
+    print(f"  floor_under            {new_rate:10.1f} queries/s  ({new_rate / old_rate:.0f}x)")
+
+
+def bench_seabed_lod(frames=300, speed=5):
+    #seabed fill with one vertex per column vs the cached rdp outline: vertices, fill time, pixels changed
+    import numpy as np
+    import pygame
+    from settings import WIDTH, HEIGHT
+    from seabed_generator import SeabedGenerator
+
+    screen = pygame.Surface((WIDTH, HEIGHT))
+    results = {}
+    print(f"seabed lod, {frames} frames at {speed} px/frame (ms is the whole seabed draw)")
+    for label, tolerance in (("per column", None), ("lod 1px", 1.0), ("lod 3px", 3.0)):
+        seabed = SeabedGenerator(scale=600, amplitude=1000, base_level=3000, lod_tolerance=tolerance)
+        vertices = 0
+        frames_out = []
+        start = time.perf_counter()
+        for frame in range(frames):
+            start_x = frame * speed
+            offset = (start_x, seabed.get_height(start_x + WIDTH // 2) - HEIGHT // 2)
+            screen.fill((0, 0, 0))
+            #full redraw every frame, so fill_vertices is the whole polygon
+            seabed.reset_layer()
+            seabed.draw(screen, offset, cell_size=8)
+            vertices += seabed.fill_vertices
+            if frame % 30 == 0:
+                frames_out.append(pygame.surfarray.array3d(screen).sum(-1) > 0)
+        elapsed = time.perf_counter() - start
+        results[label] = frames_out
+        diff = sum(int((a != b).sum()) for a, b in zip(frames_out, results["per column"]))
+        print(f"  {label:<12} {vertices / frames:6.1f} verts  {elapsed / frames * 1000:6.3f} ms/frame"
+              f"  {diff / len(frames_out):7.1f} px differ/frame")
+
+
+def bench_seabed_layer(frames=600, speed=5):
+    #seabed draw with the layer scrolled and only the exposed strips filled vs a full redraw every frame
+    #(reset_layer), camera moving diagonally at sub speed near the floor
+    import numpy as np
+    import pygame
+    from settings import WIDTH, HEIGHT
+    from seabed_generator import SeabedGenerator
+
+    screen = pygame.Surface((WIDTH, HEIGHT))
+    print(f"seabed layer, {frames} frames at {speed} px/frame")
+    for label, full in (("full redraw", True), ("scroll + strips", False)):
+        seabed = SeabedGenerator(scale=600, amplitude=1000, base_level=3000)
+        offsets = []
+        for frame in range(frames):
+            start_x = frame * speed
+            offsets.append((start_x, seabed.get_height(start_x) - HEIGHT // 2 + frame % 120))
+
+        def run():
+            seabed.reset_layer()
+            for offset in offsets:
+                if full:
+                    seabed.reset_layer()
+                seabed.draw(screen, offset, cell_size=8)
+
+        rate = _rate(run, frames)
+        print(f"  {label:<16} {1000 / rate:6.3f} ms/frame")
+
+
+def bench_cave_automaton():
+    #cave init + 3 smoothing passes, list of lists vs the numpy backend
+    from cave_generator import CaveGenerator
+
+    print("cave automaton, init + 3 smoothing passes")
+    for size in (50, 200, 500):
+        rates = {}
+        for backend in ("python", "numpy"):
+            if backend == "python" and size > 200:
+                continue
+
+            def run():
+                cave = CaveGenerator(size, size, fill_percentage=45, smooth_iterations=3, seed=1, backend=backend)
+                cave.initialize_grid()
+                cave.smooth_cave()
+
+            rates[backend] = _rate(run, 1, repeats=1 if backend == "python" else 3)
+        line = f"  {f'{size}x{size}':<8} numpy {1000 / rates['numpy']:8.2f} ms"
+        if "python" in rates:
+            line += f"  python {1000 / rates['python']:8.1f} ms  ({rates['numpy'] / rates['python']:.0f}x)"
+        print(line)
+
+
+def bench_cave_draw(frames=60):
+    #drawing a 100x100 cave at cell size 8, per-cell rects vs the baked surface
+    import pygame
+    from settings import WIDTH, HEIGHT
+    from cave_generator import CaveGenerator
+
+    screen = pygame.Surface((WIDTH, HEIGHT))
+    cave = CaveGenerator(100, 100, fill_percentage=45, smooth_iterations=3, seed=1)
+    cave.initialize_grid()
+    cave.smooth_cave()
+    #drifting across the screen, partly off it some of the time
+    offsets = [(frame % 40 - 30, frame % 25 - 15) for frame in range(frames)]
+    print(f"cave draw, 100x100 cells at cell size 8, {frames} frames")
+    rates = {}
+    for label, draw in (("per-cell rects", cave.draw_cells), ("baked blit", cave.draw)):
+
+        def run():
+            for offset in offsets:
+                draw(screen, 8, offset)
+
+        rates[label] = _rate(run, frames)
+        print(f"  {label:<16} {1000 / rates[label]:7.3f} ms/frame")
+    print(f"  speedup {rates['baked blit'] / rates['per-cell rects']:.0f}x")
+
+
+def bench_cave_streaming(frames=600, speed=20):
+    #camera scrolling right at speed px/frame: worst frame when each chunk's caves are made on the spot
+    #vs update_caves handing them to the background thread
+    import time
+    from seabed_generator import SeabedGenerator
+
+    print(f"cave streaming, {frames} frames at {speed} px/frame")
+    #tiled caves, same as in game
+    seabed = SeabedGenerator(scale=600, amplitude=1000, base_level=3000, tiled_caves=True)
+    generator = seabed.cave_generator
+    for label in ("inline", "background"):
+        worst = 0.0
+        total = 0.0
+        made = set()
+        for frame in range(frames):
+            camera_x = 100000 * (label == "background") + frame * speed
+            start = time.perf_counter()
+            if label == "inline":
+                chunk_key = int(camera_x // generator.chunk_width)
+                for key in range(chunk_key - 2, chunk_key + 3):
+                    if key not in made:
+                        made.add(key)
+                        generator.generate_chunk(key)
+            else:
+                seabed.update_caves(camera_x)
+            elapsed = time.perf_counter() - start
+            worst = max(worst, elapsed)
+            total += elapsed
+            #rest of the frame, the background thread gets its turn here
+            time.sleep(0.002)
+        print(f"  {label:<12} avg {1000 * total / frames:6.3f} ms  worst {1000 * worst:6.2f} ms")
+    print(f"  {seabed.cave_summary()}")
+    seabed.shutdown()
+
+
+def bench_cave_tiles(tile_size=64):
+    #tiled automaton: cost per tile as the covered area grows, then the seabed's cave chunks with and without it
+    from cave_generator import CaveTiles
+
+    tiles = CaveTiles(tile_size=tile_size, seed=1)
+    print(f"cave tiles, {tile_size}x{tile_size} cells, 3 smoothing passes")
+    for side in (2, 4, 8):
+        keys = [(tx, ty) for ty in range(side) for tx in range(side)]
+        rate = _rate(lambda: tiles.generate_tiles(keys), len(keys))
+        print(f"  {side}x{side} tiles   {1000 / rate:6.3f} ms/tile")
+
+    #the seabed's cave chunks with and without cutting caves out of the tiled automaton
+    from seabed_generator import CaveChunkGenerator
+    chunk_keys = list(range(40))
+    for tiled in (False, True):
+        generator = CaveChunkGenerator(scale=600, amplitude=1000, base_level=3000, seed=42, tiled=tiled)
+        rate = _rate(lambda: generator.generate_chunks(chunk_keys), len(chunk_keys))
+        print(f"  cave chunks, {'tiled' if tiled else 'per cave':<8} {1000 / rate:6.3f} ms/chunk")
+
+
+def bench_cave_regions(caves=40, queries=2000):
+    #analyze() post-pass on 50x50 caves, then nearest open cell lookups: index vs scanning every cave's cells
+    import random
+    import numpy as np
+    from cave_generator import CaveGenerator, OpenCellIndex
+
+    grids = []
+    for seed in range(caves):
+        cave = CaveGenerator(50, 50, fill_percentage=45, smooth_iterations=3, seed=seed)
+        cave.initialize_grid()
+        cave.smooth_cave()
+        grids.append(cave)
+
+    def analyze():
+        for cave in grids:
+            cave.analyze(clearance=(5, 3))
+
+    rate = _rate(analyze, caves, repeats=1)
+    print(f"cave regions, {caves} caves of 50x50")
+    print(f"  analyze          {1000 / rate:7.3f} ms/cave")
+
+    #caves spread along the seabed like the streamed ones
+    placed = [(cave, index * 1500, 3000 + index % 7 * 40) for index, cave in enumerate(grids)]
+    points = np.concatenate([cave.walkable * 8 + (x, y) for cave, x, y in placed])
+    index = OpenCellIndex(points)
+    random.seed(1)
+    targets = [(random.randint(0, caves * 1500), random.randint(2000, 4000)) for _ in range(queries)]
+
+    def scan():
+        for x, y in targets:
+            best = None
+            for cave, cave_x, cave_y in placed:
+                for cell_x, cell_y in cave.walkable.tolist():
+                    distance = (cave_x + cell_x * 8 - x) ** 2 + (cave_y + cell_y * 8 - y) ** 2
+                    if best is None or distance < best:
+                        best = distance
+
+    def lookup():
+        for x, y in targets:
+            index.nearest(x, y)
+
+    scan_rate = _rate(scan, queries, repeats=1)
+    lookup_rate = _rate(lookup, queries)
+    print(f"  nearest, {len(index)} cells")
+    print(f"    scan           {1e6 / scan_rate:9.1f} us/query")
+    print(f"    index          {1e6 / lookup_rate:9.1f} us/query  ({lookup_rate / scan_rate:.0f}x)")
+
+
+def bench_lighting(frames=300):
+    #Lighting.draw at full darkness with the light near the middle of the screen, drifting a little now and then
+    #"new buffer" forgets the shadow every frame, which is what the old draw did (allocate, fill, punch)
+    import random
+    import pygame
+    from settings import WIDTH, HEIGHT
+    from lighting import Lighting
+
+    screen = pygame.Surface((WIDTH, HEIGHT))
+    random.seed(1)
+    positions = []
+    position = (WIDTH // 2, HEIGHT // 2)
+    for _ in range(frames):
+        if random.random() < 0.2:
+            position = (WIDTH // 2 + random.randint(-5, 5), HEIGHT // 2 + random.randint(-5, 5))
+        positions.append(position)
+
+    print(f"lighting, {frames} frames at overlay alpha 255")
+    rates = {}
+    for label, persistent in (("new buffer", False), ("persistent", True)):
+        light = Lighting(300, darkness_factor=2.0)
+
+        def run():
+            for position in positions:
+                if not persistent:
+                    light.shadow = None
+                light.draw(screen, position, overlay_alpha=255)
+
+        rates[label] = _rate(run, frames)
+        print(f"  {label:<12} {1000 / rates[label]:7.3f} ms/frame")
+
+
+def bench_gradient():
+    #spotlight gradient per darkness factor: the old concentric draw.circle loop vs make_gradient,
+    #then flipping between two recent settings the way the +/- keys do (cache hits)
+    import pygame
+    from lighting import Lighting, make_gradient
+
+    def circles(radius, darkness_factor):
+        gradient = pygame.Surface((radius * 2, radius * 2), pygame.SRCALPHA)
+        for r in range(radius, 0, -1):
+            alpha = int(255 * ((radius - r) / radius) ** darkness_factor)
+            pygame.draw.circle(gradient, (0, 0, 0, alpha), (radius, radius), r)
+        return gradient
+
+    print("spotlight gradient, base radius 300")
+    for darkness_factor in (1.0, 2.0, 3.0):
+        radius = int(300 * (1 + (darkness_factor - 1) * 0.5))
+        old_rate = _rate(lambda: circles(radius, darkness_factor), 1)
+        new_rate = _rate(lambda: make_gradient(radius, darkness_factor), 1)
+        print(f"  darkness {darkness_factor:.1f} (r {radius})  circles {1000 / old_rate:7.2f} ms"
+              f"  one pass {1000 / new_rate:6.2f} ms")
+
+    light = Lighting(300, darkness_factor=2.0)
+    screen = pygame.Surface((800, 700))
+
+    def toggle():
+        for darkness_factor in (2.0, 2.5) * 10:
+            light.darkness_factor = darkness_factor
+            light.draw(screen, (400, 350))
+
+    toggle()
+    rate = _rate(toggle, 20)
+    print(f"  toggling 2.0 <-> 2.5 (cached)  {1000 / rate:6.3f} ms/draw")
+
+
+def bench_shadows(frames=120):
+    #spotlight shadow casting (gather + visibility polygon + lighting draw) with the terrain loaded around a few
+    #spots, under the default time budget, and the plain spotlight for reference.
+    #shadow ms is what the budget covers (gather + cast + mask), merged is how many frames needed coarser occluders
+    #and plain how many fell back to the plain spotlight
+    import time
+    import os
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import pygame
+    from settings import WIDTH, HEIGHT
+    from lighting import Lighting
+    from seabed_generator import SeabedGenerator
+    from underwater_terrain import UnderwaterTerrain
+    from visibility import ShadowCaster
+
+    screen = pygame.Surface((WIDTH, HEIGHT))
+    spots = [(400, 800), (2000, 1500), (5000, 2600)]
+    print(f"shadows, light radius 450, {frames} frames per spot")
+    for mode in ("circles", "contour"):
+        terrain = UnderwaterTerrain(scale=600, threshold=0.2, amplitude=150, chunk_size=800, grid_size=5,
+                                    seed=42, backend="thread", mode=mode)
+        seabed = SeabedGenerator(scale=600, amplitude=1000, base_level=3000)
+        for spot in spots:
+            terrain.update_chunks(spot)
+            while terrain.missing_chunks:
+                time.sleep(0.01)
+                terrain.update_chunks(spot)
+            terrain.bake_pending(None)
+            offset = (spot[0] - WIDTH // 2, spot[1] - HEIGHT // 2)
+            line = f"  {mode:<8} {str(spot):<13}"
+            for label in ("plain", "budgeted"):
+                light = Lighting(300, darkness_factor=2.0)
+                caster = ShadowCaster()
+                stats = {"shadow": 0.0, "merged": 0, "plain": 0}
+
+                def run():
+                    for frame in range(frames):
+                        #a small wobble so the shadow buffer has to be repaired
+                        light_x, light_y = spot[0] + frame % 3, spot[1]
+                        visibility = None
+                        if label != "plain":
+                            polygon = caster.update((light_x, light_y), 450, None, terrain, seabed)
+                            if polygon is not None:
+                                visibility = (polygon - offset).tolist()
+                        light.draw(screen, (light_x - offset[0], light_y - offset[1]), visibility=visibility)
+                        if label != "plain":
+                            caster.record_mask(light.mask_ms)
+                            stats["shadow"] += caster.last_ms
+                            stats["merged"] += caster.merge_cell > 0
+                            stats["plain"] += caster.fallback
+
+                rate = _rate(run, frames, repeats=1)
+                line += f"  {label} {1000 / rate:6.2f} ms"
+                if label != "plain":
+                    line += (f" (shadow {stats['shadow'] / frames:5.2f} ms, merged {stats['merged']},"
+                             f" plain {stats['plain']}, {caster.used}/{caster.available})")
+            print(line)
+        terrain.shutdown()
+
+
+def bench_light_map(frames=60):
+    #the spotlight plus n small lights: each light punched into a full resolution light map (scale 1)
+    #vs half / quarter resolution ones, and the default that picks by light count (auto).
+    #lights use a handful of radii like the game's do
+    import random
+    import pygame
+    from settings import WIDTH, HEIGHT
+    from lighting import Lighting, LightManager
+
+    screen = pygame.Surface((WIDTH, HEIGHT))
+    spotlight = Lighting(300, darkness_factor=2.0)
+    print(f"light map, {WIDTH}x{HEIGHT}, spotlight + n lights")
+    for count in (0, 8, 16, 24, 32, 64):
+        random.seed(count)
+        lights = [
+            ((random.randint(0, WIDTH), random.randint(0, HEIGHT)), random.choice((100, 200, 300)),
+             random.choice(((120, 20, 20), (40, 160, 220))))
+            for _ in range(count)
+        ]
+        line = f"  {count:>4} lights"
+        for scale in (1, 2, 4, None):
+            manager = LightManager((WIDTH, HEIGHT), scale=scale)
+
+            def run():
+                for _ in range(frames):
+                    manager.clear()
+                    manager.add_spotlight(spotlight, (WIDTH // 2, HEIGHT // 2))
+                    for position, radius, color in lights:
+                        manager.add(position, radius, color, darkness_factor=1.5)
+                    manager.draw(screen, overlay_alpha=255)
+
+            run()
+            rate = _rate(run, frames)
+            line += f"  1/{scale} {1000 / rate:6.2f} ms" if scale else f"  auto (1/{manager.scale}) {1000 / rate:6.2f} ms"
+        print(line)
+
+
+def bench_culling(frames=120):
+    #world pass (terrain + seabed + objects) at full darkness with and without DarknessCuller, spotlight at
+    #darkness 1.0 and 2.0 with its shadow polygon. the lighting itself is the same either way so it isn't timed
+    import random
+    import time
+    import os
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import pygame
+    from settings import WIDTH, HEIGHT, BG_COLOR
+    from lighting import Lighting, DarknessCuller
+    from objects import UnderwaterObject, draw_objects
+    from seabed_generator import SeabedGenerator
+    from underwater_terrain import UnderwaterTerrain
+    from visibility import ShadowCaster
+
+    screen = pygame.Surface((WIDTH, HEIGHT))
+    terrain = UnderwaterTerrain(scale=600, threshold=0.2, amplitude=150, chunk_size=800, grid_size=5,
+                                seed=42, backend="thread", mode="circles")
+    seabed = SeabedGenerator(scale=600, amplitude=1000, base_level=3000)
+    caster = ShadowCaster()
+    print(f"darkness culling, world pass at overlay alpha 255, {frames} frames per spot")
+    for spot in [(400, 1600), (2000, 2200), (5000, 2600)]:
+        terrain.update_chunks(spot)
+        while terrain.missing_chunks:
+            time.sleep(0.01)
+            terrain.update_chunks(spot)
+        terrain.bake_pending(None)
+        offset = (spot[0] - WIDTH // 2, spot[1] - HEIGHT // 2)
+        random.seed(spot[0])
+        objects = [UnderwaterObject(offset[0] + random.randint(0, WIDTH), offset[1] + random.randint(0, HEIGHT),
+                                    30, 30, (200, 120, 60)) for _ in range(200)]
+        for darkness_factor in (1.0, 2.0):
+            light = Lighting(300, darkness_factor=darkness_factor)
+            light.refresh()
+            polygon = caster.update(spot, light.current_radius, None, terrain, seabed)
+            visibility = None if polygon is None else (polygon - offset).tolist()
+            lights = [((WIDTH // 2, HEIGHT // 2), light.current_radius, visibility, 0)]
+            line = f"  {str(spot):<13} darkness {darkness_factor:.1f}"
+            for label, alpha in (("off", 0), ("on", 255)):
+                culler = DarknessCuller()
+
+                def world(frame):
+                    culler.begin(screen, alpha, lights)
+                    screen.fill(BG_COLOR)
+                    terrain.draw(screen, offset)
+                    seabed.draw(screen, (offset[0], offset[1] + frame % 2), cell_size=8)
+                    draw_objects(screen, [obj for obj in objects
+                                          if culler.visible(obj.rect.move(-offset[0], -offset[1]))],
+                                 offset, spot, light)
+                    culler.end(screen)
+
+                def run():
+                    for frame in range(frames):
+                        world(frame)
+
+                rate = _rate(run, frames, repeats=3)
+                line += f"  {label} {1000 / rate:6.3f} ms"
+            culled = terrain.culled + seabed.culled + culler.culled
+            box = culler.rect
+            line += f"  ({culled} culled, " + (f"lit {box.width}x{box.height})" if box else "culler off)")
+            print(line)
+    terrain.shutdown()
+    seabed.shutdown()
+
+
+def bench_objects(frames=30):
+    #n UnderwaterObjects scattered round the light: the old draw (new SRCALPHA surface per object per frame)
+    #vs cached surfaces per alpha bucket sent through one blits call
+    import random
+    import pygame
+    from settings import WIDTH, HEIGHT
+    from lighting import Lighting
+    from objects import UnderwaterObject, ObjectSurfaceCache, draw_objects
+
+    def old_draw(obj, screen, offset, light_position, lighting):
+        distance = ((obj.x - light_position[0]) ** 2 + (obj.y - light_position[1]) ** 2) ** 0.5
+        visibility = lighting.calculate_visibility(distance)
+        object_surface = pygame.Surface((obj.width, obj.height), pygame.SRCALPHA)
+        object_surface.fill((*obj.color[:3], int(visibility)))
+        screen.blit(object_surface, (obj.x - offset[0], obj.y - offset[1]))
+
+    screen = pygame.Surface((WIDTH, HEIGHT))
+    light = Lighting(300, darkness_factor=2.0)
+    light.refresh()
+    center = (WIDTH // 2, HEIGHT // 2)
+    print(f"underwater objects, light radius {light.current_radius}, {frames} frames")
+    for count in (10, 100, 1000, 5000):
+        random.seed(count)
+        objects = [
+            UnderwaterObject(random.randint(0, WIDTH), random.randint(0, HEIGHT), random.choice((20, 40, 60)),
+                             random.choice((20, 40, 60)), random.choice(((100, 100, 100), (120, 80, 60), (50, 150, 200))))
+            for _ in range(count)
+        ]
+        cache = ObjectSurfaceCache()
+
+        def old():
+            for _ in range(frames):
+                for obj in objects:
+                    old_draw(obj, screen, (0, 0), center, light)
+
+        def new():
+            for _ in range(frames):
+                draw_objects(screen, objects, (0, 0), center, light, cache)
+
+        old_rate = _rate(old, frames)
+        new_rate = _rate(new, frames)
+        print(f"  {count:>5} objects  per object surface {1000 / old_rate:7.3f} ms"
+              f"  cached + blits {1000 / new_rate:7.3f} ms  ({new_rate / old_rate:.1f}x, {cache.summary()})")
+
+
+def bench_scatter(frames=30):
+    #decoration placement per terrain chunk / seabed span, then drawing n instances on screen:
+    #one python object per instance scaled every frame vs the instance arrays + pre-scaled sprites + blits
+    import time
+    import os
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import numpy as np
+    import pygame
+    from settings import WIDTH, HEIGHT
+    from scatter import Scatter, DECORATION_DTYPE, SCALE_STEPS, SEABED_SPAN
+    from seabed_generator import SeabedGenerator
+    from underwater_terrain import UnderwaterTerrain
+
+    #sprites only get converted to the display's format once there is one, same as in game
+    pygame.display.init()
+    if pygame.display.get_surface() is None:
+        pygame.display.set_mode((WIDTH, HEIGHT))
+    screen = pygame.Surface((WIDTH, HEIGHT)).convert()
+    terrain = UnderwaterTerrain(scale=600, threshold=0.4, amplitude=150, chunk_size=800, grid_size=5,
+                                seed=42, backend="thread", mode="circles")
+    seabed = SeabedGenerator(scale=600, amplitude=1000, base_level=3000)
+    terrain.update_chunks((400, 1200))
+    while terrain.missing_chunks:
+        time.sleep(0.01)
+        terrain.update_chunks((400, 1200))
+    terrain.bake_pending(None)
+    chunks = [(chunk_key, terrain.chunk_grid[chunk_key]) for chunk_key in terrain.chunk_surfaces]
+
+    #placement runs on a lane of the terrain's backend, the main thread only picks up the arrays in update
+    scatter = Scatter(seed=42, terrain=terrain)
+    placer = scatter.placer
+    chunk_rate = _rate(lambda: [placer.place(chunk_key, features) for chunk_key, features in chunks], len(chunks))
+    span_rate = _rate(lambda: [scatter.scatter_span(span, seabed) for span in range(20)], 20)
+    worst = 0.0
+    while len(scatter.terrain_chunks) < len(chunks):
+        start = time.thread_time()
+        scatter.update(terrain, seabed, (0, 1200), (WIDTH, HEIGHT))
+        worst = max(worst, time.thread_time() - start)
+        time.sleep(0.005)
+    placed = sum(map(len, scatter.terrain_chunks.values()))
+    print(f"scatter, {len(chunks)} terrain chunks ({placed} decorations)")
+    print(f"  placement  {1000 / chunk_rate:6.2f} ms/chunk on the backend  {1000 / span_rate:6.2f} ms/seabed span"
+          f" ({SEABED_SPAN} px)  worst main thread update {worst * 1000:.2f} ms")
+
+    scatter.shutdown()
+    terrain.shutdown()
+    seabed.shutdown()
+
+    sprites = scatter.sprites
+    bases = [sprites.variants[index * len(SCALE_STEPS) + SCALE_STEPS.index(1.0)] for index in range(len(sprites.names))]
+    for count in (500, 2000, 10000):
+        rng = np.random.default_rng(count)
+        decorations = np.zeros(count, dtype=DECORATION_DTYPE)
+        decorations["x"] = rng.integers(0, WIDTH, count)
+        decorations["y"] = rng.integers(0, HEIGHT, count)
+        decorations["sprite"] = rng.integers(0, len(sprites.names), count)
+        decorations["scale"] = rng.integers(0, len(SCALE_STEPS), count)
+        scatter.terrain_chunks = {(0, 0): decorations}
+        scatter.seabed_spans = {}
+        objects = [
+            {"x": x, "y": y, "base": bases[sprite], "scale": SCALE_STEPS[scale]}
+            for x, y, sprite, scale in decorations.tolist()
+        ]
+
+        def per_object():
+            for _ in range(frames):
+                for obj in objects:
+                    base = obj["base"]
+                    size = (max(1, round(base.get_width() * obj["scale"])), max(1, round(base.get_height() * obj["scale"])))
+                    sprite = pygame.transform.scale(base, size)
+                    screen.blit(sprite, (obj["x"] - size[0] // 2, obj["y"] - size[1] + 2))
+
+        def batched():
+            for _ in range(frames):
+                scatter.draw(screen, (0, 0), max(WIDTH, HEIGHT))
+
+        old_rate = _rate(per_object, frames)
+        new_rate = _rate(batched, frames)
+        print(f"  {count:>6} on screen  per object + scale {1000 / old_rate:8.2f} ms"
+              f"  arrays + blits {1000 / new_rate:7.2f} ms  ({new_rate / old_rate:.1f}x)")
+
+
+BENCHMARKS = {
+    "chunks": bench_chunk_generation,
+    "backends": bench_chunk_backends,
+    "store": bench_chunk_store,
+    "memory": bench_chunk_memory,
+    "prefetch": bench_chunk_prefetch,
+    "contour": bench_contour_mode,
+    "seabed": bench_seabed_heights,
+    "lowpoints": bench_low_points,
+    "floor": bench_floor_queries,
+    "seabedlod": bench_seabed_lod,
+    "seabedlayer": bench_seabed_layer,
+    "caves": bench_cave_automaton,
+    "cavedraw": bench_cave_draw,
+    "cavestream": bench_cave_streaming,
+    "cavetiles": bench_cave_tiles,
+    "caveregions": bench_cave_regions,
+    "lighting": bench_lighting,
+    "gradient": bench_gradient,
+    "shadows": bench_shadows,
+    "lightmap": bench_light_map,
+    "culling": bench_culling,
+    "objects": bench_objects,
+    "scatter": bench_scatter,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
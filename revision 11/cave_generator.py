@@ -1,15 +1,58 @@
 import random
+from bisect import bisect_left
+from collections import OrderedDict
+
 import pygame
+import numpy as np
+
+from vector_noise import position_hash_array, hash_uniform_array
+
+WALL_COLOR = (50, 50, 50)
+OPEN_COLOR = (200, 200, 200)
+#cells per side of a CaveTiles tile
+TILE_SIZE = 64
+#open regions smaller than this many cells get filled in by CaveGenerator.analyze
+MIN_REGION_CELLS = 12
+
 
 class CaveGenerator:
-    def __init__(self, width, height, fill_percentage, smooth_iterations):
+    def __init__(self, width, height, fill_percentage, smooth_iterations, seed=None, backend="numpy"):
         self.width = width
         self.height = height
         self.fill_percentage = fill_percentage
         self.smooth_iterations = smooth_iterations
-        self.grid = [[0 for _ in range(width)] for _ in range(height)]
+        #"numpy" - uint8 array grid, slice-sum smoothing (seeded)
+        #"python" - the original list of lists + random.randint per cell
+        if backend not in ("numpy", "python"):
+            raise ValueError(f"Unknown cave backend: {backend}")
+        self.backend = backend
+        self.rng = np.random.default_rng(seed)
+        if backend == "numpy":
+            self.grid = np.zeros((height, width), dtype=np.uint8)
+        else:
+            self.grid = [[0 for _ in range(width)] for _ in range(height)]
+        #bumped whenever the grid changes, the baked surface is rebuilt when it doesn't match
+        self.version = 0
+        self.baked = None
+        self.baked_key = None
+        #filled in by analyze(): region label per cell (0 = wall) and the (x, y) cells something of
+        #clearance cells can sit at (top left corner), in the same [y, x] / cell units as grid
+        self.regions = None
+        self.region_sizes = None
+        self.walkable = None
 
     def initialize_grid(self):
+        if self.backend == "numpy":
+            #same odds as randint(0, 100) < fill_percentage
+            self.grid = (self.rng.integers(0, 101, size=(self.height, self.width)) < self.fill_percentage).astype(np.uint8)
+            #walls at edges
+            self.grid[0, :] = 1
+            self.grid[-1, :] = 1
+            self.grid[:, 0] = 1
+            self.grid[:, -1] = 1
+            self.version += 1
+            return
+
         for y in range(self.height):
             for x in range(self.width):
                 #walls at edges
@@ -17,8 +60,15 @@ class CaveGenerator:
                     self.grid[y][x] = 1
                 else:
                     self.grid[y][x] = 1 if random.randint(0, 100) < self.fill_percentage else 0
+        self.version += 1
 
     def smooth_cave(self):
+        if self.backend == "numpy":
+            for _ in range(self.smooth_iterations):
+                self.grid = smooth_step(self.grid)
+            self.version += 1
+            return
+
         for _ in range(self.smooth_iterations):
             new_grid = [[0 for _ in range(self.width)] for _ in range(self.height)]
             for y in range(self.height):
@@ -31,6 +81,7 @@ class CaveGenerator:
                         #space
                         new_grid[y][x] = 1 if wall_count >= 5 else 0
             self.grid = new_grid
+        self.version += 1
 
     def count_neighbors(self, x, y):
         #num of wall neighbor
@@ -44,10 +95,255 @@ class CaveGenerator:
                     count += 1
         return count
 
+    def analyze(self, min_region=MIN_REGION_CELLS, clearance=(1, 1)):
+
+        #post-pass on a finished grid: label the connected open regions, fill in pockets smaller
+        #than min_region cells, and list the cells a clearance (w, h) sized block of open cells starts at
+        #returns the number of pockets that got filled
+
+        grid = np.asarray(self.grid, dtype=np.uint8)
+        labels, sizes = label_regions(grid == 0)
+        pockets = np.flatnonzero(sizes < min_region) + 1
+        if len(pockets):
+            grid = np.where(np.isin(labels, pockets), 1, grid).astype(np.uint8)
+            labels, sizes = label_regions(grid == 0)
+            self.grid = grid if self.backend == "numpy" else grid.tolist()
+            self.mark_dirty()
+        self.regions = labels
+        self.region_sizes = sizes
+
+        #open cells in every clearance window, from a summed area table
+        block_w, block_h = clearance
+        table = np.zeros((self.height + 1, self.width + 1), dtype=np.int32)
+        table[1:, 1:] = (grid == 0).cumsum(axis=0).cumsum(axis=1)
+        windows = (table[block_h:, block_w:] - table[:-block_h, block_w:]
+                   - table[block_h:, :-block_w] + table[:-block_h, :-block_w])
+        self.walkable = np.argwhere(windows == block_w * block_h)[:, ::-1]
+        return len(pockets)
+
+    def mark_dirty(self):
+        #call after editing self.grid by hand
+        self.version += 1
+
+    def bake(self, cell_size):
+        #one pixel per cell through surfarray, then scaled up to cell_size, cached until the grid changes
+        key = (self.version, cell_size)
+        if self.baked_key != key:
+            palette = np.array([OPEN_COLOR, WALL_COLOR], dtype=np.uint8)
+            #surfarray is indexed [x, y]
+            pixels = palette[np.asarray(self.grid, dtype=np.uint8).T]
+            surface = pygame.surfarray.make_surface(pixels)
+            self.baked = pygame.transform.scale(surface, (self.width * cell_size, self.height * cell_size))
+            if pygame.display.get_surface() is not None:
+                self.baked = self.baked.convert()
+            self.baked_key = key
+        return self.baked
+
     def draw(self, screen, cell_size, offset=(0, 0)):
+        #offset is in cells, same as draw_cells
+        position = (offset[0] * cell_size, offset[1] * cell_size)
+        if not screen.get_clip().colliderect(pygame.Rect(position, (self.width * cell_size, self.height * cell_size))):
+            return
+        screen.blit(self.bake(cell_size), position)
+
+    def draw_cells(self, screen, cell_size, offset=(0, 0)):
+        #old per-cell draw, kept for comparisons
         for y in range(self.height):
             for x in range(self.width):
                 world_x = x + offset[0]
                 world_y = y + offset[1]
-                color = (50, 50, 50) if self.grid[y][x] == 1 else (200, 200, 200)
+                color = WALL_COLOR if self.grid[y][x] == 1 else OPEN_COLOR
                 pygame.draw.rect(screen, color, (world_x * cell_size, world_y * cell_size, cell_size, cell_size))
+
+
+def neighbor_counts(grid, halo=False):
+    #walls in the 3x3 block around every cell (the cell included), off-grid cells count as walls
+    #halo: the outer ring of grid are real cells that only get read, counts come out one cell smaller on each side
+    padded = grid if halo else np.pad(grid, 1, constant_values=1)
+    height, width = padded.shape[0] - 2, padded.shape[1] - 2
+    counts = np.zeros((height, width), dtype=np.uint8)
+    for dy in range(3):
+        for dx in range(3):
+            counts += padded[dy:dy + height, dx:dx + width]
+    return counts
+
+
+def smooth_step(grid, halo=False):
+    #one automaton pass with the same rules as the list version: walls stay at 4+, open cells close at 5+
+    counts = neighbor_counts(grid, halo)
+    core = grid[1:-1, 1:-1] if halo else grid
+    return np.where(core == 1, counts >= 4, counts >= 5).astype(np.uint8)
+
+
+def label_regions(open_cells):
+
+    #4-connected regions of a bool grid [y, x]
+    #every row is split into runs of open cells, runs that overlap a run in the row above get joined with union-find
+    #returns (labels, sizes): int32 labels (0 for closed cells, regions numbered 1..n by first cell)
+    #and sizes[n - 1] = cells in region n
+
+    height, width = open_cells.shape
+    padded = np.zeros((height, width + 2), dtype=np.int8)
+    padded[:, 1:-1] = open_cells
+    steps = np.diff(padded, axis=1)
+    #row major, so starts and ends pair up
+    rows, starts = np.nonzero(steps == 1)
+    _, ends = np.nonzero(steps == -1)
+    rows, starts, ends = rows.tolist(), starts.tolist(), ends.tolist()
+
+    parent = list(range(len(rows)))
+
+    def find(run):
+        while parent[run] != run:
+            parent[run] = parent[parent[run]]
+            run = parent[run]
+        return run
+
+    #walk each pair of neighbouring rows with two pointers
+    above = 0
+    row_start = 0
+    for run in range(len(rows)):
+        if run and rows[run] != rows[run - 1]:
+            above = row_start if rows[run - 1] == rows[run] - 1 else run
+            row_start = run
+        while above < row_start and (rows[above] < rows[run] - 1 or ends[above] <= starts[run]):
+            above += 1
+        other = above
+        while other < row_start and starts[other] < ends[run]:
+            a, b = find(run), find(other)
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+            other += 1
+
+    labels = np.zeros((height, width), dtype=np.int32)
+    region_of_root = {}
+    sizes = []
+    for run in range(len(rows)):
+        root = find(run)
+        if root not in region_of_root:
+            region_of_root[root] = len(sizes) + 1
+            sizes.append(0)
+        region = region_of_root[root]
+        labels[rows[run], starts[run]:ends[run]] = region
+        sizes[region - 1] += ends[run] - starts[run]
+    return labels, np.array(sizes, dtype=np.int64)
+
+
+class OpenCellIndex:
+
+    #nearest point lookups over a fixed set of world points (open cave cells)
+    #points are sorted by x, a lookup bisects to x and walks outwards until the x gap alone is worse than the best hit
+
+    def __init__(self, points):
+        points = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+        order = np.argsort(points[:, 0], kind="stable")
+        self.xs = points[order, 0].tolist()
+        self.ys = points[order, 1].tolist()
+
+    def __len__(self):
+        return len(self.xs)
+
+    def nearest(self, x, y):
+        #(x, y) of the closest point, None if there are none
+        if not self.xs:
+            return None
+        right = bisect_left(self.xs, x)
+        left = right - 1
+        best = None
+        best_distance = None
+        while left >= 0 or right < len(self.xs):
+            #take whichever side is closer in x next
+            if right >= len(self.xs) or (left >= 0 and x - self.xs[left] <= self.xs[right] - x):
+                index = left
+                left -= 1
+            else:
+                index = right
+                right += 1
+            dx = self.xs[index] - x
+            if best_distance is not None and dx * dx >= best_distance:
+                break
+            dy = self.ys[index] - y
+            distance = dx * dx + dy * dy
+            if best_distance is None or distance < best_distance:
+                best = index
+                best_distance = distance
+        return self.xs[best], self.ys[best]
+
+
+class CaveTiles:
+
+    #endless cave automaton, the world is covered by tile_size x tile_size tiles, tile (tx, ty) holds
+    #world cells [tx * tile_size, (tx + 1) * tile_size) on each axis
+    #a cell's starting fill is hashed from its world position, so a tile can make the halo it needs
+    #(smooth_iterations cells of its neighbours' fill) on its own, and every pass eats one ring of it.
+    #tiles come out exactly like one big grid smoothed in one go, so they line up with no seams
+    #and can be generated in any order / on any worker
+
+    def __init__(self, tile_size=TILE_SIZE, fill_percentage=45, smooth_iterations=3, seed=0, max_tiles=256):
+        self.tile_size = tile_size
+        self.fill_percentage = fill_percentage
+        self.smooth_iterations = smooth_iterations
+        self.seed = seed
+        #finished tiles as CaveGenerators (for bake / draw), least recently used first
+        self.tiles = OrderedDict()
+        self.max_tiles = max_tiles
+
+    def fill(self, x0, y0, width, height):
+        #starting grid for world cells [x0, x0 + width) x [y0, y0 + height), same odds as randint(0, 100) < fill
+        ys, xs = np.mgrid[y0:y0 + height, x0:x0 + width]
+        roll = hash_uniform_array(position_hash_array(self.seed, xs, ys), 0)
+        return (np.floor(roll * 101) < self.fill_percentage).astype(np.uint8)
+
+    def generate_area(self, x0, y0, width, height):
+        #uint8 wall grid of world cells [x0, x0 + width) x [y0, y0 + height), [y, x], cell for cell what the tiles hold
+        halo = self.smooth_iterations
+        grid = self.fill(x0 - halo, y0 - halo, width + 2 * halo, height + 2 * halo)
+        for _ in range(self.smooth_iterations):
+            grid = smooth_step(grid, halo=True)
+        return grid
+
+    def generate_tile(self, tile_key):
+        #uint8 wall grid of one tile, [y, x]
+        return self.generate_area(tile_key[0] * self.tile_size, tile_key[1] * self.tile_size,
+                                  self.tile_size, self.tile_size)
+
+    def generate_tiles(self, tile_keys):
+        #job for the chunk backends
+        return [self.generate_tile(tile_key) for tile_key in tile_keys]
+
+    def add_tile(self, tile_key, grid):
+        cave = CaveGenerator(self.tile_size, self.tile_size, self.fill_percentage, self.smooth_iterations)
+        cave.grid = grid
+        cave.mark_dirty()
+        self.tiles[tile_key] = cave
+        while len(self.tiles) > self.max_tiles:
+            self.tiles.popitem(last=False)
+        return cave
+
+    def tile(self, tile_key):
+        #cached tile, made on the spot if it isn't there yet
+        cave = self.tiles.get(tile_key)
+        if cave is None:
+            return self.add_tile(tile_key, self.generate_tile(tile_key))
+        self.tiles.move_to_end(tile_key)
+        return cave
+
+    def is_wall(self, x, y):
+        #world cell lookup
+        cave = self.tile((x // self.tile_size, y // self.tile_size))
+        return bool(cave.grid[y % self.tile_size, x % self.tile_size])
+
+    def visible_tiles(self, cell_size, offset, view_size):
+        #keys of the tiles overlapping a view at world pixel offset
+        span = self.tile_size * cell_size
+        left, top = int(offset[0] // span), int(offset[1] // span)
+        right = int((offset[0] + view_size[0] - 1) // span)
+        bottom = int((offset[1] + view_size[1] - 1) // span)
+        return [(tx, ty) for ty in range(top, bottom + 1) for tx in range(left, right + 1)]
+
+    def draw(self, screen, cell_size, offset):
+        #offset is the camera's world pixel position, cell (0, 0) sits at world pixel (0, 0)
+        span = self.tile_size * cell_size
+        for tile_key in self.visible_tiles(cell_size, offset, screen.get_size()):
+            cave = self.tile(tile_key)
+            screen.blit(cave.bake(cell_size), (tile_key[0] * span - offset[0], tile_key[1] * span - offset[1]))
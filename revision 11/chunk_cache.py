@@ -0,0 +1,77 @@
+# chunk_cache.py
+#bounded LRU cache for chunks that have left the visible grid
+
+from collections import OrderedDict
+
+
+def chunk_nbytes(chunk):
+    #chunks are FEATURE_DTYPE arrays
+    return chunk.nbytes
+
+
+class ChunkCache:
+
+    #least recently used chunks get evicted once either limit is hit
+    #max_chunks / max_bytes can be None for no limit on that axis
+
+    def __init__(self, max_chunks=64, max_bytes=None, size_fn=chunk_nbytes):
+        self.max_chunks = max_chunks
+        self.max_bytes = max_bytes
+        self.size_fn = size_fn
+        self.entries = OrderedDict()  #key -> (features, nbytes)
+        self.nbytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        #pops the chunk out of the cache (it's going back into the grid), None on a miss
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.nbytes -= entry[1]
+        return entry[0]
+
+    def put(self, key, features):
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.nbytes -= old[1]
+        size = self.size_fn(features)
+        self.entries[key] = (features, size)
+        self.nbytes += size
+        self._evict()
+
+    def touch(self, key):
+        #mark a chunk as recently used without taking it out, False if it isn't cached
+        if key not in self.entries:
+            return False
+        self.entries.move_to_end(key)
+        return True
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+    def summary(self):
+        return (
+            f"{len(self.entries)} chunks, {self.nbytes // 1024} KB, "
+            f"hit {self.hits} / miss {self.misses} / evict {self.evictions}"
+        )
+
+    def _evict(self):
+        while self.entries and (
+            (self.max_chunks is not None and len(self.entries) > self.max_chunks)
+            or (self.max_bytes is not None and self.nbytes > self.max_bytes)
+        ):
+            _, (_, size) = self.entries.popitem(last=False)
+            self.nbytes -= size
+            self.evictions += 1
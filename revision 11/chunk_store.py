@@ -0,0 +1,180 @@
+# chunk_store.py
+#on-disk store for generated terrain chunks, so revisits and later sessions skip the noise pass
+#
+#layout, one folder per (seed, generator params):
+#   meta.json   - the params the folder was made for (just for humans, the folder name is their hash)
+#   chunks.dat  - fixed-width chunk records (terrain features or contour vertices), appended chunk by chunk
+#   chunks.idx  - fixed-width index records (chunk x, chunk y, first record, record count)
+#reads go through an mmap of chunks.dat, writes go through a writer thread so saving never blocks the render thread
+
+import hashlib
+import json
+import mmap
+import os
+import threading
+from queue import Queue
+
+import numpy as np
+
+from terrain_features import FEATURE_DTYPE
+
+FORMAT_VERSION = 1
+
+#one terrain feature per record, the in-memory FEATURE_DTYPE is already fixed-width and packed
+FEATURE_RECORD = FEATURE_DTYPE
+
+INDEX_RECORD = np.dtype([
+    ("chunk_x", "<i8"),
+    ("chunk_y", "<i8"),
+    ("start", "<i8"),
+    ("count", "<i4"),
+])
+
+
+class ChunkStore:
+
+    def __init__(self, root, params, record=FEATURE_RECORD):
+        #params: dict of everything that changes what a chunk looks like (seed included)
+        #record: numpy dtype of one chunk element, chunks are stored as flat arrays of it
+        self.record = record
+        self.params = dict(params, format_version=FORMAT_VERSION)
+        fingerprint = hashlib.sha1(json.dumps(self.params, sort_keys=True).encode()).hexdigest()[:16]
+        self.path = os.path.join(root, f"terrain-{fingerprint}")
+        os.makedirs(self.path, exist_ok=True)
+
+        meta_path = os.path.join(self.path, "meta.json")
+        if not os.path.exists(meta_path):
+            with open(meta_path, "w") as meta_file:
+                json.dump(self.params, meta_file, indent=2, sort_keys=True)
+
+        self.data_path = os.path.join(self.path, "chunks.dat")
+        self.index_path = os.path.join(self.path, "chunks.idx")
+        self.data_file = open(self.data_path, "ab")
+        self.index_file = open(self.index_path, "ab")
+        #an interrupted write can leave a partial record at the end, cut it off so appends stay aligned
+        self.record_count = self._trim(self.data_file, self.record.itemsize)
+        self._trim(self.index_file, INDEX_RECORD.itemsize)
+
+        self.index = {}
+        self._load_index()
+        self.mapped = None
+        self.mapped_records = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+        #chunk key -> features saved but not on disk yet, loads are served from here until the writer catches up
+        self.pending = {}
+        #guards index / pending, they're shared with the writer thread
+        self.lock = threading.Lock()
+        self.write_queue = Queue()
+        self.writer = threading.Thread(target=self._process_write_queue, daemon=True)
+        self.writer.start()
+
+    def _trim(self, file, record_size):
+        size = os.fstat(file.fileno()).st_size
+        count = size // record_size
+        if size != count * record_size:
+            file.truncate(count * record_size)
+        return count
+
+    def _load_index(self):
+        with open(self.index_path, "rb") as index_file:
+            entries = np.frombuffer(index_file.read(), dtype=INDEX_RECORD)
+        #later entries win if a chunk got written twice
+        for chunk_x, chunk_y, start, count in entries.tolist():
+            #skip entries pointing past the data (data got cut off)
+            if start + count <= self.record_count:
+                self.index[(chunk_x, chunk_y)] = (start, count)
+
+    def __contains__(self, chunk_key):
+        with self.lock:
+            return chunk_key in self.index or chunk_key in self.pending
+
+    def load(self, chunk_key):
+        #features for a stored chunk, None if it was never written
+        with self.lock:
+            features = self.pending.get(chunk_key)
+            entry = self.index.get(chunk_key)
+        if features is not None:
+            self.hits += 1
+            return features.copy()
+        if entry is None:
+            self.misses += 1
+            return None
+        start, count = entry
+        if start + count > self.mapped_records:
+            self._remap()
+        self.hits += 1
+        if count == 0:
+            return np.zeros(0, dtype=self.record)
+        records = np.frombuffer(self.mapped, dtype=self.record, count=count, offset=start * self.record.itemsize)
+        #copy out of the map so it can be closed / remapped while the chunk is still in use
+        return records.copy()
+
+    def save(self, chunk_key, features):
+        #only queues the chunk, the writer thread puts it on disk
+        with self.lock:
+            if chunk_key in self.index or chunk_key in self.pending:
+                return
+            self.pending[chunk_key] = features
+        self.write_queue.put(chunk_key)
+
+    def flush(self):
+        #wait until everything saved so far is on disk
+        self.write_queue.join()
+
+    def _process_write_queue(self):
+        while True:
+            chunk_key = self.write_queue.get()
+            if chunk_key is None:
+                self.write_queue.task_done()
+                return
+            with self.lock:
+                features = self.pending[chunk_key]
+            entry = self._write(chunk_key, features)
+            with self.lock:
+                self.index[chunk_key] = entry
+                del self.pending[chunk_key]
+            self.write_queue.task_done()
+
+    def _write(self, chunk_key, features):
+        #writer thread only, returns the index entry
+        records = np.ascontiguousarray(features, dtype=self.record)
+        start = self.record_count
+        #data first, the index entry only points at it once it's flushed
+        self.data_file.write(records.tobytes())
+        self.data_file.flush()
+        self.record_count += len(records)
+
+        entry = np.array([(chunk_key[0], chunk_key[1], start, len(records))], dtype=INDEX_RECORD)
+        self.index_file.write(entry.tobytes())
+        self.index_file.flush()
+        self.writes += 1
+        return start, len(records)
+
+    def _remap(self):
+        if self.mapped is not None:
+            self.mapped.close()
+        self.mapped = None
+        self.mapped_records = 0
+        size = os.path.getsize(self.data_path)
+        if size == 0:
+            return
+        with open(self.data_path, "rb") as data_file:
+            self.mapped = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.mapped_records = size // self.record.itemsize
+
+    def close(self):
+        #finishes the queued writes first
+        self.write_queue.put(None)
+        self.writer.join()
+        if self.mapped is not None:
+            self.mapped.close()
+            self.mapped = None
+        self.data_file.close()
+        self.index_file.close()
+
+    def summary(self):
+        return f"{len(self.index)} chunks, hit {self.hits} / miss {self.misses} / write {self.writes}"
@@ -0,0 +1,288 @@
+# chunk_workers.py
+#background backends for chunk generation
+#both backends share the same interface:
+#   schedule({key: priority})  - the full set of keys that are still wanted, lower priority runs first
+#   poll()                     - list of (key, result) that finished since the last poll (main thread)
+#   shutdown()
+#   summary()                  - failed job count for the debug menu
+#a job is any picklable callable that takes a list of keys and returns a list of results in the same order
+#share(job) runs another job on the same workers (thread / pool): it returns a JobLane with the same
+#schedule / poll / pending interface, the workers take the lowest priority key across every lane next.
+#a lane's shutdown only cancels its own keys, the workers belong to whoever made the backend
+
+import heapq
+import itertools
+import multiprocessing
+import threading
+from collections import deque
+
+
+class ChunkJobQueue:
+
+    #priority queue of pending keys
+    #each key is only pending once, re-scheduling just updates its priority,
+    #and keys that drop out of the wanted set are cancelled before they ever run
+
+    def __init__(self):
+        self.heap = []
+        self.priorities = {}   #pending key -> priority
+        self.in_flight = set() #keys handed to a worker that haven't come back yet
+        self.counter = itertools.count()
+        self.cancelled = 0
+
+    def schedule(self, wanted):
+        #cancel pending keys that aren't wanted anymore
+        for key in list(self.priorities):
+            if key not in wanted:
+                del self.priorities[key]
+                self.cancelled += 1
+
+        for key, priority in wanted.items():
+            if key in self.in_flight:
+                continue
+            if self.priorities.get(key) != priority:
+                self.priorities[key] = priority
+                heapq.heappush(self.heap, (priority, next(self.counter), key))
+
+        #old heap entries are skipped lazily, rebuild once they pile up
+        if len(self.heap) > 4 * len(self.priorities) + 64:
+            self.heap = [(p, next(self.counter), k) for k, p in self.priorities.items()]
+            heapq.heapify(self.heap)
+
+    def pop_batch(self, size):
+        batch = []
+        while self.heap and len(batch) < size:
+            priority, _, key = heapq.heappop(self.heap)
+            #stale entry (cancelled or re-prioritised)
+            if self.priorities.get(key) != priority:
+                continue
+            del self.priorities[key]
+            self.in_flight.add(key)
+            batch.append(key)
+        return batch
+
+    def peek(self):
+        #priority of the key pop_batch would hand out next, None when nothing is pending
+        while self.heap:
+            priority, _, key = self.heap[0]
+            if self.priorities.get(key) == priority:
+                return priority
+            heapq.heappop(self.heap)
+        return None
+
+    def finish(self, keys):
+        self.in_flight.difference_update(keys)
+
+    def __len__(self):
+        return len(self.priorities)
+
+
+class JobLane:
+
+    #one job's queue and finished results on a backend, the backend's own job is lanes[0]
+
+    def __init__(self, backend, job):
+        self.backend = backend
+        self.job = job
+        self.jobs = ChunkJobQueue()
+        self.results = deque()
+
+    def schedule(self, wanted):
+        self.backend.schedule_lane(self, wanted)
+
+    def poll(self):
+        return self.backend.poll_lane(self)
+
+    def pending(self):
+        return self.backend.pending_lane(self)
+
+    def shutdown(self):
+        self.schedule({})
+
+
+def next_lane(lanes):
+    #lane holding the lowest priority pending key, earlier lanes win ties. None when nothing is pending
+    best = None
+    best_priority = None
+    for lane in lanes:
+        priority = lane.jobs.peek()
+        if priority is not None and (best is None or priority < best_priority):
+            best, best_priority = lane, priority
+    return best
+
+
+class ThreadChunkBackend:
+
+    #one daemon thread pulling the closest keys first
+    #fine for jobs that release the GIL (numpy), the scalar path will still compete with the render loop
+
+    def __init__(self, job, batch_size=8):
+        self.batch_size = batch_size
+        self.lanes = [JobLane(self, job)]
+        #jobs that raised, their keys just stay missing until they get scheduled again
+        self.failed = 0
+        self.last_error = None
+        self.condition = threading.Condition()
+        self.running = True
+        self.thread = threading.Thread(target=self._work, daemon=True)
+        self.thread.start()
+
+    def share(self, job):
+        with self.condition:
+            lane = JobLane(self, job)
+            self.lanes.append(lane)
+        return lane
+
+    def schedule(self, wanted):
+        self.schedule_lane(self.lanes[0], wanted)
+
+    def poll(self):
+        return self.poll_lane(self.lanes[0])
+
+    def pending(self):
+        return self.pending_lane(self.lanes[0])
+
+    def schedule_lane(self, lane, wanted):
+        with self.condition:
+            lane.jobs.schedule(wanted)
+            self.condition.notify()
+
+    def poll_lane(self, lane):
+        finished = []
+        while lane.results:
+            finished.append(lane.results.popleft())
+        return finished
+
+    def pending_lane(self, lane):
+        with self.condition:
+            return len(lane.jobs) + len(lane.jobs.in_flight)
+
+    def summary(self):
+        return job_summary(self)
+
+    def shutdown(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    def _work(self):
+        while True:
+            with self.condition:
+                while self.running and next_lane(self.lanes) is None:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                lane = next_lane(self.lanes)
+                keys = lane.jobs.pop_batch(self.batch_size)
+
+            try:
+                results = lane.job(keys)
+            except Exception as error:
+                #same as the process backend: count it, the thread keeps going
+                results = None
+                failure = f"{keys[0]}: {error!r}"
+
+            #results go out before the keys leave in_flight so a re-schedule can't queue them twice
+            if results is not None:
+                lane.results.extend(zip(keys, results))
+            with self.condition:
+                lane.jobs.finish(keys)
+                if results is None:
+                    self.failed += 1
+                    self.last_error = failure
+
+
+class ProcessChunkBackend:
+
+    #multiprocessing pool, generation doesn't touch the main thread's GIL at all
+    #dispatching happens in poll(), so a handful of batches are in flight at once and
+    #everything else stays in the priority queue where it can still be re-ordered or cancelled.
+    #a lane's batches count as in flight until that lane is polled, so every lane has to be polled
+
+    def __init__(self, job, processes=None, batch_size=2):
+        self.batch_size = batch_size
+        self.processes = processes or max(1, multiprocessing.cpu_count() - 1)
+        self.max_in_flight = self.processes * 2
+        self.lanes = [JobLane(self, job)]
+        self.batches_in_flight = 0
+        #jobs that raised, their keys just stay missing until they get scheduled again
+        self.failed = 0
+        self.last_error = None
+        self.pool = multiprocessing.Pool(self.processes)
+
+    def share(self, job):
+        lane = JobLane(self, job)
+        self.lanes.append(lane)
+        return lane
+
+    def schedule(self, wanted):
+        self.schedule_lane(self.lanes[0], wanted)
+
+    def poll(self):
+        return self.poll_lane(self.lanes[0])
+
+    def pending(self):
+        return self.pending_lane(self.lanes[0])
+
+    def schedule_lane(self, lane, wanted):
+        lane.jobs.schedule(wanted)
+        self._dispatch()
+
+    def poll_lane(self, lane):
+        finished = []
+        while lane.results:
+            keys, results, error = lane.results.popleft()
+            self.batches_in_flight -= 1
+            lane.jobs.finish(keys)
+            if error is None:
+                finished.extend(zip(keys, results))
+            else:
+                self.failed += 1
+                self.last_error = f"{keys[0]}: {error!r}"
+        self._dispatch()
+        return finished
+
+    def pending_lane(self, lane):
+        return len(lane.jobs) + len(lane.jobs.in_flight)
+
+    def summary(self):
+        return job_summary(self)
+
+    def shutdown(self):
+        #nothing new gets queued, what's still running is dropped (chunks are cheap to redo), then wait on the workers
+        self.pool.close()
+        self.pool.terminate()
+        self.pool.join()
+
+    def _dispatch(self):
+        while self.batches_in_flight < self.max_in_flight:
+            lane = next_lane(self.lanes)
+            if lane is None:
+                break
+            keys = lane.jobs.pop_batch(self.batch_size)
+            self.batches_in_flight += 1
+            #callbacks run on the pool's result thread, deque.append is safe there.
+            #failures are counted in poll_lane on the main thread
+            self.pool.apply_async(
+                lane.job, (keys,),
+                callback=lambda results, lane=lane, keys=keys: lane.results.append((keys, results, None)),
+                error_callback=lambda error, lane=lane, keys=keys: lane.results.append((keys, None, error)),
+            )
+
+
+def job_summary(backend):
+    if not backend.failed:
+        return "no failed jobs"
+    return f"{backend.failed} failed jobs, last {backend.last_error}"
+
+
+BACKENDS = {
+    "thread": ThreadChunkBackend,
+    "process": ProcessChunkBackend,
+}
+
+
+def create_backend(name, job, **kwargs):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown chunk backend: {name}")
+    return BACKENDS[name](job, **kwargs)
@@ -78,6 +78,10 @@ class DebugMenu:
                 #debug hotkeys
                 if event.key == pygame.K_t:
                     settings["lighting"] = not settings["lighting"]
+                elif event.key == pygame.K_h:
+                    settings["shadows"] = not settings["shadows"]
+                elif event.key == pygame.K_l:
+                    settings["light_map"] = not settings["light_map"]
                 elif event.key == pygame.K_f:
                     settings["speed"] += 1
                 elif event.key == pygame.K_s:
@@ -107,6 +111,7 @@ class DebugMenu:
                     _, x, y = parts
                     submarine.x = int(x)
                     submarine.y = int(y)
+                    seabed.reset_layer()
                     self.add_console_line(f"Teleported to ({x}, {y})", "success")
                 else:
                     self.add_console_line("Usage: tp <x> <y>", "usage")
@@ -129,19 +134,16 @@ class DebugMenu:
             self.add_console_line(f"Invalid command format: {input_text}", "unknown")
 
     def teleport_to_nearest_cave(self, submarine, seabed):
-        if not hasattr(seabed, "caves") or not seabed.caves:
+        #nearest spot in a loaded cave the sub actually fits at, from the seabed's open cell index
+        target = seabed.nearest_open_cell(submarine.x, submarine.y)
+        if target is None:
             self.add_console_line("No caves found!", "unknown")
             return
 
-        #dind nearest cave
-        sub_pos = (submarine.x, submarine.y)
-        nearest_cave = min(
-            seabed.caves,
-            key=lambda c: ((c[0] - sub_pos[0]) ** 2 + (c[1] - sub_pos[1]) ** 2)
-        )
-        cave_x, cave_y, _ = nearest_cave
+        cave_x, cave_y = target
         submarine.x = cave_x
         submarine.y = cave_y
+        seabed.reset_layer()
         self.add_console_line(f"Teleported to ({cave_x}, {cave_y})", "success")
 
     # ===Add Console Lines with Categories for Color===
@@ -174,16 +176,27 @@ class DebugMenu:
         debug_lines = [
             "DEBUG MENU",
             "BuildInfo: Ocean Game 0.0.10g",
-            "Toggle Commands: [T] Toggle Lighting, [F/S] Adjust Speed, [+/-] Darkness Factor",
+            "Toggle Commands: [T] Toggle Lighting, [H] Toggle Shadows, [L] Light Map, [F/S] Adjust Speed, [+/-] Darkness Factor",
             f"FPS: {fps:.2f}",
             f"Submarine Pos: ({int(submarine.x)}, {int(submarine.y)})",
             f"Depth: {int(submarine.y)}",
             f"Depth (offset): {3000 + submarine.y}",
             f"Seabed Height: {settings.get('seabed_height', 'N/A')}",
+            f"Seabed Fill Verts: {settings.get('seabed_vertices', 'N/A')}",
             f"Speed: {settings['speed']}",
             f"Lighting: {'On' if settings['lighting'] else 'Off'}",
+            f"Shadows: {'On' if settings.get('shadows') else 'Off'} - {settings.get('shadow_stats', 'N/A')}",
             f"Darkness Factor: {lighting.darkness_factor:.2f}",
             f"Spotlight Radius: {lighting.current_radius}",
+            f"Shadow Repaired: {lighting.repaired} px",
+            f"Objects: {settings.get('objects_drawn', 'N/A')} drawn, {settings.get('object_cache', 'N/A')}",
+            f"Decorations: {settings.get('decorations', 'N/A')}",
+            f"Culling: {settings.get('culling', 'N/A')}",
+            f"Light Map: {'On' if settings.get('light_map') else 'Off'} - {settings.get('light_map_stats', 'N/A')}",
+            f"Chunk Cache: {settings.get('chunk_cache', 'N/A')}",
+            f"Chunk Prefetch: {settings.get('chunk_prefetch', 'N/A')}",
+            f"Chunk Jobs: {settings.get('chunk_jobs', 'N/A')}",
+            f"Caves: {settings.get('caves', 'N/A')}",
         ]
 
         console_lines = list(self.console_history)
@@ -0,0 +1,262 @@
+# geometry.py
+#polygon helpers for the terrain: marching squares contours, line simplification and rect tests
+#all contour loops are wound with the inside on the left of the walking direction (screen coords, y down),
+#so outer boundaries come out with a negative shoelace area and holes with a positive one
+
+import numpy as np
+
+#edges of a marching squares cell
+_T, _R, _B, _L = range(4)
+
+#case = tl * 8 + tr * 4 + br * 2 + bl, every segment goes (from edge, to edge) with the inside on its left
+#saddles (5 and 10) have a second entry for when the cell center is inside and the two corners join up
+_CASES = {
+    1: ((_B, _L),),
+    2: ((_R, _B),),
+    3: ((_R, _L),),
+    4: ((_T, _R),),
+    6: ((_T, _B),),
+    7: ((_T, _L),),
+    8: ((_L, _T),),
+    9: ((_B, _T),),
+    11: ((_R, _T),),
+    12: ((_L, _R),),
+    13: ((_B, _R),),
+    14: ((_L, _B),),
+}
+_SADDLES = {
+    5: (((_T, _R), (_B, _L)), ((_T, _L), (_B, _R))),
+    10: (((_L, _T), (_R, _B)), ((_R, _T), (_L, _B))),
+}
+
+
+def contour_loops(field, threshold):
+
+    #marching squares over a (nx + 1, ny + 1) sample grid indexed [x, y], clipped to the grid's border
+    #returns a list of (points, pinned): points is a (k, 2) float array in sample units,
+    #pinned marks vertices that have to survive simplification (border crossings and grid corners)
+    #so neighbouring grids that share a border row end up with the exact same seam vertices
+
+    field = np.asarray(field, dtype=np.float64)
+    nx, ny = field.shape[0] - 1, field.shape[1] - 1
+    inside = field > threshold
+
+    #vertex ids: horizontal edges, then vertical edges, then grid points
+    h_count = nx * (ny + 1)
+    v_count = (nx + 1) * ny
+
+    def h_id(i, j):
+        return i * (ny + 1) + j
+
+    def v_id(i, j):
+        return h_count + i * ny + j
+
+    def p_id(i, j):
+        return h_count + v_count + i * (ny + 1) + j
+
+    #crossing positions, always interpolated from the lower corner so both cells sharing an edge agree
+    with np.errstate(divide="ignore", invalid="ignore"):
+        h_t = (threshold - field[:-1, :]) / (field[1:, :] - field[:-1, :])
+        v_t = (threshold - field[:, :-1]) / (field[:, 1:] - field[:, :-1])
+
+    tl = inside[:-1, :-1]
+    tr = inside[1:, :-1]
+    br = inside[1:, 1:]
+    bl = inside[:-1, 1:]
+    case = tl * 8 + tr * 4 + br * 2 + bl * 1
+    center = (field[:-1, :-1] + field[1:, :-1] + field[1:, 1:] + field[:-1, 1:]) * 0.25 > threshold
+
+    starts = []
+    ends = []
+
+    def edge_ids(edge, i, j):
+        if edge == _T:
+            return h_id(i, j)
+        if edge == _B:
+            return h_id(i, j + 1)
+        if edge == _L:
+            return v_id(i, j)
+        return v_id(i + 1, j)
+
+    def add(cells, segments):
+        i, j = cells
+        for start, end in segments:
+            starts.append(edge_ids(start, i, j))
+            ends.append(edge_ids(end, i, j))
+
+    for value, segments in _CASES.items():
+        add(np.nonzero(case == value), segments)
+    for value, (apart, joined) in _SADDLES.items():
+        saddle = case == value
+        add(np.nonzero(saddle & ~center), apart)
+        add(np.nonzero(saddle & center), joined)
+
+    #walk the border with the grid's inside on the left (top right to left, left side down,
+    #bottom left to right, right side up) so clipped shapes close along it
+    border = (
+        [(i, 0) for i in range(nx, 0, -1)]
+        + [(0, j) for j in range(0, ny)]
+        + [(i, ny) for i in range(0, nx)]
+        + [(nx, j) for j in range(ny, 0, -1)]
+    )
+    for index, (ai, aj) in enumerate(border):
+        bi, bj = border[(index + 1) % len(border)]
+        if aj == bj:
+            edge = h_id(min(ai, bi), aj)
+        else:
+            edge = v_id(ai, min(aj, bj))
+        a_in = inside[ai, aj]
+        b_in = inside[bi, bj]
+        if a_in and b_in:
+            starts.append(p_id(ai, aj))
+            ends.append(p_id(bi, bj))
+        elif a_in:
+            starts.append(p_id(ai, aj))
+            ends.append(edge)
+        elif b_in:
+            starts.append(edge)
+            ends.append(p_id(bi, bj))
+
+    if not starts:
+        return []
+
+    #every vertex has exactly one segment leaving it, so loops fall out of following next[]
+    following = dict(zip(np.concatenate([np.ravel(s) for s in starts]).tolist(),
+                         np.concatenate([np.ravel(e) for e in ends]).tolist()))
+
+    #coordinates and pin flags for every vertex id, laid out the same way as the ids
+    h_i, h_j = np.meshgrid(np.arange(nx), np.arange(ny + 1), indexing="ij")
+    v_i, v_j = np.meshgrid(np.arange(nx + 1), np.arange(ny), indexing="ij")
+    p_i, p_j = np.meshgrid(np.arange(nx + 1), np.arange(ny + 1), indexing="ij")
+    vertex_x = np.concatenate(((h_i + h_t).ravel(), v_i.ravel(), p_i.ravel())).astype(np.float64)
+    vertex_y = np.concatenate((h_j.ravel(), (v_j + v_t).ravel(), p_j.ravel())).astype(np.float64)
+    vertex_pinned = np.concatenate((
+        ((h_j == 0) | (h_j == ny)).ravel(),
+        ((v_i == 0) | (v_i == nx)).ravel(),
+        (((p_i == 0) | (p_i == nx)) & ((p_j == 0) | (p_j == ny))).ravel(),
+    ))
+
+    loops = []
+    while following:
+        first, vertex = following.popitem()
+        loop = [first]
+        while vertex != first:
+            loop.append(vertex)
+            vertex = following.pop(vertex)
+        loop = np.array(loop)
+        points = np.stack((vertex_x[loop], vertex_y[loop]), axis=-1)
+        loops.append((points, vertex_pinned[loop]))
+    return loops
+
+
+def rdp(points, tolerance):
+    #ramer-douglas-peucker on an open polyline, returns a bool mask of the vertices to keep (ends always kept)
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start = points[first]
+        direction = points[last] - start
+        length = np.hypot(direction[0], direction[1])
+        offsets = points[first + 1:last] - start
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(direction[0] * offsets[:, 1] - direction[1] * offsets[:, 0]) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return keep
+
+
+def simplify_loop(points, pinned, tolerance):
+
+    #rdp on a closed loop, run piecewise between pinned vertices so those are never moved or dropped
+    #loops with less than two pins get split at the pin (or vertex 0) and the vertex farthest from it
+
+    count = len(points)
+    anchors = np.flatnonzero(pinned)
+    if len(anchors) < 2:
+        first = anchors[0] if len(anchors) else 0
+        farthest = int(np.argmax(np.hypot(*(points - points[first]).T)))
+        anchors = np.unique([first, farthest])
+        if len(anchors) < 2:
+            return points[:1]
+
+    keep = np.zeros(count, dtype=bool)
+    keep[anchors] = True
+    for index, start in enumerate(anchors):
+        end = anchors[(index + 1) % len(anchors)]
+        #indices of this piece, wrapping around the end of the loop
+        piece = np.arange(start, end + (count if end <= start else 0) + 1) % count
+        keep[piece[rdp(points[piece], tolerance)]] = True
+    return points[keep]
+
+
+def polygon_area(points):
+    #signed shoelace area, negative for outer terrain loops (see the top of the file)
+    x = points[:, 0].astype(np.float64)
+    y = points[:, 1].astype(np.float64)
+    return 0.5 * float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))
+
+
+def loop_segments(points):
+    #edges of a closed loop, (k, 2) points -> (k, 4) float rows of x0, y0, x1, y1
+    points = np.asarray(points, dtype=np.float64)
+    return np.concatenate((points, np.roll(points, -1, axis=0)), axis=1)
+
+
+def polyline_segments(points):
+    #edges of an open polyline, (k, 2) points -> (k - 1, 4)
+    points = np.asarray(points, dtype=np.float64)
+    return np.concatenate((points[:-1], points[1:]), axis=1)
+
+
+def points_in_loops(px, py, loops):
+    #even-odd test of many points against a set of loops (holes included), returns a bool array
+    px = np.asarray(px, dtype=np.float64)
+    py = np.asarray(py, dtype=np.float64)
+    crossings = np.zeros(px.shape, dtype=np.int64)
+    for points in loops:
+        x0 = points[:, 0].astype(np.float64)
+        y0 = points[:, 1].astype(np.float64)
+        x1 = np.roll(x0, -1)
+        y1 = np.roll(y0, -1)
+        straddles = (y0[:, None] > py) != (y1[:, None] > py)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cross_x = x0[:, None] + (py - y0[:, None]) * (x1 - x0)[:, None] / (y1 - y0)[:, None]
+        crossings += (straddles & (px < cross_x)).sum(axis=0)
+    return crossings % 2 == 1
+
+
+def loops_hit_rect(loops, rect):
+    #true if a pygame rect overlaps the area enclosed by the loops
+    left, top, right, bottom = rect.left, rect.top, rect.right, rect.bottom
+    corners_x = np.array([left, right, right, left], dtype=np.float64)
+    corners_y = np.array([top, top, bottom, bottom], dtype=np.float64)
+    if points_in_loops(corners_x, corners_y, loops).any():
+        return True
+    for points in loops:
+        x0 = points[:, 0].astype(np.float64)
+        y0 = points[:, 1].astype(np.float64)
+        #a vertex inside the rect
+        if ((x0 >= left) & (x0 <= right) & (y0 >= top) & (y0 <= bottom)).any():
+            return True
+        #an edge crossing one of the rect's sides
+        x1 = np.roll(x0, -1)
+        y1 = np.roll(y0, -1)
+        for ax, ay, bx, by in ((left, top, right, top), (right, top, right, bottom),
+                               (right, bottom, left, bottom), (left, bottom, left, top)):
+            d1 = (bx - ax) * (y0 - ay) - (by - ay) * (x0 - ax)
+            d2 = (bx - ax) * (y1 - ay) - (by - ay) * (x1 - ax)
+            d3 = (x1 - x0) * (ay - y0) - (y1 - y0) * (ax - x0)
+            d4 = (x1 - x0) * (by - y0) - (y1 - y0) * (bx - x0)
+            if ((d1 * d2 < 0) & (d3 * d4 < 0)).any():
+                return True
+    return False
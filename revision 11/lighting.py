@@ -1,4 +1,20 @@
+import time
 import pygame
+import numpy as np
+from collections import OrderedDict
+
+#gradients kept around for recent (radius, darkness_factor) pairs
+GRADIENT_CACHE_SIZE = 8
+#LightManager: light map pixels per side of a screen pixel (4 = quarter resolution), and how many
+#different light gradients (radius, darkness, color) it keeps
+LIGHT_MAP_SCALE = 4
+LIGHT_CACHE_SIZE = 32
+#lights per frame from which the quarter resolution map beats full resolution. below it the fixed cost of the
+#upscale is more than the per light savings (benchmarks.py lightmap: full res wins up to ~16 lights, quarter from ~24)
+LIGHT_MAP_CROSSOVER = 24
+#DarknessCuller stays off when the lit box covers more than this much of the screen. past about that the clipped
+#(RLE) terrain blits cost more than what gets skipped (benchmarks.py culling: slower at 65%, faster at 50%)
+CULL_MAX_COVERAGE = 0.6
 
 class Lighting:
     def __init__(self, radius, darkness_factor=1.0):
@@ -9,54 +25,115 @@ class Lighting:
         self.base_radius = radius
         self.darkness_factor = darkness_factor
         self.overlay = None
+        self.overlay_key = None
         self.current_radius = radius
+        #(radius, darkness_factor) -> gradient surface, least recently used first
+        self.gradients = OrderedDict()
+        #full screen shadow kept between frames, with what it was last made for (size, alpha, overlay)
+        #and where the spotlight got punched out, so only that spot has to be redone when the light moves
+        self.shadow = None
+        self.shadow_key = None
+        self.shadow_rect = None
+        #true when the last punch went through a visibility polygon, and the gradient copy used for it
+        self.shadow_masked = False
+        self.masked = None
+        #area of the shadow buffer repaired last frame, for the debug menu
+        self.repaired = 0
+        #ms spent cutting the spotlight down to the visibility polygon last draw, part of the shadow budget
+        self.mask_ms = 0.0
 
     def generate_overlay(self):
         #gen a new radial gradient overlay.
         #adj spotlight radius based on darkness_factor
         self.current_radius = int(self.base_radius * (1 + (self.darkness_factor - 1) * 0.5))
+        key = (self.current_radius, self.darkness_factor)
 
-        gradient = pygame.Surface((self.current_radius * 2, self.current_radius * 2), pygame.SRCALPHA)
-        center = (self.current_radius, self.current_radius)
-
-        for r in range(self.current_radius, 0, -1):
-            #calc alpha value based on distance and darkness factor
-            alpha = int(255 * ((self.current_radius - r) / self.current_radius) ** self.darkness_factor)
-            pygame.draw.circle(gradient, (0, 0, 0, alpha), center, r)
+        gradient = self.gradients.get(key)
+        if gradient is None:
+            gradient = make_gradient(self.current_radius, self.darkness_factor)
+            self.gradients[key] = gradient
+            if len(self.gradients) > GRADIENT_CACHE_SIZE:
+                self.gradients.popitem(last=False)
+        else:
+            self.gradients.move_to_end(key)
 
         self.overlay = gradient
+        self.overlay_key = key
+
+    def refresh(self):
+        #regen overlay if the darkness factor changed since it was made (keeps current_radius up to date)
+        expected_radius = self.base_radius * (1 + (self.darkness_factor - 1) * 0.5)
+        if self.overlay is None or self.overlay_key != (int(expected_radius), self.darkness_factor):
+            self.generate_overlay()
 
-    def draw(self, screen, light_position, overlay_alpha=255):
+    def draw(self, screen, light_position, overlay_alpha=255, visibility=None):
 
         #draw lighting overlay with a spotlight effect, faded by overlay_alpha.
         # param screen: The main game screen.
         # param light_position: (x,y) center of the light in screen coordinates.
         # param overlay_alpha: Overall opacity of the entire overlay [0..255].
+        # param visibility: optional polygon (screen coords) the light reaches, see visibility.py. None = no shadows
 
         #if alpha is 0 or less, skip drawing lol
         if overlay_alpha <= 0:
             return
 
-        #regen overlay if needed
-        expected_radius = self.base_radius * (1 + (self.darkness_factor - 1) * 0.5)
-        if self.overlay is None or self.current_radius != int(expected_radius):
-            self.generate_overlay()
+        self.refresh()
+        self.mask_ms = 0.0
+        self.update_shadow(screen.get_size(), light_position, overlay_alpha, visibility)
+
+        #blend the shadow surface onto the main screen
+        screen.blit(self.shadow, (0, 0))
 
-        #create shadow surface covering entire screen
-        shadow_surface = pygame.Surface(screen.get_size(), pygame.SRCALPHA)
+    def update_shadow(self, size, light_position, overlay_alpha, visibility=None):
 
-        #fill it with black using overlay_alpha as overall opacity
-        shadow_surface.fill((0, 0, 0, overlay_alpha))
+        #bring the persistent shadow buffer up to date for this frame
+        #a new size, alpha or overlay refills the whole thing, otherwise only the old and new spotlight
+        #rects get refilled and the spotlight punched out again (nothing at all if the light didn't move)
+        #with a visibility polygon the spotlight is redone every frame, cut down to the polygon
+
+        rect = self.overlay.get_rect(topleft=(light_position[0] - self.current_radius,
+                                              light_position[1] - self.current_radius))
+        key = (size, overlay_alpha, self.overlay)
+        if self.shadow is None or self.shadow.get_size() != size:
+            self.shadow = pygame.Surface(size, pygame.SRCALPHA)
+            self.shadow_key = None
+
+        if key != self.shadow_key:
+            #fill it with black using overlay_alpha as overall opacity
+            self.shadow.fill((0, 0, 0, overlay_alpha))
+            dirty = [self.shadow.get_rect()]
+        elif rect != self.shadow_rect or visibility is not None or self.shadow_masked:
+            dirty = [self.shadow_rect, rect]
+            for area in dirty:
+                self.shadow.fill((0, 0, 0, overlay_alpha), area)
+        else:
+            self.repaired = 0
+            return
 
         #'punch out' the radial spotlight using BLEND_RGBA_SUB
-        shadow_surface.blit(
-            self.overlay,
-            (light_position[0] - self.current_radius, light_position[1] - self.current_radius),
-            special_flags=pygame.BLEND_RGBA_SUB
-        )
+        spotlight = self.overlay if visibility is None else self.mask_overlay(visibility, rect.topleft)
+        self.shadow.blit(spotlight, rect, special_flags=pygame.BLEND_RGBA_SUB)
+        self.shadow_key = key
+        self.shadow_rect = rect
+        self.shadow_masked = visibility is not None
+        bounds = self.shadow.get_rect()
+        self.repaired = sum(area.clip(bounds).width * area.clip(bounds).height for area in dirty)
 
-        #blend the shadow surface onto the main screen
-        screen.blit(shadow_surface, (0, 0))
+    def mask_overlay(self, polygon, topleft):
+        #copy of the gradient with everything outside the visibility polygon cleared (min of the gradient and a polygon mask)
+        #pygame can't fill a polygon under 3 points, the plain gradient is used for those
+        if len(polygon) < 3:
+            return self.overlay
+        start = time.perf_counter()
+        if self.masked is None or self.masked.get_size() != self.overlay.get_size():
+            self.masked = pygame.Surface(self.overlay.get_size(), pygame.SRCALPHA)
+        self.masked.fill((0, 0, 0, 0))
+        points = [(x - topleft[0], y - topleft[1]) for x, y in polygon]
+        pygame.draw.polygon(self.masked, (0, 0, 0, 255), points)
+        self.masked.blit(self.overlay, (0, 0), special_flags=pygame.BLEND_RGBA_MIN)
+        self.mask_ms = (time.perf_counter() - start) * 1000
+        return self.masked
 
     def calculate_visibility(self, distance):
 
@@ -67,3 +144,224 @@ class Lighting:
             return 0  #fully dark if beyond the spotlight
         visibility = max(0, 255 * ((self.current_radius - distance) / self.current_radius) ** self.darkness_factor)
         return visibility
+
+    def calculate_visibility_array(self, distances):
+        #calculate_visibility over a numpy array of distances
+        falloff = np.clip((self.current_radius - distances) / self.current_radius, 0.0, 1.0)
+        return 255 * falloff ** self.darkness_factor
+
+
+def gradient_alpha(radius, darkness_factor):
+
+    #radial gradient in one pass: a pixel gets the alpha of the ring it's in, counted out from the middle
+    #(same values the old loop of concentric draw.circle calls gave, their edges can land a ring apart)
+    #strongest in the middle (it's subtracted from the shadow), fading out to nothing at the radius
+    #returns a (2 * radius, 2 * radius) uint8 array, symmetric so [x, y] and [y, x] are the same
+
+    #one quarter is enough, the rest is mirrored. pixel centers of the bottom right quarter are 0.5, 1.5, ... from the middle
+    offsets = np.arange(radius, dtype=np.float32) + np.float32(0.5)
+    squared = offsets * offsets
+    ring = np.ceil(np.sqrt(squared[:, None] + squared[None, :])).astype(np.intp)
+    #calc alpha value based on distance and darkness factor, once per ring (ring 1 is the middle, past radius is empty)
+    rings = np.arange(int(ring.max()) + 1)
+    table = (255 * (np.maximum(radius - np.maximum(rings, 1), 0) / radius) ** darkness_factor).astype(np.uint8)
+    table[radius + 1:] = 0
+    quarter = table[ring]
+    half = np.concatenate((quarter[::-1], quarter))
+    return np.concatenate((half[:, ::-1], half), axis=1)
+
+
+def make_gradient(radius, darkness_factor):
+    #gradient_alpha as a black SRCALPHA surface, what Lighting punches out of the shadow
+    gradient = pygame.Surface((radius * 2, radius * 2), pygame.SRCALPHA)
+    gradient.fill((0, 0, 0, 0))
+    pygame.surfarray.pixels_alpha(gradient)[:] = gradient_alpha(radius, darkness_factor)
+    return gradient
+
+
+class LightManager:
+
+    #any number of point lights, added up in a light map at 1 / scale of the screen resolution
+    #every frame: the map starts at the ambient light level, each light's cached gradient is added on
+    #(BLEND_RGB_ADD), the map is scaled up once and multiplied onto the scene.
+    #the cost per light is its gradient's size in light map pixels, so it's scale^2 cheaper than at full res,
+    #but the upscale costs the same every frame. scale=None picks per frame: full res under LIGHT_MAP_CROSSOVER
+    #lights, LIGHT_MAP_SCALE from there on
+    #
+    #a white light with the spotlight's gradient on an ambient of 255 - overlay_alpha is the same light
+    #model as Lighting.draw (black shadow at overlay_alpha with the gradient subtracted), just at lower res
+
+    def __init__(self, size, scale=None):
+        #fixed scale, or None to pick one from the light count every draw
+        self.fixed_scale = scale
+        self.scale = scale or 1
+        self.size = size
+        #scale -> light map surface, made the first time that scale gets used
+        self.light_maps = {}
+        #full size copy of the light map, reused for the upscale every frame
+        self.scaled = pygame.Surface(size)
+        #(radius, darkness_factor, color) -> light map sized gradient surface, least recently used first
+        self.gradients = OrderedDict()
+        #scratch surfaces for lights cut down to a visibility polygon, by gradient size
+        self.masks = {}
+        self.lights = []
+        #lights drawn last frame, for the debug menu
+        self.drawn = 0
+        #ms spent cutting lights down to their visibility polygons last draw
+        self.mask_ms = 0.0
+
+    def clear(self):
+        self.lights = []
+
+    def scale_for(self, count):
+        #light map scale a draw with count lights uses
+        if self.fixed_scale is not None:
+            return self.fixed_scale
+        return 1 if count < LIGHT_MAP_CROSSOVER else LIGHT_MAP_SCALE
+
+    def add(self, position, radius, color=(255, 255, 255), darkness_factor=1.0, visibility=None):
+        #a point light for this frame, position / radius / visibility polygon in screen pixels
+        self.lights.append((position, radius, color, darkness_factor, visibility))
+
+    def add_spotlight(self, lighting, position, visibility=None):
+        #the sub's spotlight with a Lighting's current radius / darkness (keeps the Lighting's radius up to date)
+        lighting.refresh()
+        self.add(position, lighting.current_radius, darkness_factor=lighting.darkness_factor, visibility=visibility)
+
+    def gradient(self, radius, darkness_factor, color):
+        #light colored gradient at light map resolution, black outside the radius.
+        #keyed on the radius in light map pixels, lights that only differ below that share one
+        key = (max(1, int(radius) // self.scale), darkness_factor, color)
+        gradient = self.gradients.get(key)
+        if gradient is not None:
+            self.gradients.move_to_end(key)
+            return gradient
+        alpha = gradient_alpha(key[0], darkness_factor).astype(np.uint16)
+        pixels = (alpha[:, :, None] * np.array(color, dtype=np.uint16) // 255).astype(np.uint8)
+        gradient = pygame.surfarray.make_surface(pixels)
+        self.gradients[key] = gradient
+        if len(self.gradients) > LIGHT_CACHE_SIZE:
+            self.gradients.popitem(last=False)
+        return gradient
+
+    def masked(self, gradient, polygon, topleft):
+        #copy of a gradient with everything outside a light map space polygon turned black (as is under 3 points)
+        if len(polygon) < 3:
+            return gradient
+        start = time.perf_counter()
+        size = gradient.get_size()
+        mask = self.masks.get(size)
+        if mask is None:
+            mask = self.masks[size] = (pygame.Surface(size), pygame.Surface(size))
+        cut, stencil = mask
+        stencil.fill((0, 0, 0))
+        pygame.draw.polygon(stencil, (255, 255, 255), [(x - topleft[0], y - topleft[1]) for x, y in polygon])
+        cut.blit(gradient, (0, 0))
+        cut.blit(stencil, (0, 0), special_flags=pygame.BLEND_RGB_MIN)
+        self.mask_ms += (time.perf_counter() - start) * 1000
+        return cut
+
+    def draw(self, screen, overlay_alpha=255):
+        #light the scene with every light added since the last clear(), nothing to do if it isn't dark
+        self.drawn = 0
+        self.mask_ms = 0.0
+        if overlay_alpha <= 0:
+            return
+        self.scale = self.scale_for(len(self.lights))
+        light_map = self.light_maps.get(self.scale)
+        if light_map is None:
+            map_size = (-(-self.size[0] // self.scale), -(-self.size[1] // self.scale))
+            light_map = self.light_maps[self.scale] = pygame.Surface(map_size)
+        ambient = 255 - min(255, int(overlay_alpha))
+        light_map.fill((ambient, ambient, ambient))
+        map_rect = light_map.get_rect()
+        for (x, y), radius, color, darkness_factor, visibility in self.lights:
+            gradient = self.gradient(radius, darkness_factor, color)
+            half = gradient.get_width() // 2
+            topleft = (int(x // self.scale) - half, int(y // self.scale) - half)
+            if not map_rect.colliderect(pygame.Rect(topleft, gradient.get_size())):
+                continue
+            if visibility is not None:
+                polygon = [(px / self.scale, py / self.scale) for px, py in visibility]
+                gradient = self.masked(gradient, polygon, topleft)
+            light_map.blit(gradient, topleft, special_flags=pygame.BLEND_RGB_ADD)
+            self.drawn += 1
+        if self.scale == 1:
+            #already screen sized, nothing to scale up
+            screen.blit(light_map, (0, 0), special_flags=pygame.BLEND_RGB_MULT)
+            return
+        pygame.transform.smoothscale(light_map, self.size, self.scaled)
+        screen.blit(self.scaled, (0, 0), special_flags=pygame.BLEND_RGB_MULT)
+
+
+def light_rect(position, radius, visibility=None, padding=0):
+    #screen rect a light can brighten: its circle's box, or the box of its visibility polygon when there is one
+    if visibility is not None and len(visibility):
+        xs = [x for x, _ in visibility]
+        ys = [y for _, y in visibility]
+        rect = pygame.Rect(int(min(xs)), int(min(ys)), int(max(xs) - min(xs)) + 2, int(max(ys) - min(ys)) + 2)
+    else:
+        rect = pygame.Rect(int(position[0] - radius), int(position[1] - radius), int(2 * radius) + 1, int(2 * radius) + 1)
+    return rect.inflate(2 * padding, 2 * padding)
+
+
+class DarknessCuller:
+
+    #at full darkness (overlay alpha 255) everything outside the lights ends up solid black, so it isn't worth drawing.
+    #begin() clips the screen to the box around every light for the world pass (the terrain / seabed / caves check
+    #the screen's clip themselves) and pygame clips whatever is left. visible() is for single things and goes by
+    #the lights' circles and visibility polygon boxes, not the union box that covers most of the screen.
+    #below full darkness, or when the lit box is most of the screen anyway, nothing is culled
+
+    def __init__(self):
+        self.rect = None
+        #(x, y, radius, box) per light, radius and box already padded
+        self.lights = []
+        #draws skipped / done through visible() this frame, plus whatever the callers add to culled
+        self.culled = 0
+        self.drawn = 0
+        self.screen_area = 1
+
+    def begin(self, screen, overlay_alpha, lights):
+        #lights: (position, radius, visibility, padding) in screen coords, same as light_rect takes
+        self.culled = 0
+        self.drawn = 0
+        self.rect = None
+        self.screen_area = screen.get_width() * screen.get_height()
+        if overlay_alpha < 255 or not lights:
+            return
+        self.lights = [
+            (position[0], position[1], radius + padding, light_rect(position, radius, visibility, padding))
+            for position, radius, visibility, padding in lights
+        ]
+        rect = self.lights[0][3].unionall([box for _, _, _, box in self.lights[1:]]).clip(screen.get_rect())
+        if rect.width * rect.height > CULL_MAX_COVERAGE * self.screen_area:
+            return
+        self.rect = rect
+        screen.set_clip(self.rect)
+
+    def end(self, screen):
+        screen.set_clip(None)
+
+    def visible(self, rect):
+        #true if a screen rect can end up lit (touches a light's circle and its polygon's box), counts the ones that can't
+        if self.rect is None:
+            self.drawn += 1
+            return True
+        for x, y, radius, box in self.lights:
+            if not box.colliderect(rect):
+                continue
+            #closest point of the rect to the light
+            dx = max(rect.left - x, 0, x - rect.right)
+            dy = max(rect.top - y, 0, y - rect.bottom)
+            if dx * dx + dy * dy <= radius * radius:
+                self.drawn += 1
+                return True
+        self.culled += 1
+        return False
+
+    def summary(self):
+        if self.rect is None:
+            return "off (not fully dark, or the light covers most of the screen)"
+        area = 100 * self.rect.width * self.rect.height / self.screen_area
+        return f"{self.culled} draws culled, lit {self.rect.width}x{self.rect.height} ({area:.0f}% of screen)"
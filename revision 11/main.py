@@ -2,10 +2,12 @@ import pygame
 import sys
 from settings import *
 from player import Submarine
-from lighting import Lighting
+from lighting import Lighting, LightManager, DarknessCuller, LIGHT_MAP_SCALE
+from visibility import OccluderGrid, ShadowCaster
 from debug_menu import DebugMenu
-from seabed_generator import SeabedGenerator
-from objects import UnderwaterObject
+from seabed_generator import SeabedGenerator, CAVE_CELL_SIZE
+from objects import UnderwaterObject, draw_objects, surface_cache
+from scatter import Scatter
 from hud import HUD
 from cave_generator import CaveGenerator
 from skybox import SkyBox
@@ -55,13 +57,24 @@ def game_loop(actual_screen):
         amplitude=150,
         chunk_size=800,
         grid_size=5,
-        seed=42
+        seed=42,
+        backend="process",
+        store_path="saves/terrain",
+        mode="circles"  #or "contour" for marching squares polygons
     )
 
-    seabed = SeabedGenerator(scale=600, amplitude=1000, base_level=3000)
-    seabed.points = [(x, seabed.get_height(x)) for x in range(0, WIDTH)]
+    #caves are cut out of one seamless world-wide automaton, so ones that overlap share their walls
+    seabed = SeabedGenerator(scale=600, amplitude=1000, base_level=3000, tiled_caves=True)
     surface_overlay = SurfaceOverlay(WIDTH, 5, (135, 206, 250))
     light = Lighting(300, darkness_factor=2.0)
+    #spotlight + glowing enemies added up at 1 / LIGHT_MAP_SCALE resolution, [L] in the debug menu switches back
+    #to the full resolution spotlight
+    light_map = LightManager((WIDTH, HEIGHT), scale=LIGHT_MAP_SCALE)
+    #skips drawing whatever the dark will cover anyway
+    culler = DarknessCuller()
+
+    #rocks and flora on the terrain and seabed, terrain chunks get placed on the terrain's worker processes
+    scatter = Scatter(seed=42, terrain=terrain)
 
     skybox = SkyBox("assets/images/bg.PNG", WIDTH, 400)
 
@@ -76,13 +89,22 @@ def game_loop(actual_screen):
         Enemy(700, 200, 40, 40, speed=3, chase_radius=250)
     ]
 
-    settings = {"lighting": True, "speed": SUB_SPEED}
+    #objects block the spotlight, looked up through a bucket grid since they don't move
+    occluders = OccluderGrid()
+    for obj in objects:
+        occluders.insert(obj.rect, obj)
+    shadows = ShadowCaster()
+
+    settings = {"lighting": True, "shadows": False, "light_map": True, "speed": SUB_SPEED}
 
     window_width, window_height = actual_screen.get_size()
 
     while True:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
+                scatter.shutdown()
+                terrain.shutdown()
+                seabed.shutdown()
                 pygame.quit()
                 sys.exit()
             elif event.type == pygame.VIDEORESIZE:
@@ -94,12 +116,23 @@ def game_loop(actual_screen):
                 elif event.key == pygame.K_F9:
                     result = main_menu(render_surface)
                     if result == "quit":
+                        scatter.shutdown()
+                        terrain.shutdown()
+                        seabed.shutdown()
                         pygame.quit()
                         sys.exit()
                 debug_menu.handle_event(event, submarine, settings, seabed, light)
 
-        seabed_depth = max([height for _, height in seabed.points])
         submarine.speed = settings["speed"]
+        #floor right under the sub, widened by one step each way so it can't move into a slope this frame
+        seabed_depth = seabed.floor_under(
+            submarine.x - submarine.speed, submarine.x + submarine.width + submarine.speed
+        )
+        #inside a cave (where the debug teleport puts the sub) the cave's bottom is the floor instead
+        cave_floor = seabed.cave_floor(submarine.x, submarine.x + submarine.width, submarine.y)
+        if cave_floor is not None:
+            seabed_depth = cave_floor
+        settings["seabed_height"] = seabed_depth
         submarine.update(seabed_depth)
 
         #camera position is based on the submarine
@@ -107,36 +140,87 @@ def game_loop(actual_screen):
         camera_y = submarine.y
         camera_offset = (camera_x - WIDTH // 2, camera_y - HEIGHT // 2)
 
-        #update chunks based on the camera position
-        terrain.update_chunks((camera_x, camera_y))
+        #update chunks based on the camera position, the camera follows the sub so its velocity drives the prefetch
+        terrain.update_chunks((camera_x, camera_y), (submarine.vx, submarine.vy))
+        settings["chunk_cache"] = terrain.cache.summary()
+        settings["chunk_prefetch"] = terrain.prefetch_summary()
+        settings["chunk_jobs"] = terrain.backend.summary()
+        #caves stream in around the camera on their own thread
+        seabed.update_caves(camera_x)
+        settings["caves"] = seabed.cave_summary()
+        scatter.update(terrain, seabed, camera_offset, (WIDTH, HEIGHT))
+
+        #light and shadows first, at full darkness only the area they reach is worth drawing
+        overlay_alpha = 0
+        lit = []
+        if settings["lighting"]:
+            light.refresh()
+            light_x = submarine.x + submarine.width // 2
+            light_y = submarine.y + submarine.height // 2
+            screen_light_x = light_x - camera_offset[0]
+            screen_light_y = light_y - camera_offset[1]
+            overlay_alpha = get_overlay_alpha(submarine.y, min_depth=400, max_depth=1500)
+            visibility = None
+            if settings["shadows"] and overlay_alpha > 0:
+                #light only reaches as far as the first thing in the way
+                polygon = shadows.update((light_x, light_y), light.current_radius, occluders, terrain, seabed)
+                if polygon is not None:
+                    visibility = (polygon - camera_offset).tolist()
+                settings["shadow_stats"] = shadows.summary()
+            #the light map gets scaled up smoothly, so its light bleeds out a couple of its pixels
+            padding = 2 * light_map.scale_for(1 + len(enemies)) if settings["light_map"] else 0
+            lit.append(((screen_light_x, screen_light_y), light.current_radius, visibility, padding))
+
+        for enemy in enemies:
+            enemy.update(submarine, camera_offset)
+            if settings["lighting"] and settings["light_map"]:
+                glow = (enemy.rect.centerx - camera_offset[0], enemy.rect.centery - camera_offset[1])
+                lit.append((glow, ENEMY_GLOW_RADIUS, None, padding))
 
         #draw everything to the fixed-size render surface
+        culler.begin(render_surface, overlay_alpha, lit)
         render_surface.fill(BG_COLOR)
         skybox.draw(render_surface, camera_offset, submarine.y)
         terrain.draw(render_surface, camera_offset)
-        seabed.draw(render_surface, camera_offset, cell_size=8)
+        seabed.draw(render_surface, camera_offset, cell_size=CAVE_CELL_SIZE)
+        settings["seabed_vertices"] = seabed.fill_vertices
+        scatter.draw(render_surface, camera_offset, terrain.chunk_size)
+        settings["decorations"] = scatter.summary()
         submarine.draw(render_surface, camera_offset)
         surface_overlay.draw(render_surface, camera_offset[1])
 
         for enemy in enemies:
-            enemy.update(submarine, camera_offset)
-            enemy.draw(render_surface, camera_offset)
-
-        for obj in objects:
-            obj.draw(
-                render_surface,
-                camera_offset,
-                (submarine.x + submarine.width // 2, submarine.y + submarine.height // 2),
-                light
-            )
+            if culler.visible(enemy.rect.move(-camera_offset[0], -camera_offset[1])):
+                enemy.draw(render_surface, camera_offset)
+
+        #objects share cached surfaces per size / color / alpha and go out in one blits call
+        settings["objects_drawn"] = draw_objects(
+            render_surface,
+            [obj for obj in objects if culler.visible(obj.rect.move(-camera_offset[0], -camera_offset[1]))],
+            camera_offset,
+            (submarine.x + submarine.width // 2, submarine.y + submarine.height // 2),
+            light
+        )
+        culler.end(render_surface)
+        culler.culled += terrain.culled + seabed.culled
+        settings["culling"] = culler.summary()
+        settings["object_cache"] = surface_cache.summary()
 
         if settings["lighting"]:
-            light_x = submarine.x + submarine.width // 2
-            light_y = submarine.y + submarine.height // 2
-            screen_light_x = light_x - camera_offset[0]
-            screen_light_y = light_y - camera_offset[1]
-            overlay_alpha = get_overlay_alpha(submarine.y, min_depth=400, max_depth=1500)
-            light.draw(render_surface, (screen_light_x, screen_light_y), overlay_alpha=overlay_alpha)
+            if settings["light_map"]:
+                light_map.clear()
+                light_map.add_spotlight(light, (screen_light_x, screen_light_y), visibility)
+                for enemy in enemies:
+                    light_map.add(
+                        (enemy.rect.centerx - camera_offset[0], enemy.rect.centery - camera_offset[1]),
+                        ENEMY_GLOW_RADIUS, ENEMY_GLOW_COLOR, darkness_factor=1.5
+                    )
+                light_map.draw(render_surface, overlay_alpha=overlay_alpha)
+                settings["light_map_stats"] = f"{light_map.drawn}/{len(light_map.lights)} lights at 1/{light_map.scale}"
+                shadows.record_mask(light_map.mask_ms)
+            else:
+                light.draw(render_surface, (screen_light_x, screen_light_y), overlay_alpha=overlay_alpha, visibility=visibility)
+                shadows.record_mask(light.mask_ms)
 
         for enemy in enemies:
             enemy.check_collision(submarine)
@@ -1,4 +1,59 @@
 import pygame
+import numpy as np
+from collections import OrderedDict
+
+#object alpha is rounded to multiples of this, anything that rounds to 0 isn't drawn at all
+ALPHA_STEP = 8
+#filled surfaces kept around for recent (size, color, alpha) combos
+SURFACE_CACHE_SIZE = 1024
+
+
+def alpha_bucket(visibility):
+    #0..255 float visibility -> nearest multiple of ALPHA_STEP (capped at 255)
+    return min(255, int(visibility / ALPHA_STEP + 0.5) * ALPHA_STEP)
+
+
+def alpha_buckets(visibility):
+    #alpha_bucket over a numpy array
+    return np.minimum(255, (visibility / ALPHA_STEP + 0.5).astype(np.int64) * ALPHA_STEP)
+
+
+class ObjectSurfaceCache:
+
+    #plain surfaces filled with a color and given a surface alpha, shared by every object of that size / color / alpha bucket
+    #(a surface alpha on an opaque surface blits the same as a filled SRCALPHA one, just cheaper)
+
+    def __init__(self, capacity=SURFACE_CACHE_SIZE):
+        self.capacity = capacity
+        #(size, color, alpha) -> surface, least recently used first
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, size, color, alpha):
+        key = (size, color, alpha)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+        self.misses += 1
+        surface = pygame.Surface(size)
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert()
+        surface.fill(color)
+        surface.set_alpha(alpha)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.capacity:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def summary(self):
+        return f"{len(self.surfaces)} surfaces, hit {self.hits} / miss {self.misses}"
+
+
+#shared by every UnderwaterObject unless a draw gets its own
+surface_cache = ObjectSurfaceCache()
 
 
 class UnderwaterObject:
@@ -7,21 +62,40 @@ class UnderwaterObject:
         self.y = y
         self.width = width
         self.height = height
-        self.color = color
+        self.color = tuple(color[:3])
         self.rect = pygame.Rect(self.x, self.y, self.width, self.height)
 
-    def draw(self, screen, offset, light_position, lighting):
-        screen_x = self.x - offset[0]
-        screen_y = self.y - offset[1]
-
+    def sprite(self, light_position, lighting, cache=surface_cache):
+        #cached surface for how lit the object is right now, None when it's too dark to see
         dx = self.x - light_position[0]
         dy = self.y - light_position[1]
         distance = (dx ** 2 + dy ** 2) ** 0.5
 
-        visibility = lighting.calculate_visibility(distance)
+        alpha = alpha_bucket(lighting.calculate_visibility(distance))
+        if alpha == 0:
+            return None
+        return cache.get((self.width, self.height), self.color, alpha)
+
+    def draw(self, screen, offset, light_position, lighting, cache=surface_cache):
+        surface = self.sprite(light_position, lighting, cache)
+        if surface is not None:
+            screen.blit(surface, (self.x - offset[0], self.y - offset[1]))
+
 
-        visible_color = (*self.color[:3], int(visibility)) 
+def draw_objects(screen, objects, offset, light_position, lighting, cache=surface_cache):
+    #every object in one Surface.blits call, skipping the ones too dark to see. returns how many got drawn
+    #the alphas are worked out for all of them at once, same values as sprite() gives one by one
+    if not objects:
+        return 0
+    xs = np.array([obj.x for obj in objects], dtype=np.float64)
+    ys = np.array([obj.y for obj in objects], dtype=np.float64)
+    distances = np.hypot(xs - light_position[0], ys - light_position[1])
+    alphas = alpha_buckets(lighting.calculate_visibility_array(distances))
 
-        object_surface = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
-        object_surface.fill(visible_color)
-        screen.blit(object_surface, (screen_x, screen_y))
+    batch = []
+    for index in np.flatnonzero(alphas).tolist():
+        obj = objects[index]
+        surface = cache.get((obj.width, obj.height), obj.color, int(alphas[index]))
+        batch.append((surface, (obj.x - offset[0], obj.y - offset[1])))
+    screen.blits(batch, doreturn=False)
+    return len(batch)
@@ -10,6 +10,9 @@ class Submarine:
         self.y = y
         self.width, self.height = SUB_SIZE
         self.speed = SUB_SPEED
+        #movement over the last update, in pixels per frame
+        self.vx = 0
+        self.vy = 0
 
         self.oxygen = 100
         self.power = 100
@@ -23,6 +26,7 @@ class Submarine:
         self.invincible_duration = 1000  #duration in ms
 
     def update(self, seabed_height):
+        start_x, start_y = self.x, self.y
         keys = pygame.key.get_pressed()
         if keys[pygame.K_LEFT]:
             self.x -= self.speed
@@ -39,9 +43,11 @@ class Submarine:
 
         self.consume_oxygen(0.005)
 
-        #clamp pos. to between surface and seabed
+        #clamp pos. to between surface and seabed (seabed_height is the floor under the sub)
         self.y = max(0, min(self.y, seabed_height - self.height))
         self.rect.topleft = (self.x, self.y)
+        self.vx = self.x - start_x
+        self.vy = self.y - start_y
 
         #update invince timer
         if self.invincible and pygame.time.get_ticks() > self.invincible_timer:
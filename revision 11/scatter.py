@@ -0,0 +1,380 @@
+# scatter.py
+#decoration (rocks and flora) scattered over the terrain chunks and along the seabed
+#
+#placement is poisson disk sampling seeded from the chunk key (or seabed span), so a chunk always gets the same
+#decorations no matter when or how often it's loaded. terrain chunks are placed on the terrain's own chunk backend
+#(ChunkPlacer on a shared lane) from the features the terrain already has, the main thread only picks up the
+#finished arrays. instances live in one numpy array per chunk / span
+#(DECORATION_DTYPE) and every sprite is scaled once up front, drawing is one blits call over the instances on screen
+
+import math
+
+import numpy as np
+import pygame
+
+from terrain_features import CONTOUR_DTYPE, chunk_bounds, chunk_circles, chunk_loops
+from geometry import polygon_area
+from vector_noise import position_hash
+
+DECORATION_DTYPE = np.dtype([
+    ("x", "<i4"),       #world position of the sprite's base
+    ("y", "<i4"),
+    ("sprite", "u1"),   #index into DecorationSprites.names
+    ("scale", "u1"),    #index into SCALE_STEPS
+])
+
+ROCK_PATH = "assets/textures/rock1.png"
+#size steps every sprite is pre-scaled to
+SCALE_STEPS = (0.5, 0.75, 1.0, 1.25)
+#min distance between decorations on the terrain, and between them along the seabed
+SCATTER_RADIUS = 28
+SEABED_SPACING = 36
+#seabed decorations come in spans of this many world columns
+SEABED_SPAN = 1024
+#terrain samples up to this far under a surface get moved up onto it, deeper ones are dropped
+SURFACE_DEPTH = 32
+#a surface spot needs ground this far to either side of it (a few px down), so nothing sits on a steep side
+SURFACE_SPREAD = 5
+#dart throwing rounds per phase of the poisson disk sampler, more fills the gaps a bit better
+SCATTER_ROUNDS = 3
+#position_hash y for seabed spans, terrain chunk keys are multiples of the chunk size so they never hit it
+SEABED_ROW = -1
+
+#sprite mix per surface, probabilities line up with DecorationSprites.names
+TERRAIN_MIX = {"rock": 0.35, "kelp": 0.0, "tuft": 0.65}
+SEABED_MIX = {"rock": 0.3, "kelp": 0.4, "tuft": 0.3}
+
+
+#5x5 cell neighbourhood (shifted by the grid padding) minus the corners, those are at least radius away
+_AROUND_X, _AROUND_Y = (np.array(axis) + 2 for axis in zip(*(
+    (dx, dy) for dx in range(-2, 3) for dy in range(-2, 3) if abs(dx) + abs(dy) < 4
+)))
+
+
+def poisson_disk(rng, width, height, radius, rounds=SCATTER_ROUNDS):
+
+    #(n, 2) points in [0, width) x [0, height), no two closer than radius
+    #parallel dart throwing on a grid of radius / sqrt(2) cells (one point per cell at most): cells are split
+    #into 9 phases by (x % 3, y % 3), cells of one phase are 2+ cells apart so all of them can throw at once
+    #and only have to check the points already in their 5x5 neighbourhood
+
+    cell = radius / math.sqrt(2)
+    nx, ny = int(math.ceil(width / cell)), int(math.ceil(height / cell))
+    #accepted points per cell, nan = empty, padded by 2 so the neighbourhood lookups never go out of range
+    px = np.full((nx + 4, ny + 4), np.nan)
+    py = np.full((nx + 4, ny + 4), np.nan)
+    gx, gy = np.meshgrid(np.arange(nx), np.arange(ny), indexing="ij")
+    phases = [(gx[(gx % 3 == i) & (gy % 3 == j)], gy[(gx % 3 == i) & (gy % 3 == j)]) for i in range(3) for j in range(3)]
+    radius_sq = radius * radius
+
+    for _ in range(rounds):
+        for cells_x, cells_y in phases:
+            empty = np.isnan(px[cells_x + 2, cells_y + 2])
+            cells_x, cells_y = cells_x[empty], cells_y[empty]
+            x = (cells_x + rng.random(len(cells_x))) * cell
+            y = (cells_y + rng.random(len(cells_y))) * cell
+            around_x = cells_x[:, None] + _AROUND_X
+            around_y = cells_y[:, None] + _AROUND_Y
+            close = (px[around_x, around_y] - x[:, None]) ** 2 + (py[around_x, around_y] - y[:, None]) ** 2 < radius_sq
+            #nan compares false, empty cells never block
+            ok = (x < width) & (y < height) & ~close.any(axis=1)
+            px[cells_x[ok] + 2, cells_y[ok] + 2] = x[ok]
+            py[cells_x[ok] + 2, cells_y[ok] + 2] = y[ok]
+
+    filled = ~np.isnan(px)
+    return np.stack((px[filled], py[filled]), axis=-1)
+
+
+def poisson_disk_1d(rng, length, spacing):
+    #positions in [spacing / 2, length - spacing / 2), neighbours at least spacing apart (and across span edges too)
+    count = int(length // spacing) + 1
+    gaps = spacing + rng.exponential(spacing * 0.5, count)
+    xs = spacing * 0.5 + rng.random() * spacing + np.concatenate(([0.0], np.cumsum(gaps)[:-1]))
+    return xs[xs < length - spacing * 0.5]
+
+
+def decoration_array(rng, xs, ys, ids, p):
+    #DECORATION_DTYPE instances at xs / ys, sprites drawn from ids with probabilities p and a random scale each
+    decorations = np.zeros(len(xs), dtype=DECORATION_DTYPE)
+    decorations["x"] = xs
+    decorations["y"] = ys
+    decorations["sprite"] = rng.choice(ids, len(xs), p=p)
+    decorations["scale"] = rng.integers(0, len(SCALE_STEPS), len(xs))
+    return decorations
+
+
+def terrain_mask(features):
+
+    #((left, top), bool array indexed [x, y]) of the pixels a chunk's terrain covers, same box bake_steps uses,
+    #None for an empty chunk. circles are stamped with numpy one radius at a time (there's only a handful of radii),
+    #contour loops are filled the way the bake does it, biggest first with holes punched back out.
+    #either way it's the same pixels as the baked surface
+
+    bounds = chunk_bounds(features)
+    if bounds is None:
+        return None
+    left, top, right, bottom = bounds
+    if features.dtype == CONTOUR_DTYPE:
+        surface = pygame.Surface((right - left, bottom - top), depth=8)
+        loops = sorted(((polygon_area(points), points) for points in chunk_loops(features)), key=lambda loop: -abs(loop[0]))
+        for area, points in loops:
+            pygame.draw.polygon(surface, 1 if area < 0 else 0, (points - (left, top)).tolist())
+        return (left, top), pygame.surfarray.array2d(surface) != 0
+
+    mask = np.zeros((right - left, bottom - top), dtype=bool)
+    circles = chunk_circles(features) - (left, top, 0)
+    for radius in np.unique(circles[:, 2]).tolist():
+        centers = circles[circles[:, 2] == radius]
+        dx, dy = _disk(radius)
+        mask[centers[:, 0, None] + dx, centers[:, 1, None] + dy] = True
+    return (left, top), mask
+
+
+def _disk(radius):
+    #pixel offsets pygame.draw.circle fills around its center, it isn't quite x^2 + y^2 <= r^2
+    surface = pygame.Surface((2 * radius + 2, 2 * radius + 2), depth=8)
+    pygame.draw.circle(surface, 1, (radius + 1, radius + 1), radius)
+    dx, dy = np.nonzero(pygame.surfarray.array2d(surface))
+    return dx - radius - 1, dy - radius - 1
+
+
+class PlaceRequest:
+
+    #backend key for placing one chunk: its key plus the features the terrain delivered for it, so the job never
+    #has to regenerate them. equal / hashed by the chunk key alone, re-scheduling a chunk only updates its priority
+
+    __slots__ = ("chunk_key", "features")
+
+    def __init__(self, chunk_key, features):
+        self.chunk_key = chunk_key
+        self.features = features
+
+    def __eq__(self, other):
+        return isinstance(other, PlaceRequest) and self.chunk_key == other.chunk_key
+
+    def __hash__(self):
+        return hash(self.chunk_key)
+
+
+class ChunkPlacer:
+
+    #terrain decoration placement as a chunk backend job, nothing in here touches the display so it pickles over
+    #to worker processes
+
+    def __init__(self, seed, radius, chunk_size, ids, p):
+        self.seed = seed
+        self.radius = radius
+        self.chunk_size = chunk_size
+        self.ids = ids
+        self.p = p
+
+    def place_chunks(self, requests):
+        #job for the chunk backends, one DECORATION_DTYPE array per PlaceRequest
+        return [self.place(request.chunk_key, request.features) for request in requests]
+
+    def place(self, chunk_key, features):
+
+        #decorations on the upward facing surfaces of a chunk's terrain
+        #samples stay radius / 2 inside the chunk so neighbouring chunks keep their distance too,
+        #ones a little way inside the terrain get moved straight up onto its surface
+
+        rng = np.random.default_rng(position_hash(self.seed, chunk_key[0], chunk_key[1]))
+        points = poisson_disk(rng, self.chunk_size - self.radius, self.chunk_size - self.radius, self.radius)
+        covered = terrain_mask(features)
+        if covered is None:
+            return np.zeros(0, dtype=DECORATION_DTYPE)
+        (left, top), pixels = covered
+        xs = (points[:, 0] + chunk_key[0] + self.radius / 2).astype(np.int64) - left
+        ys = (points[:, 1] + chunk_key[1] + self.radius / 2).astype(np.int64) - top
+        width, height = pixels.shape
+
+        def solid(x, y):
+            x, y = np.broadcast_arrays(x, y)
+            valid = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+            hit = np.zeros(x.shape, dtype=bool)
+            hit[valid] = pixels[x[valid], y[valid]]
+            return hit
+
+        keep = solid(xs, ys)
+        xs, ys = xs[keep], ys[keep]
+        #first open pixel going up each column, within SURFACE_DEPTH
+        column = solid(xs[:, None], ys[:, None] - np.arange(SURFACE_DEPTH + 1))
+        opening = np.argmin(column, axis=1)
+        keep = ~column.all(axis=1)
+        xs, ys = xs[keep], ys[keep] - opening[keep] + 1
+        keep = solid(xs - SURFACE_SPREAD, ys + 3) & solid(xs + SURFACE_SPREAD, ys + 3)
+        return decoration_array(rng, xs[keep] + left, ys[keep] + top, self.ids, self.p)
+
+
+def _rock(texture, size, tint):
+    #the rock texture cut to a flat topped dome and darkened to the terrain's tones
+    rock = pygame.transform.smoothscale(texture, size)
+    rock.fill(tint, special_flags=pygame.BLEND_RGB_MULT)
+    shape = pygame.Surface(size, pygame.SRCALPHA)
+    shape.fill((255, 255, 255, 0))
+    pygame.draw.ellipse(shape, (255, 255, 255, 255), (0, 0, size[0], size[1] * 2))
+    rock.blit(shape, (0, 0), special_flags=pygame.BLEND_RGBA_MIN)
+    return rock
+
+
+def _kelp(height, color):
+    #a few wavy strands
+    surface = pygame.Surface((18, height), pygame.SRCALPHA)
+    for strand, phase in enumerate((0.0, 2.1, 4.2)):
+        top = height * (0.2 + 0.25 * strand)
+        points = [
+            (9 + 3 * math.sin(y / 6 + phase) * (height - y) / height, y)
+            for y in np.linspace(top, height - 1, 12)
+        ]
+        pygame.draw.lines(surface, color, False, points, 2)
+    return surface
+
+
+def _tuft(width, height, color):
+    #seagrass fanning out from the base
+    surface = pygame.Surface((width, height), pygame.SRCALPHA)
+    base = (width / 2, height - 1)
+    for blade in np.linspace(-1.0, 1.0, 7):
+        tip = (width / 2 + blade * (width / 2 - 1), (height - 1) * (0.1 + 0.3 * abs(blade)))
+        pygame.draw.line(surface, color, base, tip, 1)
+    return surface
+
+
+class DecorationSprites:
+
+    #every decoration sprite at every SCALE_STEPS size, made once. variant index = sprite * len(SCALE_STEPS) + scale
+
+    def __init__(self, rock_path=ROCK_PATH):
+        texture = pygame.image.load(rock_path)
+        if pygame.display.get_surface() is not None:
+            texture = texture.convert_alpha()
+        bases = {
+            "rock": _rock(texture, (40, 22), (150, 130, 110)),
+            "kelp": _kelp(56, (40, 120, 60)),
+            "tuft": _tuft(24, 16, (70, 140, 90)),
+        }
+        self.names = list(bases)
+        self.variants = []
+        anchors = []
+        for name in self.names:
+            base = bases[name]
+            for scale in SCALE_STEPS:
+                size = (max(1, round(base.get_width() * scale)), max(1, round(base.get_height() * scale)))
+                variant = pygame.transform.smoothscale(base, size)
+                if pygame.display.get_surface() is not None:
+                    variant = variant.convert_alpha()
+                self.variants.append(variant)
+                #base center, sunk a couple of pixels so it sits in the ground
+                anchors.append((size[0] // 2, size[1] - 2, size[0], size[1]))
+        #(variants, 4) anchor x, anchor y, width, height
+        self.anchors = np.array(anchors, dtype=np.int64)
+        self.largest = int(self.anchors[:, 2:].max())
+
+    def mix(self, weights):
+        #sprite ids and their probabilities for rng.choice
+        p = np.array([weights.get(name, 0.0) for name in self.names])
+        return np.arange(len(self.names)), p / p.sum()
+
+
+class Scatter:
+
+    #decorations for the loaded terrain chunks and the seabed spans around the camera
+    #pass the terrain to get terrain decorations, they're placed on a lane of its chunk backend
+
+    def __init__(self, seed, sprites=None, radius=SCATTER_RADIUS, spacing=SEABED_SPACING, terrain=None):
+        self.seed = seed
+        self.sprites = sprites if sprites is not None else DecorationSprites()
+        self.radius = radius
+        self.spacing = spacing
+        #terrain chunk key -> DECORATION_DTYPE array, follows the terrain's baked chunks
+        self.terrain_chunks = {}
+        #placements back from the backend for chunks that are loaded but maybe not baked yet
+        self.placed = {}
+        #what the backend was last asked for, chunk key -> priority
+        self.wanted = {}
+        #seabed span index -> DECORATION_DTYPE array
+        self.seabed_spans = {}
+        #instances drawn last frame, for the debug menu
+        self.drawn = 0
+        self.placer = None
+        self.lane = None
+        if terrain is not None:
+            self.placer = ChunkPlacer(seed, radius, terrain.chunk_size, *self.sprites.mix(TERRAIN_MIX))
+            self.lane = terrain.backend.share(self.placer.place_chunks)
+
+    def shutdown(self):
+        #only cancels what's still queued, the backend itself belongs to the terrain
+        if self.lane is not None:
+            self.lane.shutdown()
+
+    def instances(self, rng, xs, ys, weights):
+        return decoration_array(rng, xs, ys, *self.sprites.mix(weights))
+
+    def scatter_span(self, span, seabed):
+        #decorations along the seabed surface over world columns [span * SEABED_SPAN, (span + 1) * SEABED_SPAN)
+        rng = np.random.default_rng(position_hash(self.seed, span, SEABED_ROW))
+        xs = (span * SEABED_SPAN + poisson_disk_1d(rng, SEABED_SPAN, self.spacing)).astype(np.int64)
+        return self.instances(rng, xs, seabed.get_heights(xs), SEABED_MIX)
+
+    def update(self, terrain, seabed, offset, view_size):
+
+        #ask the backend for every loaded terrain chunk that isn't placed yet (closest first, with the features
+        #it was delivered with), pick up what's done and show the ones whose terrain is baked.
+        #seabed spans around the view are placed right here, they're cheap
+
+        if self.lane is not None:
+            for chunk_key in [key for key in self.placed if key not in terrain.chunk_rects]:
+                del self.placed[chunk_key]
+            wanted = {
+                PlaceRequest(key, terrain.chunk_grid[key]): terrain.chunk_priority(key)
+                for key in terrain.chunk_rects if key not in self.placed
+            }
+            if wanted != self.wanted:
+                self.wanted = wanted
+                self.lane.schedule(wanted)
+            for request, decorations in self.lane.poll():
+                if request.chunk_key in terrain.chunk_rects:
+                    self.placed[request.chunk_key] = decorations
+                    self.wanted.pop(request, None)
+            self.terrain_chunks = {key: decorations for key, decorations in self.placed.items()
+                                   if key in terrain.chunk_surfaces}
+
+        first = int(offset[0] // SEABED_SPAN) - 1
+        last = int((offset[0] + view_size[0]) // SEABED_SPAN) + 1
+        for span in [span for span in self.seabed_spans if not first <= span <= last]:
+            del self.seabed_spans[span]
+        for span in range(first, last + 1):
+            if span not in self.seabed_spans:
+                self.seabed_spans[span] = self.scatter_span(span, seabed)
+
+    def draw(self, screen, offset, chunk_size):
+        #every instance overlapping the screen's clip rect, in one blits call
+        clip = screen.get_clip()
+        view = clip.move(int(offset[0]), int(offset[1])).inflate(2 * self.sprites.largest, 2 * self.sprites.largest)
+        batches = [
+            decorations for (chunk_x, chunk_y), decorations in self.terrain_chunks.items()
+            if len(decorations) and view.colliderect((chunk_x, chunk_y, chunk_size, chunk_size))
+        ]
+        batches.extend(
+            decorations for span, decorations in self.seabed_spans.items()
+            if len(decorations) and view.colliderect((span * SEABED_SPAN, view.top, SEABED_SPAN, view.height))
+        )
+        self.drawn = 0
+        if not batches:
+            return
+        decorations = np.concatenate(batches)
+
+        variant = decorations["sprite"].astype(np.int64) * len(SCALE_STEPS) + decorations["scale"]
+        anchors = self.sprites.anchors[variant]
+        x = decorations["x"] - int(offset[0]) - anchors[:, 0]
+        y = decorations["y"] - int(offset[1]) - anchors[:, 1]
+        visible = ((x < clip.right) & (x + anchors[:, 2] > clip.left)
+                   & (y < clip.bottom) & (y + anchors[:, 3] > clip.top))
+        surfaces = list(map(self.sprites.variants.__getitem__, variant[visible].tolist()))
+        screen.blits(zip(surfaces, zip(x[visible].tolist(), y[visible].tolist())), doreturn=False)
+        self.drawn = len(surfaces)
+
+    def summary(self):
+        count = sum(map(len, self.terrain_chunks.values())) + sum(map(len, self.seabed_spans.values()))
+        return (f"{self.drawn} drawn / {count} loaded "
+                f"({len(self.terrain_chunks)} chunks, {len(self.seabed_spans)} seabed spans)")
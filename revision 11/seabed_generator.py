@@ -1,18 +1,374 @@
 import pygame
 import noise
-from settings import WIDTH, HEIGHT
-from cave_generator import CaveGenerator
-import random
+import numpy as np
+from settings import WIDTH, HEIGHT, SUB_SIZE
+from cave_generator import CaveGenerator, CaveTiles, OpenCellIndex, MIN_REGION_CELLS
+from chunk_workers import create_backend
+from vector_noise import pnoise1_array, position_hash, hash_uniform
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from geometry import rdp
+
+#columns computed past the requested span whenever the heightfield has to grow, so scrolling
+#only hits the noise every HEIGHTFIELD_MARGIN / speed frames
+HEIGHTFIELD_MARGIN = 256
+#low points: spacing of the candidate columns (also the neighbour window radius),
+#the smallest depth worth keeping and the width of the spans the index scans at a time
+LOW_POINT_STEP = 10
+#(the game's seabed is smooth enough that depths past ~5 px never show up, see CAVE_MIN_DEPTH)
+LOW_POINT_MIN_DEPTH = 3
+LOW_POINT_BLOCK = 320
+#seabed fill LOD: max distance (px) the simplified outline may stray from the per-column one,
+#and the width of the world blocks it's simplified / cached in
+LOD_TOLERANCE = 1.0
+LOD_BLOCK = 256
+
+#caves: width of the world x chunks they're placed / streamed in (a multiple of LOW_POINT_STEP so chunk scans
+#see the same candidates as the low point index), chunks kept loaded on each side of the camera,
+#depth a low point needs to get a cave, percent chance per low point, and cave size in cells
+CAVE_CHUNK = 4 * LOW_POINT_BLOCK
+CAVE_RADIUS = 2
+CAVE_MIN_DEPTH = 3
+CAVE_CHANCE = 20
+CAVE_SIZE = (50, 50)
+#pixels per cave cell (what main draws them at), and the cells the sub needs to fit (see CaveGenerator.analyze)
+CAVE_CELL_SIZE = 8
+CAVE_CLEARANCE = (-(-SUB_SIZE[0] // CAVE_CELL_SIZE), -(-SUB_SIZE[1] // CAVE_CELL_SIZE))
+
+SEABED_COLOR = (50, 100, 200)
+#background of the persistent seabed layer, see-through when it's blitted
+LAYER_COLORKEY = (255, 0, 255)
+
+
+def seabed_heights(xs, scale, amplitude, base_level, seed):
+    #seabed height for an array of world x, same values as noise.pnoise1 (pnoise1_array matches it exactly)
+    heights = pnoise1_array(np.asarray(xs) / scale, octaves=4, persistence=0.5, lacunarity=2.0, base=seed)
+    return (heights * amplitude + base_level).astype(np.int64)
+
+
+def scan_low_points(heights, x0, x1, step, min_depth):
+
+    #low points among the candidates of world columns [x0, x1) (multiples of step)
+    #heights covers [x0 - step, x1 + step), a candidate is compared to the average of the step columns on each side
+    #returns (xs, heights, depths) arrays of the ones deeper than min_depth
+
+    sums = np.cumsum(np.concatenate(([0], heights)))
+    #window sums of 2 * step + 1 columns centred on every column of [x0, x1)
+    window = sums[2 * step + 1:] - sums[:-(2 * step + 1)]
+
+    offsets = np.arange((-x0) % step, x1 - x0, step)
+    current = heights[offsets + step]
+    #average of the neighbours, the centre column itself left out
+    average = (window[offsets] - current) / (2 * step)
+    depth = average - current
+    keep = depth > min_depth
+    return x0 + offsets[keep], current[keep], depth[keep]
+
+
+class Heightfield:
+
+    #ring buffer of seabed heights indexed by world x
+    #holds one contiguous span of columns [start, end), slot = x % capacity, so moving the span
+    #only overwrites the columns that fell out of it
+    #a min and a max segment tree over the slots answer range queries in O(log n), only the
+    #paths above freshly computed columns get rebuilt
+
+    def __init__(self, height_fn, capacity, margin=HEIGHTFIELD_MARGIN):
+        #height_fn: int64 array of world x -> int64 array of heights
+        self.height_fn = height_fn
+        self.capacity = capacity
+        self.margin = margin
+        self.buffer = np.zeros(capacity, dtype=np.int64)
+        #leaves at tree_size + slot, unused leaves never win a comparison
+        self.tree_size = 1 << (capacity - 1).bit_length()
+        self.max_tree = np.full(2 * self.tree_size, np.iinfo(np.int64).min, dtype=np.int64)
+        self.min_tree = np.full(2 * self.tree_size, np.iinfo(np.int64).max, dtype=np.int64)
+        self.start = 0
+        self.end = 0
+        #total columns pushed through height_fn, for the debug menu / benchmarks
+        self.computed = 0
+
+    def span(self, x0, x1):
+        #heights of world columns [x0, x1)
+        self.ensure(x0, x1)
+        return self.buffer[np.arange(x0, x1) % self.capacity]
+
+    def ensure(self, x0, x1):
+        if self.start <= x0 and x1 <= self.end:
+            return
+        if x1 - x0 > self.capacity:
+            raise ValueError(f"span of {x1 - x0} columns doesn't fit a heightfield of {self.capacity}")
+
+        if self.end <= self.start or x1 <= self.start or x0 >= self.end:
+            #nothing reusable (first call or a teleport)
+            margin = min(self.margin, (self.capacity - (x1 - x0)) // 2)
+            start, end = x0 - margin, x1 + margin
+        else:
+            #grow towards the request, dropping columns off the far side if it gets too wide
+            start = min(self.start, x0 - self.margin)
+            end = max(self.end, x1 + self.margin)
+            if end - start > self.capacity:
+                if x1 > self.end:
+                    start = end - self.capacity
+                else:
+                    end = start + self.capacity
+            start = min(start, x0)
+            end = max(end, x1)
+
+        #only the columns that weren't cached before
+        old_start, old_end = max(self.start, start), min(self.end, end)
+        if old_start < old_end:
+            fresh = np.concatenate((np.arange(start, old_start), np.arange(old_end, end)))
+        else:
+            fresh = np.arange(start, end)
+        if len(fresh):
+            slots = fresh % self.capacity
+            self.buffer[slots] = self.height_fn(fresh)
+            self.computed += len(fresh)
+            self._update_trees(slots)
+        self.start, self.end = start, end
+
+    def _update_trees(self, slots):
+        nodes = slots + self.tree_size
+        self.max_tree[nodes] = self.buffer[slots]
+        self.min_tree[nodes] = self.buffer[slots]
+        while nodes[0] > 1:
+            nodes = np.unique(nodes >> 1)
+            self.max_tree[nodes] = np.maximum(self.max_tree[2 * nodes], self.max_tree[2 * nodes + 1])
+            self.min_tree[nodes] = np.minimum(self.min_tree[2 * nodes], self.min_tree[2 * nodes + 1])
+
+    def _query(self, tree, reduce, x0, x1):
+        #reduce over the tree nodes covering world columns [x0, x1), split in two if it wraps the ring
+        self.ensure(x0, x1)
+        first = x0 % self.capacity
+        count = x1 - x0
+        if first + count <= self.capacity:
+            spans = ((first, first + count),)
+        else:
+            spans = ((first, self.capacity), (0, first + count - self.capacity))
+        values = []
+        for lo, hi in spans:
+            lo += self.tree_size
+            hi += self.tree_size
+            while lo < hi:
+                if lo & 1:
+                    values.append(tree[lo])
+                    lo += 1
+                if hi & 1:
+                    hi -= 1
+                    values.append(tree[hi])
+                lo >>= 1
+                hi >>= 1
+        return int(reduce(values))
+
+    def range_max(self, x0, x1):
+        #largest height (deepest floor, y grows downwards) in world columns [x0, x1)
+        return self._query(self.max_tree, max, x0, x1)
+
+    def range_min(self, x0, x1):
+        #smallest height (highest floor) in world columns [x0, x1)
+        return self._query(self.min_tree, min, x0, x1)
+
+    def heights(self, x0, x1):
+        #heights of [x0, x1) without moving the cached span, computed on the spot if it isn't cached
+        if self.start <= x0 and x1 <= self.end:
+            return self.buffer[np.arange(x0, x1) % self.capacity]
+        return self.height_fn(np.arange(x0, x1))
+
+    def invalidate(self):
+        self.start = self.end = 0
+
+
+class LowPointIndex:
+
+    #low points of the seabed in world x, kept sorted so range / nearest queries are a bisect
+    #a candidate every `step` columns (world aligned) is compared to the average of the `step` columns
+    #on each side, same test as the old find_low_points. the world is scanned in fixed blocks,
+    #each one once, the first time something asks about it
+
+    def __init__(self, heightfield, step=LOW_POINT_STEP, min_depth=LOW_POINT_MIN_DEPTH, block=LOW_POINT_BLOCK):
+        self.heightfield = heightfield
+        self.step = step
+        self.min_depth = min_depth
+        self.block = block - block % step
+        self.scanned = set()
+        #parallel lists sorted by x
+        self.xs = []
+        self.heights = []
+        self.depths = []
+
+    def cover(self, x0, x1):
+        #make sure every candidate in [x0, x1) has been scanned
+        for block in range(x0 // self.block, (x1 - 1) // self.block + 1):
+            if block not in self.scanned:
+                self.scanned.add(block)
+                self._scan(block * self.block, (block + 1) * self.block)
+
+    def _scan(self, x0, x1):
+        heights = self.heightfield.heights(x0 - self.step, x1 + self.step)
+        xs, current, depth = scan_low_points(heights, x0, x1, self.step, self.min_depth)
+        for x, height, point_depth in zip(xs.tolist(), current.tolist(), depth.tolist()):
+            index = bisect_left(self.xs, x)
+            self.xs.insert(index, x)
+            self.heights.insert(index, height)
+            self.depths.insert(index, point_depth)
+
+    def in_range(self, x0, x1, depth_threshold=LOW_POINT_MIN_DEPTH):
+        #(x, height) of the low points in [x0, x1) deeper than depth_threshold
+        self.cover(x0, x1)
+        lo = bisect_left(self.xs, x0)
+        hi = bisect_left(self.xs, x1)
+        return [
+            (x, height)
+            for x, height, depth in zip(self.xs[lo:hi], self.heights[lo:hi], self.depths[lo:hi])
+            if depth > depth_threshold
+        ]
+
+    def nearest(self, x, depth_threshold=LOW_POINT_MIN_DEPTH, search=8 * LOW_POINT_BLOCK):
+        #closest already scanned low point to x (within search columns), None if there isn't one
+        self.cover(x - search, x + search)
+        lo = bisect_left(self.xs, x - search)
+        hi = bisect_right(self.xs, x + search)
+        best = None
+        for index in range(lo, hi):
+            if self.depths[index] > depth_threshold:
+                if best is None or abs(self.xs[index] - x) < abs(self.xs[best] - x):
+                    best = index
+        if best is None:
+            return None
+        return self.xs[best], self.heights[best]
+
+
+class SeabedOutline:
+
+    #rdp simplified seabed outline, cached per fixed block of world columns
+    #each block includes the first column of the next one and keeps its end points,
+    #so neighbouring blocks join up exactly. blocks are only built when they first come into view
+
+    def __init__(self, heightfield, tolerance=LOD_TOLERANCE, block=LOD_BLOCK, max_blocks=32):
+        self.heightfield = heightfield
+        self.tolerance = tolerance
+        self.block = block
+        self.max_blocks = max_blocks
+        self.blocks = OrderedDict()  #block index -> (k, 2) int array of world (x, height), LRU order
+        self.built = 0
+
+    def span(self, x0, x1):
+        #outline vertices covering world columns [x0, x1) (the first / last can sit a bit outside)
+        parts = []
+        for block in range(x0 // self.block, (x1 - 1) // self.block + 1):
+            vertices = self.blocks.get(block)
+            if vertices is None:
+                vertices = self._build(block)
+                self.blocks[block] = vertices
+                if len(self.blocks) > self.max_blocks:
+                    self.blocks.popitem(last=False)
+            else:
+                self.blocks.move_to_end(block)
+            #shared end point with the previous block
+            parts.append(vertices if not parts else vertices[1:])
+        return np.concatenate(parts)
+
+    def _build(self, block):
+        x0 = block * self.block
+        xs = np.arange(x0, x0 + self.block + 1)
+        points = np.stack((xs, self.heightfield.heights(x0, x0 + self.block + 1)), axis=-1)
+        self.built += 1
+        return points[rdp(points.astype(np.float64), self.tolerance)]
+
+    def invalidate(self):
+        self.blocks.clear()
+
+
+class CaveChunkGenerator:
+
+    #job for the cave backend: world x chunk -> list of (x, y, cave) for the caves in it
+    #a cave can only sit on a low point, whether it gets one and its layout both come from hashing the
+    #point's position, so a chunk is the same every time it's generated (any order, any thread)
+    #heights are recomputed from the noise instead of going through the heightfield, which belongs to the main thread
+    #tiled: caves are cut out of one world-wide automaton (CaveTiles) at their world cells instead of each
+    #getting its own random grid, so caves that overlap share their walls
+
+    def __init__(self, scale, amplitude, base_level, seed, chunk_width=CAVE_CHUNK, chance=CAVE_CHANCE,
+                 cave_size=CAVE_SIZE, step=LOW_POINT_STEP, min_depth=CAVE_MIN_DEPTH, tiled=False):
+        self.scale = scale
+        self.amplitude = amplitude
+        self.base_level = base_level
+        self.seed = seed
+        self.chunk_width = chunk_width
+        self.chance = chance
+        self.cave_size = cave_size
+        self.step = step
+        self.min_depth = min_depth
+        #only generate_area is used, it doesn't touch the tile LRU so it's safe on the worker
+        self.tiles = CaveTiles(fill_percentage=45, smooth_iterations=3, seed=seed) if tiled else None
+
+    def generate_chunks(self, chunk_keys):
+        return [self.generate_chunk(chunk_key) for chunk_key in chunk_keys]
+
+    def generate_chunk(self, chunk_key):
+        x0 = chunk_key * self.chunk_width
+        x1 = x0 + self.chunk_width
+        xs = np.arange(x0 - self.step, x1 + self.step)
+        heights = seabed_heights(xs, self.scale, self.amplitude, self.base_level, self.seed)
+        low_xs, low_heights, _ = scan_low_points(heights, x0, x1, self.step, self.min_depth)
+
+        caves = []
+        for x, height in zip(low_xs.tolist(), low_heights.tolist()):
+            key = position_hash(self.seed, x, height)
+            if hash_uniform(key, 0) * 100 >= self.chance:
+                continue
+            cave = CaveGenerator(self.cave_size[0], self.cave_size[1], fill_percentage=45, smooth_iterations=3,
+                                 seed=position_hash(key, 1, 0))
+            #origin snapped to the cell grid, drawing / the open cell index / the tiled automaton all use it as is
+            cave_x = x // CAVE_CELL_SIZE * CAVE_CELL_SIZE
+            cave_y = height // CAVE_CELL_SIZE * CAVE_CELL_SIZE
+            if self.tiles is not None:
+                grid = self.tiles.generate_area(cave_x // CAVE_CELL_SIZE, cave_y // CAVE_CELL_SIZE, *self.cave_size)
+                #walls at edges, same as initialize_grid
+                grid[0, :] = 1
+                grid[-1, :] = 1
+                grid[:, 0] = 1
+                grid[:, -1] = 1
+                cave.grid = grid
+                cave.mark_dirty()
+            else:
+                cave.initialize_grid()
+                cave.smooth_cave()
+            cave.analyze(MIN_REGION_CELLS, CAVE_CLEARANCE)
+            caves.append((cave_x, cave_y, cave))
+        return caves
 
 
 class SeabedGenerator:
-    def __init__(self, scale, amplitude, base_level=None, seed=None):
+    def __init__(self, scale, amplitude, base_level=None, seed=None, lod_tolerance=LOD_TOLERANCE, tiled_caves=False):
         self.scale = scale
         self.amplitude = amplitude
         self.base_level = base_level if base_level is not None else 3000#min depthj
         self.seed = seed if seed is not None else 42
+        #caves of the loaded cave chunks, flat list of (world x, world y, cave)
         self.caves = []
-        self.points = []
+        #world x chunk index -> its caves, streamed around the camera by update_caves
+        self.cave_generator = CaveChunkGenerator(scale, amplitude, self.base_level, self.seed, tiled=tiled_caves)
+        self.cave_chunks = {}
+        self.cave_backend = None
+        self.cave_center = None
+        #world positions the sub fits at inside the loaded caves
+        self.open_cells = OpenCellIndex([])
+        #visible span plus a margin on each side (and room to grow by another margin before evicting)
+        self.heightfield = Heightfield(self.get_heights, WIDTH + 4 * HEIGHTFIELD_MARGIN)
+        self.low_points = LowPointIndex(self.heightfield)
+        #simplified fill outline, None draws one vertex per column
+        self.outline = SeabedOutline(self.heightfield, lod_tolerance) if lod_tolerance else None
+        #vertices in the last fill polygon(s), for the debug menu
+        self.fill_vertices = 0
+        #on screen caves skipped last draw for being outside the screen's clip rect
+        self.culled = 0
+        #screen sized layer holding the fill, scrolled with the camera so only exposed strips get drawn
+        self.layer = None
+        self.layer_offset = None
+        #screen rows [top, bottom) where the seabed outline can be, everything below is solid
+        self.layer_band = (0, HEIGHT)
 
 
     # def get_height(self, x):
@@ -29,77 +385,203 @@ class SeabedGenerator:
         height = height * self.amplitude + self.base_level
         return int(height)
 
+    def get_heights(self, xs):
+        #get_height over an array of world x
+        return seabed_heights(xs, self.scale, self.amplitude, self.base_level, self.seed)
 
+    def floor_under(self, x0, x1):
+        #highest floor point under world columns [x0, x1), what anything spanning them has to stay above
+        return self.heightfield.range_min(int(x0), int(x1))
 
-    def generate_caves(self, chance, cave_width, cave_height):
-        #make caves at low points
-        self.caves = []
+    def cave_floor(self, x0, x1, y):
+        #bottom of the loaded cave world columns [x0, x1) at world y are inside of, None outside every cave
+        #caves sit below the seabed, so inside one this is the floor instead of floor_under
+        for cave_x, cave_y, cave in self.caves:
+            if cave_x <= x0 and x1 <= cave_x + cave.width * CAVE_CELL_SIZE:
+                bottom = cave_y + cave.height * CAVE_CELL_SIZE
+                if cave_y <= y < bottom:
+                    return bottom
+        return None
 
-        #find low points
-        low_points = self.find_low_points(check_range=10, depth_threshold=10)
+    def deepest_floor(self, x0, x1):
+        #lowest floor point in world columns [x0, x1)
+        return self.heightfield.range_max(int(x0), int(x1))
 
-        # low_points = self.find_low_points(check_range=10, depth_threshold=50)
-        print(f"Found {len(low_points)} low points.")
 
 
-        for x, height in low_points:
-            if random.randint(0, 100) < chance:
-                print(f"Generating cave at low point ({x}, {height})")
-                cave = CaveGenerator(cave_width, cave_height, fill_percentage=45, smooth_iterations=3)
-                cave.initialize_grid()
-                cave.smooth_cave()
-                self.caves.append((x, height, cave))
+    def update_caves(self, camera_x):
+
+        #stream cave chunks around the camera: chunks within CAVE_RADIUS get generated on a background thread,
+        #chunks more than one past that get evicted (the gap stops a camera sitting on a border from thrashing)
+        #the backend is only started the first time this runs
+
+        if self.cave_backend is None:
+            self.cave_backend = create_backend("thread", self.cave_generator.generate_chunks, batch_size=1)
+
+        center = int(camera_x // self.cave_generator.chunk_width)
+        if center != self.cave_center:
+            self.cave_center = center
+            for chunk_key in [key for key in self.cave_chunks if abs(key - center) > CAVE_RADIUS + 1]:
+                del self.cave_chunks[chunk_key]
+            self._rebuild_caves()
+
+            #anything not wanted anymore gets cancelled, closest first
+            wanted = {
+                key: abs(key - center)
+                for key in range(center - CAVE_RADIUS, center + CAVE_RADIUS + 1)
+                if key not in self.cave_chunks
+            }
+            self.cave_backend.schedule(wanted)
+
+        finished = False
+        for chunk_key, caves in self.cave_backend.poll():
+            #chunks that got far away while they were being made are dropped
+            if abs(chunk_key - self.cave_center) <= CAVE_RADIUS + 1:
+                self.cave_chunks[chunk_key] = caves
+                finished = True
+        if finished:
+            self._rebuild_caves()
+
+    def _rebuild_caves(self):
+        self.caves = [cave for key in sorted(self.cave_chunks) for cave in self.cave_chunks[key]]
+        points = [cave.walkable * CAVE_CELL_SIZE + (cave_x, cave_y) for cave_x, cave_y, cave in self.caves]
+        self.open_cells = OpenCellIndex(np.concatenate(points) if points else [])
+
+    def nearest_open_cell(self, x, y):
+        #world (x, y) closest to a point where the sub fits inside a loaded cave (its top left), None without caves
+        return self.open_cells.nearest(int(x), int(y))
 
+    def cave_summary(self):
+        if self.cave_backend is None:
+            return f"{len(self.caves)} in {len(self.cave_chunks)} chunks, pending 0"
+        return (
+            f"{len(self.caves)} in {len(self.cave_chunks)} chunks, pending {self.cave_backend.pending()}, "
+            f"{self.cave_backend.summary()}"
+        )
 
+    def shutdown(self):
+        if self.cave_backend is not None:
+            self.cave_backend.shutdown()
 
-    def find_low_points(self, check_range=10, depth_threshold=50):
-        #find low points in the seabed by comparing each point to its neighbors
 
-        low_points = []
 
-        for x in range(check_range, WIDTH - check_range, check_range):
-            #get the height @ the current point
-            current_height = self.get_height(x)
+    def find_low_points(self, x0=0, x1=WIDTH, depth_threshold=50):
+        #low points in world columns [x0, x1), from the low point index
+        #(a point is low if it's more than depth_threshold above the average of its neighbours)
+        return self.low_points.in_range(x0, x1, depth_threshold)
 
-            #average height of neighboring points
-            neighbor_heights = [
-                self.get_height(x + offset) for offset in range(-check_range, check_range + 1) if offset != 0
-            ]
-            avg_neighbor_height = sum(neighbor_heights) / len(neighbor_heights)
 
-            #if current height is significantly lower than neighbors, mark it as a low point
-            if avg_neighbor_height - current_height > depth_threshold:
-                low_points.append((x, current_height))
 
-        return low_points
+    def reset_layer(self):
+        #force a full redraw of the seabed layer next frame (teleports)
+        self.layer_offset = None
 
+    def update_layer(self, offset):
 
+        #scroll the layer by the camera delta and only fill the strips that scrolled in
+        #big jumps (or reset_layer) redraw the whole thing
+
+        if self.layer is None:
+            self.layer = pygame.Surface((WIDTH, HEIGHT))
+            if pygame.display.get_surface() is not None:
+                self.layer = self.layer.convert()
+            self.layer.set_colorkey(LAYER_COLORKEY)
+
+        offset_x, offset_y = int(offset[0]), int(offset[1])
+        self.fill_vertices = 0
+        if self.layer_offset is None:
+            strips = [self.layer.get_rect()]
+        else:
+            dx = offset_x - self.layer_offset[0]
+            dy = offset_y - self.layer_offset[1]
+            if abs(dx) >= WIDTH or abs(dy) >= HEIGHT:
+                strips = [self.layer.get_rect()]
+            else:
+                self.layer.scroll(-dx, -dy)
+                strips = []
+                if dx > 0:
+                    strips.append(pygame.Rect(WIDTH - dx, 0, dx, HEIGHT))
+                elif dx < 0:
+                    strips.append(pygame.Rect(0, 0, -dx, HEIGHT))
+                if dy > 0:
+                    strips.append(pygame.Rect(0, HEIGHT - dy, WIDTH, dy))
+                elif dy < 0:
+                    strips.append(pygame.Rect(0, 0, WIDTH, -dy))
+        self.layer_offset = (offset_x, offset_y)
+
+        self.layer_band = self.outline_rows(offset_x, offset_x + WIDTH, offset_y)
+        for strip in strips:
+            #strips that are all water or all seabed are a plain fill, only ones crossing the outline need the polygon
+            top, bottom = self.outline_rows(offset_x + strip.left, offset_x + strip.right, offset_y)
+            if strip.top >= bottom:
+                self.layer.fill(SEABED_COLOR, strip)
+                continue
+            self.layer.fill(LAYER_COLORKEY, strip)
+            if strip.bottom <= top:
+                continue
+            self.layer.set_clip(strip)
+            self.draw_fill(self.layer, (offset_x, offset_y), offset_x + strip.left, offset_x + strip.right)
+            self.layer.set_clip(None)
+
+    def outline_rows(self, x0, x1, offset_y):
+        #screen rows [top, bottom) the fill outline can cross over world columns [x0, x1), from the range queries
+        #padded by the lod tolerance plus a couple of rows for polygon rasterization
+        pad = 2 + (int(np.ceil(self.outline.tolerance)) if self.outline is not None else 0)
+        top = self.floor_under(x0 - 1, x1 + 1) - offset_y - pad
+        bottom = self.deepest_floor(x0 - 1, x1 + 1) - offset_y + pad + 1
+        return max(0, min(HEIGHT, top)), max(0, min(HEIGHT, bottom))
+
+    def outline_points(self, x0, x1):
+        #(k, 2) world points along the seabed surface over columns [x0, x1), the lod outline when there is one
+        if self.outline is not None:
+            return self.outline.span(x0, x1).astype(np.float64)
+        xs = np.arange(x0, x1)
+        return np.stack((xs, self.heightfield.heights(x0, x1)), axis=-1).astype(np.float64)
+
+    def draw_fill(self, surface, offset, x0, x1):
+        #seabed fill polygon for world columns [x0, x1), closed along the bottom of the screen
+
+        if self.outline is not None:
+            #lod: cached simplified outline, its first / last vertex can sit a bit outside the span
+            polygon = (self.outline.span(x0, x1) - offset).tolist()
+        else:
+            #one vertex per column, plus one on each side so the edges of a strip line up with its neighbours
+            xs = np.arange(x0 - 1, x1 + 1)
+            heights = self.heightfield.heights(x0 - 1, x1 + 1)
+            polygon = np.stack((xs - offset[0], heights - offset[1]), axis=-1).tolist()
+        polygon.append((polygon[-1][0], HEIGHT))
+        polygon.append((polygon[0][0], HEIGHT))
+        self.fill_vertices += len(polygon)
+        pygame.draw.polygon(surface, SEABED_COLOR, polygon)
 
     def draw(self, screen, offset, cell_size):
         start_x = int(offset[0])
         end_x = start_x + WIDTH
 
-        screen_points = []
-        self.points = []
-        for world_x in range(start_x, end_x):
-            height = self.get_height(world_x)
-            self.points.append((world_x, height))
-            screen_x = world_x - offset[0]
-            screen_y = height - offset[1]
-            screen_points.append((screen_x, screen_y))
+        #heights come from the cached heightfield, only newly exposed columns hit the noise
+        self.heightfield.ensure(start_x, end_x)
 
-        if screen_points:
-            seabed_fill_polygon = screen_points.copy()
-            seabed_fill_polygon.append((WIDTH, HEIGHT))
-            seabed_fill_polygon.append((0, HEIGHT))
-            pygame.draw.polygon(screen, (50, 100, 200), seabed_fill_polygon)
+        #rows above the band are empty and rows below it are solid seabed, only the band needs the colorkey blit
+        self.update_layer(offset)
+        top, bottom = self.layer_band
+        if top < bottom:
+            screen.blit(self.layer, (0, top), pygame.Rect(0, top, WIDTH, bottom - top))
+        if bottom < HEIGHT:
+            screen.fill(SEABED_COLOR, (0, bottom, WIDTH, HEIGHT - bottom))
 
+        #caves on screen but outside its clip rect (the lit area, see DarknessCuller) are skipped and counted
+        screen_rect = screen.get_rect()
+        clip = screen.get_clip()
+        self.culled = 0
         for cave_x, cave_y, cave in self.caves:
-            cave_offset_x = (cave_x - offset[0]) // cell_size
-            cave_offset_y = (cave_y - offset[1]) // cell_size
-            cave.draw(screen, cell_size, offset=(cave_offset_x, cave_offset_y))
+            cave_rect = pygame.Rect(cave_x - offset[0], cave_y - offset[1], cave.width * cell_size, cave.height * cell_size)
+            if screen_rect.colliderect(cave_rect) and not clip.colliderect(cave_rect):
+                self.culled += 1
+                continue
+            #same origin the open cell index uses, not rounded to the cell grid relative to the camera
+            screen.blit(cave.bake(cell_size), cave_rect.topleft)
 
-        low_points = self.find_low_points()
+        low_points = self.find_low_points(start_x, end_x)
         for x, height in low_points:
             screen_x = x - offset[0]
             screen_y = height - offset[1]
@@ -11,6 +11,10 @@ SUB_SPEED = 5
 SUB_COLOR = (255, 255, 0) 
 SUB_SIZE = (40, 24)
 
+#enemies glow a little in the dark (only with the light map on)
+ENEMY_GLOW_RADIUS = 120
+ENEMY_GLOW_COLOR = (120, 20, 20)
+
 #colors
 WHITE = (255,255,255)
 BLACK = (0,0,0)
@@ -0,0 +1,99 @@
+# terrain_features.py
+#compact chunk representation: one record per terrain feature in a numpy structured array
+#the main circle is in world coords, the 12 fringe circles are stored relative to it.
+#the same records are written byte for byte by the chunk store
+#contour mode chunks are a flat list of polygon vertices instead, tagged with the loop they belong to
+
+import sys
+
+import numpy as np
+
+FRINGE_COUNT = 12
+
+FEATURE_DTYPE = np.dtype([
+    ("x", "<i4"),
+    ("y", "<i4"),
+    ("r", "<i2"),
+    ("fringe", "<i2", (FRINGE_COUNT, 3)),  #(dx, dy, radius)
+])
+
+CONTOUR_DTYPE = np.dtype([
+    ("x", "<i4"),
+    ("y", "<i4"),
+    ("loop", "<i4"),
+])
+
+
+def empty_chunk(dtype=FEATURE_DTYPE):
+    return np.zeros(0, dtype=dtype)
+
+
+def chunk_loops(chunk):
+    #contour chunk -> list of (k, 2) int arrays of world coords, one per loop
+    if len(chunk) == 0:
+        return []
+    points = np.stack((chunk["x"], chunk["y"]), axis=-1)
+    starts = np.flatnonzero(np.diff(chunk["loop"])) + 1
+    return np.split(points, starts)
+
+
+def chunk_circles(chunk):
+    #every circle of a chunk in world coords as an (n * 13, 3) int array, mains first then fringes
+    if len(chunk) == 0:
+        return np.zeros((0, 3), dtype=np.int64)
+    main = np.stack((chunk["x"], chunk["y"], chunk["r"]), axis=-1).astype(np.int64)
+    fringe = chunk["fringe"].astype(np.int64)
+    fringe[:, :, 0] += main[:, None, 0]
+    fringe[:, :, 1] += main[:, None, 1]
+    return np.concatenate((main, fringe.reshape(-1, 3)))
+
+
+def chunk_bounds(chunk):
+    #world space (left, top, right, bottom) covering every circle / polygon, None for an empty chunk
+    if len(chunk) == 0:
+        return None
+    if chunk.dtype == CONTOUR_DTYPE:
+        x, y = chunk["x"], chunk["y"]
+        return int(x.min()), int(y.min()), int(x.max()) + 1, int(y.max()) + 1
+    circles = chunk_circles(chunk)
+    x, y, r = circles[:, 0], circles[:, 1], circles[:, 2]
+    return int((x - r).min()), int((y - r).min()), int((x + r).max()) + 1, int((y + r).max()) + 1
+
+
+def chunk_to_dicts(chunk):
+    #the old list-of-dicts layout ({"main": (x, y, r), "fringe": [(x, y, r), ...]}), for debugging / comparisons
+    circles = chunk_circles(chunk)
+    count = len(chunk)
+    mains = list(map(tuple, circles[:count].tolist()))
+    fringe = list(map(tuple, circles[count:].tolist()))
+    return [
+        {"main": main, "fringe": fringe[i * FRINGE_COUNT:(i + 1) * FRINGE_COUNT]}
+        for i, main in enumerate(mains)
+    ]
+
+
+def dict_nbytes(features):
+    #python object size of the old list-of-dicts layout, ints over 256 counted since they aren't shared
+    total = sys.getsizeof(features)
+    for feature in features:
+        total += sys.getsizeof(feature)
+        for circle in [feature["main"]] + feature["fringe"]:
+            total += sys.getsizeof(circle)
+            total += sum(sys.getsizeof(value) for value in circle if not -5 <= value <= 256)
+        total += sys.getsizeof(feature["fringe"])
+    return total
+
+
+def memory_report(chunk):
+    #bytes used by a chunk as arrays vs what the same features cost as dicts of tuples
+    array_bytes = chunk.nbytes
+    if chunk.dtype == CONTOUR_DTYPE:
+        loops = len(np.unique(chunk["loop"]))
+        return {"vertices": len(chunk), "loops": loops, "array_bytes": array_bytes}
+    dict_bytes = dict_nbytes(chunk_to_dicts(chunk))
+    return {
+        "features": len(chunk),
+        "array_bytes": array_bytes,
+        "dict_bytes": dict_bytes,
+        "ratio": dict_bytes / array_bytes if array_bytes else 0.0,
+    }
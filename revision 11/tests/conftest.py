@@ -0,0 +1,36 @@
+# conftest.py
+#the game modules sit one folder up and load their assets relative to it
+
+import os
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+
+@pytest.fixture
+def display(monkeypatch):
+    #a display surface, sprites and baked chunks only convert once there is one
+    import pygame
+    from settings import WIDTH, HEIGHT
+
+    monkeypatch.chdir(ROOT)
+    pygame.display.init()
+    if pygame.display.get_surface() is None:
+        pygame.display.set_mode((WIDTH, HEIGHT))
+    return pygame.display.get_surface()
+
+
+def load_terrain(terrain, position):
+    #update_chunks until every grid chunk around position is delivered and baked
+    terrain.update_chunks(position)
+    while terrain.missing_chunks:
+        time.sleep(0.01)
+        terrain.update_chunks(position)
+    terrain.bake_pending(None)
+    return terrain
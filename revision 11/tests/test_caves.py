@@ -0,0 +1,75 @@
+# test_caves.py
+
+import time
+
+import numpy as np
+import pytest
+
+from cave_generator import CaveGenerator, CaveTiles, smooth_step
+from seabed_generator import CaveChunkGenerator, SeabedGenerator, CAVE_CELL_SIZE
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_numpy_smoothing_matches_the_list_version(seed):
+    #random starting grids without the wall border, so the out of bounds cells count as walls at every edge
+    grid = np.random.default_rng(seed).integers(0, 2, size=(23, 31)).astype(np.uint8)
+    python_cave = CaveGenerator(31, 23, fill_percentage=45, smooth_iterations=3, backend="python")
+    numpy_cave = CaveGenerator(31, 23, fill_percentage=45, smooth_iterations=3, backend="numpy")
+    python_cave.grid = grid.tolist()
+    numpy_cave.grid = grid.copy()
+    python_cave.smooth_cave()
+    numpy_cave.smooth_cave()
+    assert numpy_cave.grid.tolist() == python_cave.grid
+
+
+def test_tiles_have_no_seams():
+    tiles = CaveTiles(tile_size=32, seed=1)
+    joined = np.block([[tiles.generate_tile((tx, ty)) for tx in range(-1, 2)] for ty in range(-1, 2)])
+    halo = tiles.smooth_iterations
+    whole = tiles.fill(-32 - halo, -32 - halo, 96 + 2 * halo, 96 + 2 * halo)
+    for _ in range(halo):
+        whole = smooth_step(whole, halo=True)
+    assert (joined == whole).all()
+
+
+def test_tiled_caves_are_cut_from_the_world_automaton():
+    #analyze only ever closes cells, so every open cell of a tiled cave is open in the world automaton too
+    generator = CaveChunkGenerator(scale=600, amplitude=1000, base_level=3000, seed=42, tiled=True)
+    caves = [cave for caves in generator.generate_chunks(range(20)) for cave in caves]
+    assert caves
+    for cave_x, cave_y, cave in caves:
+        world = generator.tiles.generate_area(cave_x // CAVE_CELL_SIZE, cave_y // CAVE_CELL_SIZE, cave.width, cave.height)
+        assert not ((cave.grid == 0) & (world == 1)).any()
+
+
+def test_analyze_fills_pockets_and_lists_walkable_cells():
+    cave = CaveGenerator(40, 40, fill_percentage=45, smooth_iterations=3, seed=3)
+    cave.initialize_grid()
+    cave.smooth_cave()
+    cave.analyze(min_region=12, clearance=(3, 2))
+    assert (cave.region_sizes >= 12).all()
+    for x, y in cave.walkable.tolist():
+        assert not cave.grid[y:y + 2, x:x + 3].any()
+
+
+@pytest.mark.parametrize("tiled", [False, True])
+def test_teleport_targets_are_inside_a_cave(tiled):
+    from settings import SUB_SIZE
+
+    seabed = SeabedGenerator(scale=600, amplitude=1000, base_level=3000, tiled_caves=tiled)
+    seabed.update_caves(0)
+    while seabed.cave_backend.pending():
+        time.sleep(0.01)
+        seabed.update_caves(0)
+    seabed.shutdown()
+    assert seabed.caves
+
+    rng = np.random.default_rng(1)
+    for x, y in zip(rng.integers(-10000, 10000, 100).tolist(), rng.integers(2000, 4000, 100).tolist()):
+        tx, ty = seabed.nearest_open_cell(x, y)
+        #caves can overlap, the last one drawn is the one that shows
+        cave_x, cave_y, cave = [c for c in seabed.caves if c[0] <= tx < c[0] + c[2].width * CAVE_CELL_SIZE
+                                and c[1] <= ty < c[1] + c[2].height * CAVE_CELL_SIZE][-1]
+        assert cave.grid[(ty - cave_y) // CAVE_CELL_SIZE][(tx - cave_x) // CAVE_CELL_SIZE] == 0
+        floor = seabed.cave_floor(tx, tx + SUB_SIZE[0], ty)
+        assert floor is not None and ty <= floor - SUB_SIZE[1]
@@ -0,0 +1,45 @@
+# test_chunk_generation.py
+
+import pytest
+from noise import snoise2
+
+from underwater_terrain import ChunkGenerator, SAMPLE_STEP, MIN_FEATURE_Y, NOISE_OFFSET
+
+KEYS = [(x * 800, y * 800) for x in range(-3, 3) for y in range(0, 3)]
+
+
+@pytest.fixture
+def generator():
+    return ChunkGenerator(scale=1000, threshold=0.4, amplitude=150, chunk_size=800, seed=42)
+
+
+def test_batched_matches_scalar(generator):
+    chunks = generator.generate_chunks_batched(KEYS)
+    assert sum(map(len, chunks)) > 0
+    for key, chunk in zip(KEYS, chunks):
+        assert chunk.tobytes() == generator.generate_chunk_scalar(key).tobytes()
+
+
+def test_one_key_batches_match_scalar(generator):
+    for key in KEYS[:4]:
+        assert generator.generate_chunk_batched(key).tobytes() == generator.generate_chunk_scalar(key).tobytes()
+
+
+def test_main_circles_match_the_noise(generator):
+    #only the fringe randomness changed from the original loop, main circles sit on every sample over the threshold
+    for chunk_x, chunk_y in KEYS[::4]:
+        mains = [
+            (x, y, generator.amplitude // 10)
+            for x in range(chunk_x, chunk_x + generator.chunk_size, SAMPLE_STEP)
+            for y in range(chunk_y, chunk_y + generator.chunk_size, SAMPLE_STEP)
+            if y >= MIN_FEATURE_Y and snoise2((x + NOISE_OFFSET) / generator.scale, (y + NOISE_OFFSET) / generator.scale,
+                       octaves=4, base=generator.seed) > generator.threshold
+        ]
+        chunk = generator.generate_chunk((chunk_x, chunk_y))
+        assert mains == list(zip(chunk["x"].tolist(), chunk["y"].tolist(), chunk["r"].tolist()))
+
+
+def test_chunks_are_the_same_every_time(generator):
+    again = ChunkGenerator(scale=1000, threshold=0.4, amplitude=150, chunk_size=800, seed=42)
+    for first, second in zip(generator.generate_chunks(KEYS), again.generate_chunks(KEYS[::-1])[::-1]):
+        assert first.tobytes() == second.tobytes()
@@ -0,0 +1,59 @@
+# test_chunk_store.py
+
+import numpy as np
+import pytest
+
+from chunk_store import ChunkStore
+from underwater_terrain import ChunkGenerator
+
+KEYS = [(x * 800, y * 800) for x in range(-3, 3) for y in range(0, 2)]
+
+
+@pytest.fixture
+def generator():
+    return ChunkGenerator(scale=1000, threshold=0.4, amplitude=150, chunk_size=800, seed=42)
+
+
+def test_round_trip(tmp_path, generator):
+    store = ChunkStore(tmp_path, generator.params())
+    chunks = generator.generate_chunks(KEYS)
+    for key, features in zip(KEYS, chunks):
+        store.save(key, features)
+        #served from memory until the writer gets to it
+        assert key in store and store.load(key).tobytes() == features.tobytes()
+    store.flush()
+    assert store.writes == len(KEYS)
+    assert all(store.load(key).tobytes() == features.tobytes() for key, features in zip(KEYS, chunks))
+    assert store.load((80000, 0)) is None
+    store.close()
+
+    #a later session reads the same chunks back without writing anything
+    store = ChunkStore(tmp_path, generator.params())
+    assert all(store.load(key).tobytes() == features.tobytes() for key, features in zip(KEYS, chunks))
+    assert store.writes == 0
+    store.close()
+
+
+def test_other_params_get_their_own_folder(tmp_path, generator):
+    store = ChunkStore(tmp_path, generator.params())
+    store.save(KEYS[0], generator.generate_chunk(KEYS[0]))
+    store.close()
+    other = ChunkStore(tmp_path, dict(generator.params(), seed=7))
+    assert KEYS[0] not in other and other.path != store.path
+    other.close()
+
+
+def test_partial_record_is_cut_off(tmp_path, generator):
+    store = ChunkStore(tmp_path, generator.params())
+    features = generator.generate_chunk(KEYS[0])
+    store.save(KEYS[0], features)
+    store.close()
+    with open(store.data_path, "ab") as data_file:
+        data_file.write(b"\x01" * 5)
+
+    store = ChunkStore(tmp_path, generator.params())
+    assert store.load(KEYS[0]).tobytes() == features.tobytes()
+    store.save(KEYS[1], np.zeros(0, dtype=store.record))
+    store.flush()
+    assert len(store.load(KEYS[1])) == 0
+    store.close()
@@ -0,0 +1,75 @@
+# test_chunk_workers.py
+
+import time
+
+import pytest
+
+from chunk_workers import ChunkJobQueue, create_backend
+
+
+def flaky(batch):
+    if (0, 0) in batch:
+        raise ValueError("bad chunk")
+    return list(batch)
+
+
+def doubled(batch):
+    return [key * 2 for key in batch]
+
+
+def finish(backend, lanes, count, timeout=30):
+    #poll every lane until count results came back in all
+    finished = []
+    deadline = time.monotonic() + timeout
+    while len(finished) < count:
+        assert time.monotonic() < deadline, "backend never delivered"
+        for lane in lanes:
+            finished.extend(lane.poll())
+        time.sleep(0.001)
+    return finished
+
+
+def test_queue_reprioritises_and_cancels():
+    jobs = ChunkJobQueue()
+    jobs.schedule({"a": 2, "b": 1, "c": 3})
+    jobs.schedule({"a": 0, "c": 3})
+    assert jobs.cancelled == 1
+    assert jobs.peek() == 0
+    assert jobs.pop_batch(5) == ["a", "c"]
+    #in flight keys aren't queued twice
+    jobs.schedule({"a": 0})
+    assert len(jobs) == 0 and jobs.peek() is None
+
+
+@pytest.mark.parametrize("name", ["thread", "process"])
+def test_failed_job_is_counted_and_the_worker_keeps_going(name):
+    options = {"batch_size": 1} if name == "thread" else {"batch_size": 1, "processes": 1}
+    backend = create_backend(name, flaky, **options)
+    try:
+        backend.schedule({(0, 0): 0, (800, 0): 1})
+        assert finish(backend, [backend], 1) == [((800, 0), (800, 0))]
+        while backend.pending():
+            backend.poll()
+            time.sleep(0.001)
+        assert backend.failed == 1 and "bad chunk" in backend.summary()
+        #the failed key comes free and can be scheduled again, later keys still run
+        backend.schedule({(1600, 0): 0})
+        assert finish(backend, [backend], 1) == [((1600, 0), (1600, 0))]
+    finally:
+        backend.shutdown()
+
+
+@pytest.mark.parametrize("name", ["thread", "process"])
+def test_shared_lane_runs_its_own_job(name):
+    options = {"batch_size": 1} if name == "thread" else {"batch_size": 1, "processes": 1}
+    backend = create_backend(name, flaky, **options)
+    lane = backend.share(doubled)
+    try:
+        backend.schedule({1: 0, 2: 2})
+        lane.schedule({1: 1, 3: 3})
+        finished = finish(backend, [backend, lane], 4)
+        assert sorted(finished) == [(1, 1), (1, 2), (2, 2), (3, 6)]
+        lane.shutdown()
+        assert lane.pending() == 0
+    finally:
+        backend.shutdown()
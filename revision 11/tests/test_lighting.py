@@ -0,0 +1,49 @@
+# test_lighting.py
+
+import random
+
+import pygame
+import pytest
+
+from conftest import load_terrain
+from lighting import DarknessCuller, Lighting
+from objects import UnderwaterObject, draw_objects
+from seabed_generator import SeabedGenerator
+from settings import WIDTH, HEIGHT, BG_COLOR
+from underwater_terrain import UnderwaterTerrain
+from visibility import ShadowCaster
+
+
+@pytest.mark.parametrize("darkness_factor", [1.0, 2.0])
+def test_culling_keeps_the_lit_frame(display, darkness_factor):
+    #culling may only ever skip what the dark covers
+    spot = (2000, 2200)
+    terrain = load_terrain(UnderwaterTerrain(scale=600, threshold=0.2, amplitude=150, chunk_size=800, grid_size=5,
+                                             seed=42), spot)
+    seabed = SeabedGenerator(scale=600, amplitude=1000, base_level=3000)
+    screen = pygame.Surface((WIDTH, HEIGHT))
+    offset = (spot[0] - WIDTH // 2, spot[1] - HEIGHT // 2)
+    random.seed(1)
+    objects = [UnderwaterObject(offset[0] + random.randint(0, WIDTH), offset[1] + random.randint(0, HEIGHT),
+                                30, 30, (200, 120, 60)) for _ in range(200)]
+    light = Lighting(300, darkness_factor=darkness_factor)
+    light.refresh()
+    polygon = ShadowCaster(budget_ms=1e9).update(spot, light.current_radius, None, terrain, seabed)
+    visibility = None if polygon is None else (polygon - offset).tolist()
+    lights = [((WIDTH // 2, HEIGHT // 2), light.current_radius, visibility, 0)]
+
+    lit = {}
+    for alpha in (0, 255):
+        culler = DarknessCuller()
+        culler.begin(screen, alpha, lights)
+        screen.fill(BG_COLOR)
+        terrain.draw(screen, offset)
+        seabed.draw(screen, offset, cell_size=8)
+        draw_objects(screen, [obj for obj in objects if culler.visible(obj.rect.move(-offset[0], -offset[1]))],
+                     offset, spot, light)
+        culler.end(screen)
+        light.draw(screen, (WIDTH // 2, HEIGHT // 2), overlay_alpha=255, visibility=visibility)
+        lit[alpha] = pygame.image.tostring(screen, "RGB")
+    terrain.shutdown()
+    seabed.shutdown()
+    assert culler.rect is not None and lit[0] == lit[255]
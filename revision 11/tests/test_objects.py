@@ -0,0 +1,51 @@
+# test_objects.py
+
+import numpy as np
+import pygame
+
+from lighting import Lighting
+from objects import ALPHA_STEP, ObjectSurfaceCache, UnderwaterObject, draw_objects
+from settings import WIDTH, HEIGHT
+
+CENTER = (WIDTH // 2, HEIGHT // 2)
+
+
+def per_object_surface(obj, screen, light):
+    #the draw before the cache: a new SRCALPHA surface per object at its exact alpha
+    distance = ((obj.x - CENTER[0]) ** 2 + (obj.y - CENTER[1]) ** 2) ** 0.5
+    surface = pygame.Surface((obj.width, obj.height), pygame.SRCALPHA)
+    surface.fill((*obj.color, int(light.calculate_visibility(distance))))
+    screen.blit(surface, (obj.x, obj.y))
+
+
+def frame(screen, draw):
+    screen.fill((10, 10, 40))
+    draw()
+    return pygame.surfarray.array3d(screen).astype(np.int16)
+
+
+def test_batched_draw_matches_single_draws(display):
+    #a grid so the objects don't overlap and add up rounding
+    screen = pygame.Surface((WIDTH, HEIGHT))
+    light = Lighting(300, darkness_factor=2.0)
+    light.refresh()
+    cache = ObjectSurfaceCache()
+    objects = [UnderwaterObject(x, y, 60, 60, (200, 120, 60)) for x in range(0, WIDTH, 70) for y in range(0, HEIGHT, 70)]
+
+    batched = frame(screen, lambda: draw_objects(screen, objects, (0, 0), CENTER, light, cache))
+    single = frame(screen, lambda: [obj.draw(screen, (0, 0), CENTER, light, cache) for obj in objects])
+    old = frame(screen, lambda: [per_object_surface(obj, screen, light) for obj in objects])
+    assert (batched == single).all()
+    #half a step of alpha is at most ALPHA_STEP / 2 on a 0..255 color, plus blend rounding
+    assert np.abs(batched - old).max() <= ALPHA_STEP // 2 + 1
+
+
+def test_objects_share_surfaces(display):
+    light = Lighting(300, darkness_factor=2.0)
+    light.refresh()
+    cache = ObjectSurfaceCache()
+    #same distance from the light, so the same alpha bucket
+    objects = [UnderwaterObject(CENTER[0] + dx, CENTER[1] + dy, 20, 20, (100, 100, 100))
+               for dx, dy in ((50, 0), (-50, 0), (0, 50), (0, -50))]
+    drawn = draw_objects(pygame.Surface((WIDTH, HEIGHT)), objects, (0, 0), CENTER, light, cache)
+    assert drawn == 4 and cache.misses == 1 and cache.hits == 3
@@ -0,0 +1,77 @@
+# test_scatter.py
+
+import time
+
+import numpy as np
+import pygame
+import pytest
+
+from conftest import load_terrain
+from scatter import ChunkPlacer, DecorationSprites, Scatter, TERRAIN_MIX, poisson_disk
+from seabed_generator import SeabedGenerator
+from settings import WIDTH, HEIGHT
+from underwater_terrain import UnderwaterTerrain
+
+
+@pytest.fixture
+def terrain(display):
+    terrain = load_terrain(UnderwaterTerrain(scale=600, threshold=0.4, amplitude=150, chunk_size=800, grid_size=3,
+                                             seed=42), (400, 1200))
+    yield terrain
+    terrain.shutdown()
+
+
+@pytest.fixture
+def seabed():
+    seabed = SeabedGenerator(scale=600, amplitude=1000, base_level=3000)
+    yield seabed
+    seabed.shutdown()
+
+
+def test_placement_is_the_same_every_time(terrain):
+    sprites = DecorationSprites()
+    first = ChunkPlacer(42, 28, terrain.chunk_size, *sprites.mix(TERRAIN_MIX))
+    second = ChunkPlacer(42, 28, terrain.chunk_size, *sprites.mix(TERRAIN_MIX))
+    other_seed = ChunkPlacer(7, 28, terrain.chunk_size, *sprites.mix(TERRAIN_MIX))
+    keys = list(terrain.chunk_rects)
+    placed = [first.place(key, terrain.chunk_grid[key]) for key in keys]
+    assert sum(map(len, placed)) > 0
+    for key, decorations in zip(keys[::-1], [second.place(key, terrain.chunk_grid[key]) for key in keys[::-1]]):
+        assert (decorations == placed[keys.index(key)]).all()
+    assert any(
+        len(a) != len(b) or (a != b).any()
+        for a, b in zip(placed, [other_seed.place(key, terrain.chunk_grid[key]) for key in keys])
+    )
+
+
+def test_backend_placement_sits_on_the_baked_terrain(terrain, seabed):
+    scatter = Scatter(seed=42, terrain=terrain)
+    deadline = time.monotonic() + 30
+    while len(scatter.terrain_chunks) < len(terrain.chunk_surfaces):
+        assert time.monotonic() < deadline
+        scatter.update(terrain, seabed, (0, 1200), (WIDTH, HEIGHT))
+        time.sleep(0.005)
+    scatter.shutdown()
+
+    for chunk_key, decorations in scatter.terrain_chunks.items():
+        assert (decorations == scatter.placer.place(chunk_key, terrain.chunk_grid[chunk_key])).all()
+        (left, top), surface = terrain.chunk_surfaces[chunk_key]
+        pixels = pygame.surfarray.pixels2d(surface)
+        empty = surface.map_rgb(surface.get_colorkey())
+        x, y = decorations["x"] - left, decorations["y"] - top
+        #on a terrain pixel with open water right above it
+        assert (pixels[x, y] != empty).all() and (pixels[x, y - 1] == empty).all()
+        del pixels
+
+
+def test_spacing(seabed, display):
+    scatter = Scatter(seed=42)
+    points = poisson_disk(np.random.default_rng(0), 800, 800, scatter.radius)
+    distances = np.hypot(*(points[:, None, :] - points[None, :, :]).transpose(2, 0, 1))
+    np.fill_diagonal(distances, np.inf)
+    assert distances.min() >= scatter.radius
+    #seabed decorations keep theirs across span edges, less the int rounding
+    xs = np.concatenate([scatter.scatter_span(span, seabed)["x"] for span in range(-3, 3)])
+    assert np.diff(xs).min() >= scatter.spacing - 1
+    again = Scatter(seed=42)
+    assert all((scatter.scatter_span(span, seabed) == again.scatter_span(span, seabed)).all() for span in range(-3, 3))
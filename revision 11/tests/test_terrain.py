@@ -0,0 +1,34 @@
+# test_terrain.py
+
+import time
+
+from conftest import load_terrain
+from underwater_terrain import UnderwaterTerrain
+
+
+def settle(terrain, position):
+    while terrain.missing_chunks or terrain.unbaked or terrain.baking:
+        terrain.update_chunks(position)
+        time.sleep(0.01)
+
+
+def test_chunks_coming_back_reuse_their_bake(display):
+    #swimming back and forth over a chunk border
+    terrain = UnderwaterTerrain(scale=1000, threshold=0.4, amplitude=150, chunk_size=800, grid_size=5, seed=42)
+    try:
+        settle(terrain, (0, 0))
+        for crossing in range(6):
+            x = 900 if crossing % 2 == 0 else 100
+            terrain.update_chunks((x, 400))
+            if crossing > 0:
+                assert not terrain.unbaked and terrain.baking is None
+            settle(terrain, (x, 400))
+    finally:
+        terrain.shutdown()
+
+
+def test_every_chunk_gets_a_rect_and_a_surface(display):
+    terrain = load_terrain(UnderwaterTerrain(scale=600, threshold=0.4, amplitude=150, chunk_size=800, grid_size=3,
+                                             seed=42), (400, 1200))
+    terrain.shutdown()
+    assert terrain.chunk_rects and set(terrain.chunk_surfaces) == set(terrain.chunk_rects)
@@ -0,0 +1,82 @@
+# test_visibility.py
+
+import math
+import time
+
+import numpy as np
+import pytest
+
+from visibility import ShadowCaster, visibility_polygon
+
+
+def brute_reach(light, radius, angle, segments, circles):
+    #how far one ray gets, tested against every occluder
+    lx, ly = light
+    dx, dy = math.cos(angle), math.sin(angle)
+    reach = radius
+    for x0, y0, x1, y1 in segments.tolist():
+        px, py, ex, ey = x0 - lx, y0 - ly, x1 - x0, y1 - y0
+        denom = dx * ey - dy * ex
+        if denom == 0:
+            continue
+        t = (px * ey - py * ex) / denom
+        u = (px * dy - py * dx) / denom
+        if t > 0 and 0 <= u <= 1:
+            reach = min(reach, t)
+    for x, y, r in circles.tolist():
+        x, y = x - lx, y - ly
+        if math.hypot(x, y) <= r:
+            continue
+        along = dx * x + dy * y
+        inside_sq = r * r - (x * x + y * y - along * along)
+        if inside_sq >= 0 and along > 0 and along - math.sqrt(inside_sq) > 0:
+            reach = min(reach, along - math.sqrt(inside_sq))
+    return reach
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_polygon_matches_brute_force(seed):
+    #every vertex is a ray the sweep cast, it has to stop where the closest occluder along it is.
+    #the angle gets recomputed from the vertex, so rays right on an occluder's end are checked a hair either side,
+    #and rays grazing a circle are only good to a fraction of a pixel
+    rng = np.random.default_rng(seed)
+    light = (500.0, 500.0)
+    starts = rng.uniform(0, 1000, (60, 2))
+    segments = np.concatenate((starts, starts + rng.uniform(-80, 80, (60, 2))), axis=1)
+    circles = np.concatenate((rng.uniform(0, 1000, (200, 2)), rng.uniform(5, 30, (200, 1))), axis=1)
+    polygon = visibility_polygon(light, 450, segments, circles)
+    assert len(polygon) >= 3
+    for x, y in polygon.tolist():
+        reach = math.hypot(x - light[0], y - light[1])
+        angle = math.atan2(y - light[1], x - light[0])
+        expected = [brute_reach(light, 450, angle + nudge, segments, circles) for nudge in (0, -1e-9, 1e-9)]
+        assert min(abs(reach - other) for other in expected) < 0.1
+
+
+def test_light_buried_in_the_terrain(display):
+    #the polygon collapses, neither it nor the lighting draws may choke on it
+    from settings import WIDTH, HEIGHT
+    import pygame
+    from lighting import Lighting, LightManager
+    from terrain_features import chunk_circles
+    from underwater_terrain import UnderwaterTerrain
+
+    terrain = UnderwaterTerrain(scale=1000, threshold=0.4, amplitude=150, chunk_size=800, grid_size=5, seed=42)
+    spot = (350, 1942)
+    while terrain.missing_chunks:
+        time.sleep(0.01)
+        terrain.update_chunks(spot)
+    terrain.shutdown()
+    circles = np.concatenate([chunk_circles(features) for features in terrain.chunk_grid.values()])
+    assert (np.hypot(circles[:, 0] - spot[0], circles[:, 1] - spot[1]) < circles[:, 2]).any()
+
+    polygon = ShadowCaster(budget_ms=1e9).update(spot, 450, None, terrain, None)
+    assert polygon is None or len(polygon) >= 3
+    screen = pygame.Surface((WIDTH, HEIGHT))
+    light = Lighting(300, darkness_factor=2.0)
+    light_map = LightManager((WIDTH, HEIGHT))
+    for degenerate in ([], [(400, 350)], [(400, 350), (410, 360)]):
+        light.draw(screen, (400, 350), visibility=degenerate)
+        light_map.clear()
+        light_map.add((400, 350), 300, visibility=degenerate)
+        light_map.draw(screen)
@@ -1,91 +1,341 @@
+import time
 import pygame
 from noise import snoise2
-import threading
-from queue import Queue
-import math
-import random
+import numpy as np
+from vector_noise import (
+    snoise2_array, snoise2_above, position_hash, position_hash_array, hash_uniform, hash_uniform_array,
+    FRINGE_COS, FRINGE_SIN,
+)
+from chunk_workers import create_backend
+from chunk_cache import ChunkCache
+from chunk_store import ChunkStore
+from terrain_features import (
+    FEATURE_DTYPE, CONTOUR_DTYPE, empty_chunk, chunk_circles, chunk_loops, chunk_bounds, memory_report,
+)
+from geometry import contour_loops, simplify_loop, polygon_area, loops_hit_rect, loop_segments
 
-class UnderwaterTerrain:
-    def __init__(self, scale, threshold, amplitude, chunk_size, grid_size, seed=None):
+#sample spacing of the noise lattice
+SAMPLE_STEP = 20
+#no terrain above this world y
+MIN_FEATURE_Y = 250
+#offset to keep coordinates positive, bc simplex flips tf out if negative
+NOISE_OFFSET = 10_000_000
+#most chunks the worker generates in one batched call
+MAX_CHUNK_BATCH = 8
+#how many frames ahead the prefetch looks along the camera velocity
+PREFETCH_LOOKAHEAD = 45
+#max distance (px) simplified contour polygons may stray from the marching squares outline
+CONTOUR_TOLERANCE = 2.0
+#ms per frame update_chunks may spend baking delivered chunks into surfaces (closest first, at least one slice a frame)
+BAKE_BUDGET_MS = 4.0
+#circles / loops drawn between budget checks, so one big chunk gets spread over several frames
+BAKE_SLICE = 500
+#baked surfaces kept for chunks that just left the grid so turning back doesn't re-bake them, they're a few MB each
+BAKED_CACHE_CHUNKS = 10
+#bump when generation changes, stored chunks from older versions won't be reused
+GENERATOR_VERSION = 1
+
+TERRAIN_COLOR = (100, 80, 50)
+#background of baked chunk surfaces, anything in this color is see-through
+CHUNK_COLORKEY = (255, 0, 255)
+
+_FRINGE_COS = np.array(FRINGE_COS)
+_FRINGE_SIN = np.array(FRINGE_SIN)
+
+
+def baked_nbytes(baked):
+    #pixel memory of a ((world_left, world_top), surface) bake
+    surface = baked[1]
+    return surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+
+class ChunkGenerator:
+
+    #all the noise params for terrain chunks, kept separate from UnderwaterTerrain
+    #so it can be pickled over to worker processes
+
+    def __init__(self, scale, threshold, amplitude, chunk_size, seed, batched=True, mode="circles",
+                 contour_tolerance=CONTOUR_TOLERANCE):
+        if mode not in ("circles", "contour"):
+            raise ValueError(f"Unknown terrain mode: {mode}")
         self.scale = scale
         self.threshold = threshold
         self.amplitude = amplitude
         self.chunk_size = chunk_size
-        #num of chunks in each direction
-        self.grid_size = grid_size  
-        self.seed = seed if seed else 42
+        self.seed = seed
+        #numpy chunk generation, set False to use the per-sample reference path
+        self.batched = batched
+        #"circles" - main + fringe circle blobs (FEATURE_DTYPE chunks)
+        #"contour" - marching squares polygons of the same noise field (CONTOUR_DTYPE chunks)
+        self.mode = mode
+        self.contour_tolerance = contour_tolerance
+        self.record = CONTOUR_DTYPE if mode == "contour" else FEATURE_DTYPE
 
-        # grid of chunks
-        self.chunk_grid = {}
-        #queue for threaded chunk generation
-        self.chunk_queue = Queue() 
-        self.generate_thread = threading.Thread(target=self._process_chunk_queue, daemon=True)
-        self.generate_thread.start()
-
-        #init the grid
-        self.initialize_chunk_grid()
+    def params(self):
+        #everything that changes what a chunk looks like, used to key the chunk store
+        #(batched vs scalar isn't in here, they give the same chunks)
+        params = {
+            "scale": self.scale,
+            "threshold": self.threshold,
+            "amplitude": self.amplitude,
+            "chunk_size": self.chunk_size,
+            "seed": self.seed,
+            "sample_step": SAMPLE_STEP,
+            "min_feature_y": MIN_FEATURE_Y,
+            "generator_version": GENERATOR_VERSION,
+        }
+        if self.mode == "contour":
+            params.update(mode=self.mode, contour_tolerance=self.contour_tolerance)
+        return params
 
-    def initialize_chunk_grid(self):
-    #grid around 0,0    
-        print("Initializing chunk grid...")
-        half_grid = self.grid_size // 2
-        for gx in range(-half_grid, half_grid + 1):
-            for gy in range(-half_grid, half_grid + 1):
-                chunk_key = (gx * self.chunk_size, gy * self.chunk_size)
-                #empty chunk at firstm then add to generation queue
-                self.chunk_grid[chunk_key] = []  
-                self.chunk_queue.put(chunk_key)  
-
-    def _process_chunk_queue(self):
-    #constantly process chunk gen in a different thread
-        while True:
-            chunk_key = self.chunk_queue.get()
-            self.chunk_grid[chunk_key] = self.generate_chunk(chunk_key)
-            self.chunk_queue.task_done()
+    def generate_chunks(self, chunk_keys):
+        #job for the chunk backends, one feature array per key
+        if self.mode == "contour":
+            return self.generate_contour_chunks(chunk_keys)
+        if self.batched:
+            return self.generate_chunks_batched(chunk_keys)
+        return [self.generate_chunk_scalar(chunk_key) for chunk_key in chunk_keys]
 
     def generate_chunk(self, chunk_key):
+        #gen features for a single chunk based on key (world pos)
+        return self.generate_chunks([chunk_key])[0]
+
+    def generate_chunk_scalar(self, chunk_key):
 
         #gen features for a single chunk based on key (world pos)
         #no features are gen. above y 250
         #pre-bakes overlapping 'fringe' circl for smoothing terrain
+        #reference path, one snoise2 call per sample
+        #returns a FEATURE_DTYPE array, fringe circles relative to their main circle
 
         features = []
         chunk_x, chunk_y = chunk_key
-        #offset to keep coordinates positive, bc simplex flips tf out if negative
-        noise_offset = 10_000_000 
+        main_radius = self.amplitude // 10
 
-        for x in range(chunk_x, chunk_x + self.chunk_size, 20):
-            for y in range(chunk_y, chunk_y + self.chunk_size, 20):
+        for x in range(chunk_x, chunk_x + self.chunk_size, SAMPLE_STEP):
+            for y in range(chunk_y, chunk_y + self.chunk_size, SAMPLE_STEP):
                 #skip feature above y 250
-                if y < 250:
+                if y < MIN_FEATURE_Y:
                     continue
 
-                nx = (x + noise_offset) / self.scale
-                ny = (y + noise_offset) / self.scale
+                nx = (x + NOISE_OFFSET) / self.scale
+                ny = (y + NOISE_OFFSET) / self.scale
                 noise_value = snoise2(nx, ny, octaves=4, base=self.seed)
 
                 if noise_value > self.threshold:
                     #pre-bake overlapping frnge circles
-                    main_radius = self.amplitude // 10
-                    fringe_circles = []
+                    #randomness comes from a hash of the position so the batched path gets the same circles.
+                    #this used to be the global random module, so fringes differ from worlds made before the
+                    #switch (on purpose, the main circles are unchanged) and are now the same every run for a seed
+                    key = position_hash(self.seed, x, y)
+                    fringe_offsets = []
                     #every 30 degrees - place fringe circles
-                    for angle in range(0, 360, 30):
+                    for i, (cos_a, sin_a) in enumerate(zip(FRINGE_COS, FRINGE_SIN)):
                         #close range
-                        distance = random.uniform(main_radius * 0.7, main_radius * 1.2)
-                        fringe_radius = random.randint(main_radius // 2, main_radius * 3 // 4)
-                        offset_x = int(distance * math.cos(math.radians(angle)))
-                        offset_y = int(distance * math.sin(math.radians(angle)))
-                        fringe_circles.append((x + offset_x, y + offset_y, fringe_radius))
+                        distance = main_radius * 0.7 + (main_radius * 1.2 - main_radius * 0.7) * hash_uniform(key, 2 * i)
+                        fringe_radius = main_radius // 2 + int(
+                            hash_uniform(key, 2 * i + 1) * (main_radius * 3 // 4 - main_radius // 2 + 1)
+                        )
+                        offset_x = int(distance * cos_a)
+                        offset_y = int(distance * sin_a)
+                        fringe_offsets.append((offset_x, offset_y, fringe_radius))
 
-                    features.append({"main": (x, y, main_radius), "fringe": fringe_circles})
+                    features.append((x, y, main_radius, fringe_offsets))
 
-        return features
+        return np.array(features, dtype=FEATURE_DTYPE)
 
+    def generate_chunk_batched(self, chunk_key):
+        #same output as generate_chunk_scalar
+        return self.generate_chunks_batched([chunk_key])[0]
 
+    def generate_chunks_batched(self, chunk_keys):
 
-    def update_chunks(self, camera_pos):
+        #gen several chunks at once, returns a feature array per key (same output as generate_chunk_scalar)
+        #doing more than one chunk per call spreads the numpy call overhead
+
+        feature_x, feature_y, offset_x, offset_y, fringe_radius, feature_counts = self.generate_feature_arrays(chunk_keys)
+
+        features = np.zeros(len(feature_x), dtype=FEATURE_DTYPE)
+        features["x"] = feature_x
+        features["y"] = feature_y
+        features["r"] = self.amplitude // 10
+        features["fringe"] = np.stack((offset_x, offset_y, fringe_radius), axis=-1)
+
+        #copies, so a cached chunk doesn't keep the whole batch alive
+        bounds = np.cumsum(feature_counts)[:-1]
+        return [chunk.copy() for chunk in np.split(features, bounds)]
+
+    def generate_feature_arrays(self, chunk_keys):
+
+        #array stage of the batched path
+        #every sample lattice is evaluated as one array and the fringe circles for every feature are built at once
+        #returns feature x/y (n,), fringe offset x/y and radius (n, 12) and the number of features per chunk key
+
+        main_radius = self.amplitude // 10
+        lattice = np.arange(0, self.chunk_size, SAMPLE_STEP, dtype=np.int64)
+
+        sample_x = []
+        sample_y = []
+        for chunk_x, chunk_y in chunk_keys:
+            ys = chunk_y + lattice
+            #skip rows above y 250
+            ys = ys[ys >= MIN_FEATURE_Y]
+            #x outer, y inner, same order as the scalar loops
+            grid_x, grid_y = np.meshgrid(chunk_x + lattice, ys, indexing="ij")
+            sample_x.append(grid_x.ravel())
+            sample_y.append(grid_y.ravel())
+        chunk_index = np.repeat(np.arange(len(chunk_keys)), [len(xs) for xs in sample_x])
+        sample_x = np.concatenate(sample_x)
+        sample_y = np.concatenate(sample_y)
+
+        above = snoise2_above(
+            (sample_x + NOISE_OFFSET) / self.scale,
+            (sample_y + NOISE_OFFSET) / self.scale,
+            self.threshold, octaves=4, base=self.seed,
+        )
+        #number of features that land in each chunk
+        feature_counts = np.bincount(chunk_index[above], minlength=len(chunk_keys))
+
+        feature_x = sample_x[above]
+        feature_y = sample_y[above]
+
+        keys = position_hash_array(self.seed, feature_x[:, None], feature_y[:, None])
+        streams = np.arange(len(FRINGE_COS), dtype=np.int64) * 2
+        distance = main_radius * 0.7 + (main_radius * 1.2 - main_radius * 0.7) * hash_uniform_array(keys, streams)
+        fringe_radius = main_radius // 2 + (
+            hash_uniform_array(keys, streams + 1) * (main_radius * 3 // 4 - main_radius // 2 + 1)
+        ).astype(np.int64)
+        #astype truncates toward zero like int()
+        offset_x = (distance * _FRINGE_COS).astype(np.int64)
+        offset_y = (distance * _FRINGE_SIN).astype(np.int64)
+
+        return feature_x, feature_y, offset_x, offset_y, fringe_radius, feature_counts
+
+    def generate_contour_chunks(self, chunk_keys):
+
+        #contour mode: marching squares over each chunk's threshold field, simplified to polygons
+        #the sample lattice includes the far edge so neighbouring chunks share their border samples,
+        #border crossings are pinned through simplification so the polygons line up across the seam
+        #returns a CONTOUR_DTYPE array per key
+
+        lattice = np.arange(0, self.chunk_size + 1, SAMPLE_STEP, dtype=np.int64)
+        keys = np.array(chunk_keys, dtype=np.int64).reshape(-1, 2)
+        sample_x = keys[:, 0, None, None] + lattice[None, :, None]
+        sample_y = keys[:, 1, None, None] + lattice[None, None, :]
+
+        field = snoise2_array(
+            (sample_x + NOISE_OFFSET) / self.scale,
+            (sample_y + NOISE_OFFSET) / self.scale,
+            octaves=4, base=self.seed,
+        )
+        #nothing above y 250, same cut as the circle features
+        field[np.broadcast_to(sample_y < MIN_FEATURE_Y, field.shape)] = -1.0
+
+        chunks = []
+        for (chunk_x, chunk_y), chunk_field in zip(chunk_keys, field):
+            vertices = []
+            loop_index = 0
+            for points, pinned in contour_loops(chunk_field, self.threshold):
+                points = simplify_loop(points * SAMPLE_STEP, pinned, self.contour_tolerance)
+                points = np.rint(points).astype(np.int64) + (chunk_x, chunk_y)
+                #slivers that round away to nothing
+                if len(points) < 3 or abs(polygon_area(points)) < 1:
+                    continue
+                for x, y in points.tolist():
+                    vertices.append((x, y, loop_index))
+                loop_index += 1
+            chunks.append(np.array(vertices, dtype=CONTOUR_DTYPE))
+        return chunks
+
+
+class UnderwaterTerrain:
+    def __init__(self, scale, threshold, amplitude, chunk_size, grid_size, seed=None, batched=True,
+                 backend="thread", workers=None, cache_chunks=64, cache_bytes=None, store_path=None,
+                 lookahead=PREFETCH_LOOKAHEAD, mode="circles"):
+        self.scale = scale
+        self.threshold = threshold
+        self.amplitude = amplitude
+        self.chunk_size = chunk_size
+        #num of chunks in each direction
+        self.grid_size = grid_size  
+        self.seed = seed if seed else 42
+        self.generator = ChunkGenerator(scale, threshold, amplitude, chunk_size, self.seed, batched=batched, mode=mode)
+        self.mode = mode
+
+        # grid of chunks
+        self.chunk_grid = {}
+        #grid keys still waiting on the backend
+        self.missing_chunks = set()
+        #chunk key -> ((world_left, world_top), surface) for finished, non-empty chunks
+        self.chunk_surfaces = {}
+        #chunk key -> world rect of a finished, non-empty chunk (baked or not), what the collision / shadow lookups use
+        self.chunk_rects = {}
+        #finished chunks waiting for bake_pending, chunk key -> features
+        self.unbaked = {}
+        #(chunk key, bake_steps generator) of the chunk being baked, None between chunks
+        self.baking = None
+        #chunk key -> (segments, circles) shadow occluders of a loaded chunk, made the first time the light reaches it
+        self.chunk_occluders = {}
+        #finished chunks that left the grid, so swimming back doesn't regenerate them
+        self.cache = ChunkCache(max_chunks=cache_chunks, max_bytes=cache_bytes)
+        #((world_left, world_top), surface) of the most recent of those, same LRU just sized by pixels
+        self.baked_cache = ChunkCache(max_chunks=BAKED_CACHE_CHUNKS, size_fn=baked_nbytes)
+        #optional on-disk store, chunks are a pure function of (seed, params, key) so they can be kept across sessions
+        self.store = ChunkStore(store_path, self.generator.params(), self.generator.record) if store_path else None
+        self.center_chunk = None
+        #chunks outside the grid that the camera is heading towards, generated early into the cache
+        self.lookahead = lookahead
+        self.predicted_chunk = None
+        self.prefetch_chunks = set()
+        self.prefetched = 0
+        #frames where a chunk on screen was still waiting on the backend
+        self.pop_in_frames = 0
+        self.frames_drawn = 0
+        #on screen chunks skipped last draw for being outside the screen's clip rect
+        self.culled = 0
+        #background generation ("thread" or "process"), closest chunks first
+        backend_options = {"batch_size": MAX_CHUNK_BATCH} if backend == "thread" else {"processes": workers}
+        self.backend = create_backend(backend, self.generator.generate_chunks, **backend_options)
+
+        #init the grid
+        self.initialize_chunk_grid()
+
+    def initialize_chunk_grid(self):
+    #grid around 0,0    
+        print("Initializing chunk grid...")
+        self.update_chunks((0, 0))
+
+    def generate_chunk(self, chunk_key):
+        #gen features for a single chunk right away on the calling thread
+        return self.generator.generate_chunk(chunk_key)
+
+    def chunk_priority(self, chunk_key):
+        #squared distance from the camera chunk, in chunks
+        dx = (chunk_key[0] - self.center_chunk[0]) // self.chunk_size
+        dy = (chunk_key[1] - self.center_chunk[1]) // self.chunk_size
+        return dx * dx + dy * dy
+
+    def shutdown(self):
+        self.backend.shutdown()
+        if self.store is not None:
+            self.store.close()
+
+    def chunk_at(self, x, y):
+        #key of the chunk containing a world position
+        return (int(x // self.chunk_size) * self.chunk_size, int(y // self.chunk_size) * self.chunk_size)
+
+    def grid_keys(self, center_chunk):
+        half_grid = self.grid_size // 2
+        return [
+            (center_chunk[0] + gx * self.chunk_size, center_chunk[1] + gy * self.chunk_size)
+            for gx in range(-half_grid, half_grid + 1)
+            for gy in range(-half_grid, half_grid + 1)
+        ]
+
+    def update_chunks(self, camera_pos, velocity=(0, 0)):
 
         #re-pos and regen. chunks based on the players pos
+        #velocity is the camera movement per frame, used to prefetch chunks lookahead frames ahead
 
         camera_x, camera_y = camera_pos
         half_grid = self.grid_size // 2
@@ -93,61 +343,284 @@ class UnderwaterTerrain:
         #calc the center chunk based on the camera pos
         center_chunk_x = (camera_x // self.chunk_size) * self.chunk_size
         center_chunk_y = (camera_y // self.chunk_size) * self.chunk_size
+        grid_moved = (center_chunk_x, center_chunk_y) != self.center_chunk
+
+        if grid_moved:
+            self.center_chunk = (center_chunk_x, center_chunk_y)
+
+            #reuse chunks in grid
+            new_chunk_grid = {}
+            for gx in range(-half_grid, half_grid + 1):
+                for gy in range(-half_grid, half_grid + 1):
+                    target_chunk = (center_chunk_x + gx * self.chunk_size, center_chunk_y + gy * self.chunk_size)
+
+                    if target_chunk in self.chunk_grid:
+                        #keep the existing chunk
+                        new_chunk_grid[target_chunk] = self.chunk_grid[target_chunk]
+                        continue
+
+                    features = self.cache.get(target_chunk)
+                    if features is None and self.store is not None:
+                        features = self.store.load(target_chunk)
+                    if features is not None:
+                        #been here before, recently enough that the surface may still be around
+                        new_chunk_grid[target_chunk] = features
+                        baked = self.baked_cache.get(target_chunk)
+                        if baked is not None:
+                            self._add_baked(target_chunk, baked)
+                        else:
+                            self._add_surface(target_chunk, features)
+                    else:
+                        #gen a new chunk, keep new_chunk_grid empty on start
+                        new_chunk_grid[target_chunk] = empty_chunk(self.generator.record)
+                        self.missing_chunks.add(target_chunk)
+
+            #finished chunks that fell out of the grid go to the cache, their baked surfaces to the baked cache
+            for chunk_key, features in self.chunk_grid.items():
+                if chunk_key not in new_chunk_grid:
+                    if chunk_key not in self.missing_chunks:
+                        self.cache.put(chunk_key, features)
+                    baked = self.chunk_surfaces.pop(chunk_key, None)
+                    if baked is not None:
+                        self.baked_cache.put(chunk_key, baked)
+                    self.chunk_rects.pop(chunk_key, None)
+                    self.unbaked.pop(chunk_key, None)
+                    if self.baking is not None and self.baking[0] == chunk_key:
+                        self.baking = None
+                    self.chunk_occluders.pop(chunk_key, None)
 
-        #reuse chunks in grid
-        new_chunk_grid = {}
-        for gx in range(-half_grid, half_grid + 1):
-            for gy in range(-half_grid, half_grid + 1):
-                target_chunk = (center_chunk_x + gx * self.chunk_size, center_chunk_y + gy * self.chunk_size)
+            self.chunk_grid = new_chunk_grid
+            #anything that left the grid gets cancelled, the rest is re-ordered around the new center
+            self.missing_chunks.intersection_update(new_chunk_grid)
 
-                if target_chunk in self.chunk_grid:
-                    #keep the existing chunk
-                    new_chunk_grid[target_chunk] = self.chunk_grid[target_chunk]
-                else:
-                    #gen a new chunk, keep new_chunk_grid empty on start
-                    new_chunk_grid[target_chunk] = []
-                    self.chunk_queue.put(target_chunk)
+        #only re-plan the prefetch when the grid or the predicted chunk changes
+        predicted_chunk = self.chunk_at(camera_x + velocity[0] * self.lookahead, camera_y + velocity[1] * self.lookahead)
+        if grid_moved or predicted_chunk != self.predicted_chunk:
+            self.predicted_chunk = predicted_chunk
+            self.prefetch_chunks = self.plan_prefetch(camera_x, camera_y, velocity)
 
-        self.chunk_grid = new_chunk_grid
+            #prefetch keys are all outside the grid so they sort after every missing grid chunk
+            wanted = {key: self.chunk_priority(key) for key in self.prefetch_chunks}
+            wanted.update({key: self.chunk_priority(key) for key in self.missing_chunks})
+            self.backend.schedule(wanted)
 
+        #pick up finished chunks, ones that already left the grid only go to the cache
+        for chunk_key, features in self.backend.poll():
+            if self.store is not None:
+                self.store.save(chunk_key, features)
+            if chunk_key in self.missing_chunks:
+                self.missing_chunks.discard(chunk_key)
+                self.chunk_grid[chunk_key] = features
+                self._add_surface(chunk_key, features)
+            elif chunk_key not in self.chunk_grid:
+                self.cache.put(chunk_key, features)
+            if chunk_key in self.prefetch_chunks:
+                self.prefetch_chunks.discard(chunk_key)
+                self.prefetched += 1
 
+        self.bake_pending()
 
+    def plan_prefetch(self, camera_x, camera_y, velocity):
 
+        #grids the camera will pass through over the next lookahead frames at its current velocity,
+        #minus anything already loaded / cached / stored, cached ones get touched so they aren't evicted before use
+        #capped at half the cache so prefetched chunks don't push each other out before they're used
+
+        travel_x = velocity[0] * self.lookahead
+        travel_y = velocity[1] * self.lookahead
+        steps = int(max(abs(travel_x), abs(travel_y)) // self.chunk_size) + 1
+        path = set()
+        for step in range(1, steps + 1):
+            path.add(self.chunk_at(camera_x + travel_x * step / steps, camera_y + travel_y * step / steps))
+        path.discard(self.center_chunk)
+
+        ahead = set()
+        for path_chunk in path:
+            ahead.update(self.grid_keys(path_chunk))
+        ahead.difference_update(self.chunk_grid)
+
+        limit = self.cache.max_chunks // 2 if self.cache.max_chunks is not None else len(ahead)
+        prefetch = set()
+        for chunk_key in sorted(ahead, key=self.chunk_priority)[:limit]:
+            if self.cache.touch(chunk_key):
+                continue
+            if self.store is not None and chunk_key in self.store:
+                continue
+            prefetch.add(chunk_key)
+        return prefetch
+
+    def prefetch_summary(self):
+        return (
+            f"ahead {self.lookahead}f, queued {len(self.prefetch_chunks)}, done {self.prefetched}, "
+            f"pop-in {self.pop_in_frames}/{self.frames_drawn} frames"
+        )
+
+    def _add_surface(self, chunk_key, features):
+        #queue a finished chunk for baking, its rect is known right away so collisions don't wait on the bake
+        bounds = chunk_bounds(features)
+        if bounds is None:
+            return
+        left, top, right, bottom = bounds
+        self.chunk_rects[chunk_key] = pygame.Rect(left, top, right - left, bottom - top)
+        self.unbaked[chunk_key] = features
+
+    def _add_baked(self, chunk_key, baked):
+        #a chunk whose surface came back from the baked cache, nothing left to do for it
+        position, surface = baked
+        self.chunk_surfaces[chunk_key] = baked
+        self.chunk_rects[chunk_key] = pygame.Rect(position, surface.get_size())
+
+    def bake_pending(self, budget_ms=BAKE_BUDGET_MS):
+        #bake queued chunks closest to the camera first, a slice at a time until the budget is spent
+        #(None bakes all of them). a chunk that doesn't finish carries on next frame
+        start = time.perf_counter()
+        while self.baking is not None or self.unbaked:
+            if self.baking is None:
+                chunk_key = min(self.unbaked, key=self.chunk_priority)
+                self.baking = (chunk_key, self.bake_steps(self.unbaked.pop(chunk_key)))
+            chunk_key, steps = self.baking
+            try:
+                next(steps)
+            except StopIteration as done:
+                self.baking = None
+                if done.value is not None:
+                    self.chunk_surfaces[chunk_key] = done.value
+            if budget_ms is not None and (time.perf_counter() - start) * 1000 >= budget_ms:
+                break
+
+    def bake_chunk(self, features):
+        #rasterize a finished chunk in one go, returns ((world_left, world_top), surface) or None for empty chunks
+        steps = self.bake_steps(features)
+        while True:
+            try:
+                next(steps)
+            except StopIteration as done:
+                return done.value
+
+    def bake_steps(self, features, slice_size=BAKE_SLICE):
+
+        #generator version of bake_chunk, yields after every slice_size circles / loops and returns the baked chunk
+        #the surface is sized to the circles' bounding box so fringes sticking out of the chunk aren't cut off
+
+        bounds = chunk_bounds(features)
+        if bounds is None:
+            return None
+        left, top, right, bottom = bounds
+
+        surface = pygame.Surface((right - left, bottom - top))
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert()
+        surface.fill(CHUNK_COLORKEY)
+        if self.mode == "contour":
+            #biggest loops first, so holes get punched out of their outer loop and islands in holes go back on top
+            loops = sorted(((polygon_area(points), points) for points in chunk_loops(features)),
+                           key=lambda loop: -abs(loop[0]))
+            for index, (area, points) in enumerate(loops, 1):
+                color = TERRAIN_COLOR if area < 0 else CHUNK_COLORKEY
+                pygame.draw.polygon(surface, color, (points - (left, top)).tolist())
+                if index % slice_size == 0:
+                    yield
+        else:
+            circles = chunk_circles(features)
+            circles[:, 0] -= left
+            circles[:, 1] -= top
+            #one list per column instead of a list per circle, thousands of small lists per chunk kept setting off full gc passes
+            for index, (x, y, r) in enumerate(zip(*(column.tolist() for column in circles.T)), 1):
+                pygame.draw.circle(surface, TERRAIN_COLOR, (x, y), r)
+                if index % slice_size == 0:
+                    yield
+        #RLE keeps the blit cheap since most of a chunk is empty
+        surface.set_colorkey(CHUNK_COLORKEY, pygame.RLEACCEL)
+
+        return (left, top), surface
+
+    def collide_rect(self, rect):
+        #true if a world space rect touches any terrain (circles or contour polygons) in the loaded grid
+        for chunk_key, chunk_rect in self.chunk_rects.items():
+            if not rect.colliderect(chunk_rect):
+                continue
+            if self.mode == "contour":
+                if loops_hit_rect(chunk_loops(self.chunk_grid[chunk_key]), rect):
+                    return True
+                continue
+            circles = chunk_circles(self.chunk_grid[chunk_key])
+            x, y, r = circles[:, 0], circles[:, 1], circles[:, 2]
+            #closest point of the rect to each circle center
+            dx = np.clip(x, rect.left, rect.right) - x
+            dy = np.clip(y, rect.top, rect.bottom) - y
+            if (dx * dx + dy * dy <= r * r).any():
+                return True
+        return False
+
+    def loops_in_rect(self, rect):
+        #contour mode polygons (world coords) of every loaded chunk that overlaps a world rect
+        loops = []
+        if self.mode != "contour":
+            return loops
+        for chunk_key, chunk_rect in self.chunk_rects.items():
+            if rect.colliderect(chunk_rect):
+                loops.extend(chunk_loops(self.chunk_grid[chunk_key]))
+        return loops
+
+    def occluders_in_rect(self, rect):
+        #(segments, circles) in world coords of the terrain overlapping a world rect, for shadow casting
+        #contour mode gives polygon edges, circle mode the circles (main and fringe) that reach into the rect
+        segments = [np.zeros((0, 4))]
+        circles = [np.zeros((0, 3))]
+        for chunk_key, chunk_rect in self.chunk_rects.items():
+            if not rect.colliderect(chunk_rect):
+                continue
+            occluders = self.chunk_occluders.get(chunk_key)
+            if occluders is None:
+                occluders = self.chunk_occluders[chunk_key] = self._chunk_occluders(self.chunk_grid[chunk_key])
+            chunk_segments, chunk_circles = occluders
+            if len(chunk_segments):
+                #edges are short next to the light radius, keeping the ones with an end in the rect is enough
+                x0, y0, x1, y1 = chunk_segments.T
+                near = (((x0 >= rect.left) & (x0 < rect.right) & (y0 >= rect.top) & (y0 < rect.bottom))
+                        | ((x1 >= rect.left) & (x1 < rect.right) & (y1 >= rect.top) & (y1 < rect.bottom)))
+                segments.append(chunk_segments[near])
+            if len(chunk_circles):
+                x, y, r = chunk_circles.T
+                near = (x + r > rect.left) & (x - r < rect.right) & (y + r > rect.top) & (y - r < rect.bottom)
+                circles.append(chunk_circles[near])
+        return np.concatenate(segments), np.concatenate(circles)
+
+    def _chunk_occluders(self, features):
+        if self.mode == "contour":
+            loops = chunk_loops(features)
+            segments = np.concatenate([loop_segments(points) for points in loops]) if loops else np.zeros((0, 4))
+            return segments, np.zeros((0, 3))
+        return np.zeros((0, 4)), chunk_circles(features).astype(np.float64)
+
+    def memory_report(self):
+        #per chunk feature counts and bytes, arrays vs the old dict-of-tuples layout
+        return {chunk_key: memory_report(features) for chunk_key, features in self.chunk_grid.items()}
 
     def draw(self, screen, offset):
- 
-        #draw all visible chunks on the screen, 2 make sure circles are partially rendered if partially on-screen cuz they were disapearing
-        #using pre-baked fringe circles w/ solid colors for terrain smoothing
-
-        screen_rect = pygame.Rect(0, 0, screen.get_width(), screen.get_height())
-
-        for chunk_key, features in self.chunk_grid.items():
-            for feature in features:
-                #draw main circ
-                main_x, main_y, main_radius = feature["main"]
-                screen_x = main_x - offset[0]
-                screen_y = main_y - offset[1]
-                circle_rect = pygame.Rect(
-                    screen_x - main_radius,
-                    screen_y - main_radius,
-                    main_radius * 2,
-                    main_radius * 2,
-                )
-
-                #main circ overlaps screen?
-                if screen_rect.colliderect(circle_rect):
-                    pygame.draw.circle(screen, (100, 80, 50), (screen_x, screen_y), main_radius)
-
-                    #dra pre-baked fringe circ
-                    for fringe_x, fringe_y, fringe_radius in feature["fringe"]:
-                        screen_fringe_x = fringe_x - offset[0]
-                        screen_fringe_y = fringe_y - offset[1]
-                        fringe_circle_rect = pygame.Rect(
-                            screen_fringe_x - fringe_radius,
-                            screen_fringe_y - fringe_radius,
-                            fringe_radius * 2,
-                            fringe_radius * 2,
-                        )
-                        if screen_rect.colliderect(fringe_circle_rect):
-                            #draw em on scrn
-                            pygame.draw.circle(screen, (100, 80, 50), (screen_fringe_x, screen_fringe_y), fringe_radius)
+
+        #one blit per baked chunk that overlaps the screen
+        #chunks on screen but outside its clip rect (the lit area, see DarknessCuller) are skipped and counted
+
+        screen_rect = screen.get_rect()
+        clip = screen.get_clip()
+        self.culled = 0
+
+        #pop-in metric, any chunk on screen that hasn't been generated yet
+        self.frames_drawn += 1
+        #(chunks still waiting to be baked count too)
+        waiting = list(self.missing_chunks) + list(self.unbaked) + ([self.baking[0]] if self.baking else [])
+        for chunk_x, chunk_y in waiting:
+            if screen_rect.colliderect((chunk_x - offset[0], chunk_y - offset[1], self.chunk_size, self.chunk_size)):
+                self.pop_in_frames += 1
+                break
+
+        for (left, top), surface in self.chunk_surfaces.values():
+            screen_pos = (left - offset[0], top - offset[1])
+            chunk_rect = pygame.Rect(screen_pos, surface.get_size())
+            if not screen_rect.colliderect(chunk_rect):
+                continue
+            if not clip.colliderect(chunk_rect):
+                self.culled += 1
+                continue
+            screen.blit(surface, screen_pos)
@@ -0,0 +1,253 @@
+import math
+import numpy as np
+
+#numpy ports of the noise lib functions, so whole sample grids can be evaluated in one go
+#everything is done in float32 in the same order as the C code so the results match snoise2 exactly
+
+_PERM = np.array([
+    151, 160, 137, 91, 90, 15, 131, 13, 201, 95, 96, 53, 194, 233, 7, 225, 140,
+    36, 103, 30, 69, 142, 8, 99, 37, 240, 21, 10, 23, 190, 6, 148, 247, 120,
+    234, 75, 0, 26, 197, 62, 94, 252, 219, 203, 117, 35, 11, 32, 57, 177, 33,
+    88, 237, 149, 56, 87, 174, 20, 125, 136, 171, 168, 68, 175, 74, 165, 71,
+    134, 139, 48, 27, 166, 77, 146, 158, 231, 83, 111, 229, 122, 60, 211, 133,
+    230, 220, 105, 92, 41, 55, 46, 245, 40, 244, 102, 143, 54, 65, 25, 63, 161,
+    1, 216, 80, 73, 209, 76, 132, 187, 208, 89, 18, 169, 200, 196, 135, 130,
+    116, 188, 159, 86, 164, 100, 109, 198, 173, 186, 3, 64, 52, 217, 226, 250,
+    124, 123, 5, 202, 38, 147, 118, 126, 255, 82, 85, 212, 207, 206, 59, 227,
+    47, 16, 58, 17, 182, 189, 28, 42, 223, 183, 170, 213, 119, 248, 152, 2, 44,
+    154, 163, 70, 221, 153, 101, 155, 167, 43, 172, 9, 129, 22, 39, 253, 19, 98,
+    108, 110, 79, 113, 224, 232, 178, 185, 112, 104, 218, 246, 97, 228, 251, 34,
+    242, 193, 238, 210, 144, 12, 191, 179, 162, 241, 81, 51, 145, 235, 249, 14,
+    239, 107, 49, 192, 214, 31, 181, 199, 106, 157, 184, 84, 204, 176, 115, 121,
+    50, 45, 127, 4, 150, 254, 138, 236, 205, 93, 222, 114, 67, 29, 24, 72, 243,
+    141, 128, 195, 78, 66, 215, 61, 156, 180,
+] * 2, dtype=np.intp)
+
+_GRAD3 = np.array([
+    (1, 1), (-1, 1), (1, -1), (-1, -1),
+    (1, 0), (-1, 0), (1, 0), (-1, 0),
+    (0, 1), (0, -1), (0, 1), (0, -1),
+], dtype=np.float32)
+#gradient components looked up straight from a perm value (folds the % 12 into the table)
+_GRAD_X = _GRAD3[_PERM % 12, 0]
+_GRAD_Y = _GRAD3[_PERM % 12, 1]
+
+_F2 = np.float32(0.3660254037844386)
+_G2 = np.float32(0.21132486540518713)
+_G2_TWICE = _G2 * np.float32(2.0)
+_ONE = np.float32(1.0)
+_HALF = np.float32(0.5)
+_ZERO = np.float32(0.0)
+_SEVENTY = np.float32(70.0)
+
+
+def _simplex2(x, y):
+    #single octave of 2d simplex noise, same steps as noise2() in _simplex.c
+    s = (x + y) * _F2
+    i = np.floor(x + s)
+    j = np.floor(y + s)
+    t = (i + j) * _G2
+
+    x0 = x - (i - t)
+    y0 = y - (j - t)
+
+    i1 = x0 > y0
+    j1 = ~i1
+    x1 = x0 - i1 + _G2
+    y1 = y0 - j1 + _G2
+    x2 = x0 + _G2_TWICE - _ONE
+    y2 = y0 + _G2_TWICE - _ONE
+
+    I = i.astype(np.intp) & 255
+    J = j.astype(np.intp) & 255
+    h0 = I + _PERM[J]
+    h1 = I + i1 + _PERM[J + j1]
+    h2 = I + 1 + _PERM[J + 1]
+
+    total = None
+    for xx, yy, h in ((x0, y0, h0), (x1, y1, h1), (x2, y2, h2)):
+        #corners with f <= 0 add nothing, clamping f to 0 gives the same sum
+        f = np.maximum(_HALF - xx * xx - yy * yy, _ZERO)
+        corner = f * f * f * f * (_GRAD_X[h] * xx + _GRAD_Y[h] * yy)
+        total = corner if total is None else total + corner
+
+    return total * _SEVENTY
+
+
+def snoise2_array(x, y, octaves=1, persistence=0.5, lacunarity=2.0, base=0.0):
+    #vectorized noise.snoise2 (untiled version), x and y can be any broadcastable arrays
+    x = np.asarray(x, dtype=np.float64).astype(np.float32)
+    y = np.asarray(y, dtype=np.float64).astype(np.float32)
+    x, y = np.broadcast_arrays(x, y)
+    z = np.float32(base)
+    persistence = np.float32(persistence)
+    lacunarity = np.float32(lacunarity)
+
+    #all octaves go through _simplex2 as one stacked array, then get summed in the same order as the C loop
+    freqs = [np.float32(1.0)]
+    amps = [np.float32(1.0)]
+    for _ in range(1, octaves):
+        freqs.append(freqs[-1] * lacunarity)
+        amps.append(amps[-1] * persistence)
+    freq = np.array(freqs, dtype=np.float32).reshape((octaves,) + (1,) * x.ndim)
+    #x * 1.0 is exact, so the first octave matches noise2(x + z, y + z)
+    layers = _simplex2(x * freq + z, y * freq + z)
+
+    max_amp = amps[0]
+    total = layers[0]
+    for octave in range(1, octaves):
+        max_amp = max_amp + amps[octave]
+        total = total + layers[octave] * amps[octave]
+
+    return (total / max_amp).astype(np.float64)
+
+
+#upper bound on |_simplex2|, it peaks just under 1.0 so this leaves some slack for rounding
+_OCTAVE_BOUND = 1.05
+
+
+def snoise2_above(x, y, threshold, octaves=1, persistence=0.5, lacunarity=2.0, base=0.0):
+    #bool mask of snoise2(x, y, ...) > threshold
+    #after each octave, points that can't reach the threshold even if every remaining octave
+    #peaks get dropped, so the higher octaves only run on the points that are still in play.
+    #survivors are summed in the same order as snoise2_array, so the mask is exact
+    x = np.asarray(x, dtype=np.float64).astype(np.float32)
+    y = np.asarray(y, dtype=np.float64).astype(np.float32)
+    x, y = np.broadcast_arrays(x, y)
+    shape = x.shape
+    x = x.ravel()
+    y = y.ravel()
+    z = np.float32(base)
+    persistence = np.float32(persistence)
+    lacunarity = np.float32(lacunarity)
+
+    freqs = [np.float32(1.0)]
+    amps = [np.float32(1.0)]
+    for _ in range(1, octaves):
+        freqs.append(freqs[-1] * lacunarity)
+        amps.append(amps[-1] * persistence)
+    max_amp = amps[0]
+    for amp in amps[1:]:
+        max_amp = max_amp + amp
+    needed = float(threshold) * float(max_amp)
+
+    live = np.arange(x.size)
+    total = None
+    for octave in range(octaves):
+        freq = freqs[octave]
+        layer = _simplex2(x[live] * freq + z, y[live] * freq + z)
+        total = layer if total is None else total + layer * amps[octave]
+
+        remaining = float(sum(float(amp) for amp in amps[octave + 1:])) * _OCTAVE_BOUND
+        if remaining:
+            keep = total.astype(np.float64) + remaining > needed
+            live = live[keep]
+            total = total[keep]
+
+    mask = np.zeros(x.size, dtype=bool)
+    mask[live] = (total / max_amp).astype(np.float64) > threshold
+    return mask.reshape(shape)
+
+
+_SIX = np.float32(6.0)
+_FIFTEEN = np.float32(15.0)
+_TEN = np.float32(10.0)
+_POINT_FOUR = np.float32(0.4)
+#grad1() multiplier per perm value: (hash & 7) + 1, or -1 when bit 3 is set
+_GRAD1 = np.where(_PERM & 8, -1.0, (_PERM & 7) + 1.0).astype(np.float32)
+
+
+def _perlin1(x, repeat, base):
+    #single octave of 1d perlin noise, same steps as noise1() in _perlin.c
+    floor = np.floor(x)
+    #C's % truncates toward zero, np.fmod does the same
+    i = np.fmod(floor.astype(np.int64), repeat)
+    ii = np.fmod(i + 1, repeat)
+    i = (i & 255) + base
+    ii = (ii & 255) + base
+
+    x = x - floor
+    fx = x * x * x * (x * (x * _SIX - _FIFTEEN) + _TEN)
+
+    a = _GRAD1[i] * x
+    b = _GRAD1[ii] * (x - _ONE)
+    return (a + fx * (b - a)) * _POINT_FOUR
+
+
+def pnoise1_array(x, octaves=1, persistence=0.5, lacunarity=2.0, repeat=1024, base=0):
+    #vectorized noise.pnoise1, matches it exactly (float32 all the way, same order as the C loop)
+    x = np.asarray(x, dtype=np.float64).astype(np.float32)
+    base = int(base)
+    if octaves == 1:
+        return _perlin1(x, repeat, base).astype(np.float64)
+
+    persistence = np.float32(persistence)
+    lacunarity = np.float32(lacunarity)
+    freq = np.float32(1.0)
+    amp = np.float32(1.0)
+    max_amp = np.float32(0.0)
+    total = np.zeros(x.shape, dtype=np.float32)
+    for _ in range(octaves):
+        #(int)(repeat * freq), the product is a float in C
+        total = total + _perlin1(x * freq, int(np.float32(repeat) * freq), base) * amp
+        max_amp = max_amp + amp
+        freq = freq * lacunarity
+        amp = amp * persistence
+    return (total / max_amp).astype(np.float64)
+
+
+# ===Position Hashing===
+#counter based rng, a value only depends on (seed, x, y, stream) so the scalar and batched
+#generators can pull the same "random" numbers in any order
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix64(z):
+    #splitmix64 finalizer on a python int
+    z = (z + 0x9E3779B97F4A7C15) & _MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return z ^ (z >> 31)
+
+
+def _mix64_array(z):
+    #same as _mix64 on uint64 arrays (wraps instead of masking)
+    z = z + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def position_hash(seed, x, y):
+    #64 bit key for one integer world position
+    h = _mix64(seed & _MASK64)
+    h = _mix64(h ^ (x & _MASK64))
+    return _mix64(h ^ (y & _MASK64))
+
+
+def position_hash_array(seed, x, y):
+    #position_hash over broadcastable int arrays
+    with np.errstate(over="ignore"):
+        h = _mix64_array(np.uint64(seed & _MASK64))
+        h = _mix64_array(h ^ np.asarray(x, dtype=np.int64).astype(np.uint64))
+        return _mix64_array(h ^ np.asarray(y, dtype=np.int64).astype(np.uint64))
+
+
+def hash_uniform(key, stream):
+    #float in [0, 1) for stream n of a position key
+    h = _mix64(key ^ (stream & _MASK64))
+    return (h >> 11) * (1.0 / (1 << 53))
+
+
+def hash_uniform_array(key, stream):
+    #hash_uniform over broadcastable uint64 keys / int streams
+    with np.errstate(over="ignore"):
+        h = _mix64_array(np.asarray(key, dtype=np.uint64) ^ np.asarray(stream, dtype=np.int64).astype(np.uint64))
+    return (h >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))
+
+
+#unit offsets for the fringe circles, every 30 degrees
+FRINGE_ANGLES = tuple(range(0, 360, 30))
+FRINGE_COS = tuple(math.cos(math.radians(angle)) for angle in FRINGE_ANGLES)
+FRINGE_SIN = tuple(math.sin(math.radians(angle)) for angle in FRINGE_ANGLES)
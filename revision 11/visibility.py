@@ -0,0 +1,361 @@
+# visibility.py
+#shadow casting for the sub's spotlight: which part of the light's circle the light actually reaches
+#
+#occluders are line segments (object rects, contour terrain, the seabed outline) and circles (circle terrain),
+#all in world coords. the visibility polygon is built by sorting the angles where something starts or stops
+#blocking the light (segment ends, circle tangents, plus a ring of rays for the light's rim) and casting
+#one ray per angle against the occluders whose arc it falls in, the closest hit per ray is a polygon vertex
+
+import math
+import time
+
+import numpy as np
+import pygame
+
+from geometry import polyline_segments
+
+TAU = 2 * math.pi
+#rays spread round the rim so the polygon still follows the light's circle between occluders
+RIM_RAYS = 64
+#angle bins of the depth buffer visibility_polygon drops hidden occluders with
+DEPTH_BINS = 256
+#angle nudged either side of every occluder end / tangent so rays slip past corners
+ANGLE_EPSILON = 1e-4
+#vertices closer than this to the one before get merged into it, and ones closer than COLLINEAR_TOLERANCE
+#to the line through their neighbours get dropped (rays landing on the same edge)
+MERGE_DISTANCE = 0.5
+COLLINEAR_TOLERANCE = 0.01
+#ms per frame the shadows may take in all (gathering occluders, casting, masking the light with the polygon)
+#before occluders get merged into coarser ones, the plain spotlight is used when even the coarsest won't fit
+SHADOW_BUDGET_MS = 4.0
+#merge cell sizes (px) tried, finest first. every doubling leaves roughly a quarter of the occluders
+MIN_MERGE_CELL = 8
+MAX_MERGE_CELL = 128
+#ms visibility_polygon takes per occluder, a starting guess until the first polygon gets timed,
+#on top of what it takes whatever the size (numpy call overhead)
+OCCLUDER_COST_MS = 5e-4
+CAST_OVERHEAD_MS = 0.5
+
+
+def rect_segments(rect):
+    #the 4 edges of a pygame rect as (4, 4) x0, y0, x1, y1 rows
+    left, top, right, bottom = rect.left, rect.top, rect.right, rect.bottom
+    return np.array([
+        (left, top, right, top),
+        (right, top, right, bottom),
+        (right, bottom, left, bottom),
+        (left, bottom, left, top),
+    ], dtype=np.float64)
+
+
+def merge_occluders(segments, circles, cell):
+
+    #coarser stand-ins for dense occluders, the shadows keep their shape but get blockier as cell grows
+    #circles whose centers share a cell x cell square become one circle round their centroid that covers all of them
+    #(at most out to the square's corners), segment ends snap to the cell grid and segments that collapse go
+
+    if len(circles):
+        keys = np.floor(circles[:, :2] / cell).astype(np.int64)
+        _, group, counts = np.unique(keys[:, 0] * 1_000_003 + keys[:, 1], return_inverse=True, return_counts=True)
+        cx = np.bincount(group, circles[:, 0]) / counts
+        cy = np.bincount(group, circles[:, 1]) / counts
+        reach = np.hypot(circles[:, 0] - cx[group], circles[:, 1] - cy[group]) + circles[:, 2]
+        cr = np.zeros(len(counts))
+        np.maximum.at(cr, group, reach)
+        circles = np.stack((cx, cy, np.minimum(cr, cell * 0.75)), axis=-1)
+    if len(segments):
+        segments = np.round(segments / cell) * cell
+        segments = segments[(segments[:, 0] != segments[:, 2]) | (segments[:, 1] != segments[:, 3])]
+    return segments, circles
+
+
+def _runs(first, stop):
+    #(owner, index) pairs for every index in the half open runs [first, stop), one run per owner
+    counts = stop - first
+    owner = np.repeat(np.arange(len(first)), counts)
+    index = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(first, counts)
+    return owner, index
+
+
+def visibility_polygon(light, radius, segments, circles):
+
+    #(k, 2) world points of the area lit by a point light of the given radius
+    #segments: (s, 4) x0, y0, x1, y1, circles: (c, 3) x, y, r. circles the light is inside of are skipped
+    #
+    #angular sweep: every occluder blocks one arc of angles (between a segment's ends, between a circle's
+    #tangents), and the rays sorted by angle turn each arc into one run of rays (searchsorted), so a ray is only
+    #tested against the occluders active over it instead of all of them. occluders that are hidden all along
+    #their arc get dropped first with a coarse depth buffer over DEPTH_BINS angle bins: in a bin an occluder
+    #covers completely, no ray gets further than the occluder's far end, anything starting past that in every
+    #bin it touches can't be seen. in dense terrain that leaves a few percent of the occluders
+
+    lx, ly = light
+    segments = np.asarray(segments, dtype=np.float64).reshape(-1, 4)
+    circles = np.asarray(circles, dtype=np.float64).reshape(-1, 3)
+
+    #circles around the light would block every ray
+    cx = circles[:, 0] - lx
+    cy = circles[:, 1] - ly
+    distance = np.hypot(cx, cy)
+    outside = distance > circles[:, 2]
+    cx, cy, cr, distance = cx[outside], cy[outside], circles[outside, 2], distance[outside]
+
+    #arc (start angle, width) and the nearest / furthest a ray inside the arc can hit it, segments then circles
+    px, py = segments[:, 0] - lx, segments[:, 1] - ly
+    ex, ey = segments[:, 2] - segments[:, 0], segments[:, 3] - segments[:, 1]
+    first = np.arctan2(py, px)
+    width = np.mod(np.arctan2(py + ey, px + ex) - first + math.pi, TAU) - math.pi
+    length_sq = ex * ex + ey * ey
+    with np.errstate(divide="ignore", invalid="ignore"):
+        along = np.clip(np.where(length_sq > 0, -(px * ex + py * ey) / length_sq, 0.0), 0.0, 1.0)
+    spread = np.arcsin(np.minimum(cr / distance, 1.0))
+    starts = np.concatenate((np.where(width < 0, first + width, first), np.arctan2(cy, cx) - spread))
+    widths = np.concatenate((np.abs(width), 2 * spread))
+    near = np.concatenate((np.hypot(px + along * ex, py + along * ey), distance - cr))
+    far = np.concatenate((np.maximum(np.hypot(px, py), np.hypot(px + ex, py + ey)), np.sqrt(distance ** 2 - cr ** 2)))
+    starts = np.mod(starts + math.pi, TAU) - math.pi
+
+    #depth buffer: per bin the furthest any ray in it can get, then what can show in front of that somewhere.
+    #bins only count as covered a hair inside the arc, a ray on the very edge can slip past it
+    bin_start = (starts + math.pi) * (DEPTH_BINS / TAU)
+    bin_stop = bin_start + widths * (DEPTH_BINS / TAU)
+    margin = ANGLE_EPSILON * DEPTH_BINS / TAU
+    covered_first = np.ceil(bin_start + margin).astype(np.int64)
+    covered_stop = np.floor(bin_stop - margin).astype(np.int64)
+    covers = covered_stop > covered_first
+    owner, index = _runs(covered_first[covers], covered_stop[covers])
+    depth = np.full(DEPTH_BINS, float(radius))
+    np.minimum.at(depth, index % DEPTH_BINS, far[covers][owner])
+    owner, index = _runs(np.floor(bin_start).astype(np.int64), np.floor(bin_stop).astype(np.int64) + 1)
+    seen = np.zeros(len(starts), dtype=bool)
+    seen[owner[near[owner] < depth[index % DEPTH_BINS]]] = True
+    count = len(segments)
+    seen_segments = segments[seen[:count]]
+    cx, cy, cr = cx[seen[count:]], cy[seen[count:]], cr[seen[count:]]
+    starts, widths, near = starts[seen], widths[seen], near[seen]
+
+    #angles where the closest occluder can change, the arc ends nudged either way to slip past corners
+    corners = np.concatenate((starts, starts + widths))
+    angles = np.concatenate((
+        np.linspace(-math.pi, math.pi, RIM_RAYS, endpoint=False),
+        corners, corners - ANGLE_EPSILON, corners + ANGLE_EPSILON,
+    ))
+    angles = np.sort(np.mod(angles + math.pi, TAU) - math.pi)
+    #each arc's run of rays, arcs past +pi carry on from the first ray. the run takes in the rays right on the
+    #arc's ends whichever way they rounded
+    wrapped = np.concatenate((angles, angles + TAU))
+    run_start = starts - ANGLE_EPSILON / 2
+    run_start[run_start < -math.pi] += TAU
+    owner, ray = _runs(np.searchsorted(wrapped, run_start), np.searchsorted(wrapped, run_start + widths + ANGLE_EPSILON))
+    ray %= len(angles)
+    ray_bin = ((angles + math.pi) * (DEPTH_BINS / TAU)).astype(np.int64) % DEPTH_BINS
+    active = near[owner] < depth[ray_bin[ray]]
+    owner, ray = owner[active], ray[active]
+
+    dx = np.cos(angles)
+    dy = np.sin(angles)
+    reach = np.full(len(angles), float(radius))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pick = owner < len(seen_segments)
+        if pick.any():
+            #ray light + t * d against segment p + u * e, t and u by cramer's rule
+            hit_segments = seen_segments[owner[pick]]
+            rays = ray[pick]
+            ray_x, ray_y = dx[rays], dy[rays]
+            px, py = hit_segments[:, 0] - lx, hit_segments[:, 1] - ly
+            ex, ey = hit_segments[:, 2] - hit_segments[:, 0], hit_segments[:, 3] - hit_segments[:, 1]
+            denom = ray_x * ey - ray_y * ex
+            t = (px * ey - py * ex) / denom
+            u = (px * ray_y - py * ray_x) / denom
+            hit = (denom != 0) & (t > 0) & (u >= 0) & (u <= 1)
+            np.minimum.at(reach, rays[hit], t[hit])
+
+        pick = ~pick
+        if pick.any():
+            #nearest of the two crossings with each circle in front of the light
+            hit_circles = owner[pick] - len(seen_segments)
+            rays = ray[pick]
+            x, y, r = cx[hit_circles], cy[hit_circles], cr[hit_circles]
+            along = dx[rays] * x + dy[rays] * y
+            inside_sq = r * r - (x * x + y * y - along * along)
+            t = along - np.sqrt(inside_sq)
+            hit = (inside_sq >= 0) & (along > 0) & (t > 0)
+            np.minimum.at(reach, rays[hit], t[hit])
+
+    polygon = np.stack((lx + dx * reach, ly + dy * reach), axis=-1)
+
+    #most rays end on the same edge as their neighbours, pygame's polygon fill costs rows * vertices so they go.
+    #the rays nudged round a corner land right next to it, those get merged first so the corner itself survives
+    step = polygon - np.roll(polygon, 1, axis=0)
+    polygon = polygon[np.hypot(step[:, 0], step[:, 1]) > MERGE_DISTANCE]
+    before = np.roll(polygon, 1, axis=0)
+    chord = np.roll(polygon, -1, axis=0) - before
+    offset = polygon - before
+    cross = np.abs(chord[:, 0] * offset[:, 1] - chord[:, 1] * offset[:, 0])
+    return polygon[cross > COLLINEAR_TOLERANCE * np.hypot(chord[:, 0], chord[:, 1])]
+
+
+class OccluderGrid:
+
+    #uniform bucket grid of world rects (static things like UnderwaterObjects), so only rects near the light get cast against
+
+    def __init__(self, cell_size=256):
+        self.cell_size = cell_size
+        self.cells = {}
+
+    def _cells(self, rect):
+        size = self.cell_size
+        for cell_x in range(rect.left // size, (rect.right - 1) // size + 1):
+            for cell_y in range(rect.top // size, (rect.bottom - 1) // size + 1):
+                yield cell_x, cell_y
+
+    def insert(self, rect, item):
+        for cell in self._cells(rect):
+            self.cells.setdefault(cell, []).append((pygame.Rect(rect), item))
+
+    def query(self, rect):
+        #items whose rect overlaps a world rect, each once
+        found = {}
+        for cell in self._cells(rect):
+            for item_rect, item in self.cells.get(cell, ()):
+                if item_rect.colliderect(rect):
+                    found[id(item)] = (item_rect, item)
+        return list(found.values())
+
+
+class ShadowCaster:
+
+    #visibility polygon for the spotlight each frame, kept inside a time budget covering the whole shadow update
+    #the polygon costs about occluder_cost per occluder (the sweep is n log n, mostly sorting and numpy passes),
+    #so once gathering and last frame's mask are paid for that says how many occluders are affordable.
+    #too many and they get merged (merge_occluders) at coarser and coarser cells, past MAX_MERGE_CELL the frame
+    #falls back to the plain spotlight.
+    #every frame starts at the cell the last one settled on, and tries one finer if it was well under
+
+    def __init__(self, budget_ms=SHADOW_BUDGET_MS):
+        self.budget_ms = budget_ms
+        #merge cell the next frame starts at, 0 while the occluders fit without merging
+        self.cell = 0
+        self.occluder_cost = OCCLUDER_COST_MS
+        #ms the light draw spent masking with the polygon last frame, see record_mask
+        self.mask_ms = 0.0
+        #last frame, for the debug menu
+        self.last_ms = 0.0
+        self.used = 0
+        self.available = 0
+        self.merge_cell = 0
+        self.fallback = False
+
+    def update(self, light, radius, object_grid=None, terrain=None, seabed=None):
+        #gather + cast under one clock, what the game calls each frame
+        start = time.perf_counter()
+        segments, circles = self.gather(light, radius, object_grid, terrain, seabed)
+        return self.cast(light, radius, segments, circles, start)
+
+    def record_mask(self, ms):
+        #time the light draw spent masking, counted against the next frame's budget.
+        #smoothed, and frames that didn't mask keep the last figure, or a fallback frame would make room
+        #for a cast the next frame can't afford and the shadows would flicker on and off
+        if ms > 0:
+            self.mask_ms += (ms - self.mask_ms) * 0.5
+
+    def affordable(self, spare_ms):
+        #most occluders a polygon can be cast against in spare_ms
+        spare_ms -= CAST_OVERHEAD_MS
+        if spare_ms <= 0:
+            return 0
+        return int(spare_ms / self.occluder_cost)
+
+    def gather(self, light, radius, object_grid=None, terrain=None, seabed=None):
+        #(segments, circles) of everything that can block the light, from each source's own spatial lookup
+        light_rect = pygame.Rect(int(light[0] - radius), int(light[1] - radius), int(2 * radius), int(2 * radius))
+        segments = []
+        circles = []
+        if object_grid is not None:
+            for rect, _ in object_grid.query(light_rect):
+                segments.append(rect_segments(rect))
+        if terrain is not None:
+            terrain_segments, terrain_circles = terrain.occluders_in_rect(light_rect)
+            segments.append(terrain_segments)
+            circles.append(terrain_circles)
+        if seabed is not None:
+            outline = seabed.outline_points(light_rect.left, light_rect.right)
+            #only worth casting against once the floor is inside the light
+            if len(outline) > 1 and outline[:, 1].min() < light_rect.bottom:
+                segments.append(polyline_segments(outline))
+        segments = np.concatenate(segments) if segments else np.zeros((0, 4))
+        circles = np.concatenate(circles) if circles else np.zeros((0, 3))
+        return segments, circles
+
+    def cast(self, light, radius, segments, circles, start=None):
+        #visibility polygon in world coords, None when nothing is in the way (the plain spotlight is right then),
+        #when the light is buried so deep the polygon collapses under 3 vertices (nothing sensible to mask with)
+        #or when it can't be made inside the budget. start is when the frame's shadow work began
+        start = time.perf_counter() if start is None else start
+        lx, ly = light
+        segments = np.asarray(segments, dtype=np.float64).reshape(-1, 4)
+        circles = np.asarray(circles, dtype=np.float64).reshape(-1, 3)
+
+        #distance from the light to the closest point of each occluder, anything past the radius can't block it
+        px, py = segments[:, 0] - lx, segments[:, 1] - ly
+        ex, ey = segments[:, 2] - segments[:, 0], segments[:, 3] - segments[:, 1]
+        length_sq = ex * ex + ey * ey
+        with np.errstate(divide="ignore", invalid="ignore"):
+            along = np.clip(np.where(length_sq > 0, -(px * ex + py * ey) / length_sq, 0.0), 0.0, 1.0)
+        segment_distance = np.hypot(px + along * ex, py + along * ey)
+        circle_distance = np.hypot(circles[:, 0] - lx, circles[:, 1] - ly) - circles[:, 2]
+        distance = np.concatenate((segment_distance, circle_distance))
+        near = np.flatnonzero(distance < radius)
+        self.available = len(near)
+        self.used = 0
+        self.fallback = False
+
+        if not len(near):
+            self.last_ms = (time.perf_counter() - start) * 1000 + self.mask_ms
+            return None
+
+        kept_segments = segments[near[near < len(segments)]]
+        kept_circles = circles[near[near >= len(segments)] - len(segments)]
+        allowed = self.affordable(self.budget_ms - self.mask_ms - (time.perf_counter() - start) * 1000)
+        count = len(near)
+        cell = 0 if count <= allowed else max(MIN_MERGE_CELL, self.cell)
+        if cell and allowed:
+            kept_segments, kept_circles = merge_occluders(kept_segments, kept_circles, cell)
+            count = len(kept_segments) + len(kept_circles)
+            while count > allowed and cell < MAX_MERGE_CELL:
+                #jump straight to the cell that should fit (a quarter of the occluders per doubling)
+                cell = min(MAX_MERGE_CELL, cell * 2 ** max(1, math.ceil(math.log(count / allowed, 4))))
+                kept_segments, kept_circles = merge_occluders(kept_segments, kept_circles, cell)
+                count = len(kept_segments) + len(kept_circles)
+        self.merge_cell = cell
+        if count > allowed:
+            #even the coarsest merge won't fit, the plain spotlight this frame. the mask estimate eases off
+            #meanwhile so one slow mask can't keep the shadows off for good
+            self.cell = MAX_MERGE_CELL
+            self.fallback = True
+            self.mask_ms *= 0.9
+            self.last_ms = (time.perf_counter() - start) * 1000 + self.mask_ms
+            return None
+
+        self.used = count
+        cast_start = time.perf_counter()
+        polygon = visibility_polygon(light, radius, kept_segments, kept_circles)
+        cast_ms = (time.perf_counter() - cast_start) * 1000
+        if count:
+            #smoothed, one slow frame shouldn't throw the next ones way off
+            per_occluder = max(0.0, cast_ms - CAST_OVERHEAD_MS) / count
+            self.occluder_cost += (max(per_occluder, OCCLUDER_COST_MS / 10) - self.occluder_cost) * 0.25
+        #a finer cell has about 4x the occluders, worth a try next frame if that would still fit
+        self.cell = cell // 2 if cell > MIN_MERGE_CELL and 4 * count <= allowed else cell
+
+        self.last_ms = (time.perf_counter() - start) * 1000 + self.mask_ms
+        if len(polygon) < 3:
+            return None
+        return polygon
+
+    def summary(self):
+        if self.fallback:
+            return f"over budget, plain spotlight ({self.available} occluders), {self.last_ms:.2f} ms"
+        merge = f"merged at {self.merge_cell}px" if self.merge_cell else "exact"
+        return f"{self.used}/{self.available} occluders ({merge}), {self.last_ms:.2f} ms"